@@ -1,13 +1,23 @@
 import os
+import sys
 import json
-import requests
 import zipfile
 import shutil
 import logging
+import time
 from datetime import date
 from google.cloud import pubsub_v1
 import pandas as pd
-import concurrent. futures
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.fetcher import VehicleFetcher, BREADCRUMB_URL
+from pipeline.metrics import start_exporter
+from pipeline.archive import ParquetArchiveWriter, ZipArchiveWriter
+from pipeline.codec import default_codec
+from pipeline.envelope import RecordBatcher, encode_record
+from pipeline.publishing import FlowControlledPublisher
+from pipeline.watermark import WatermarkStore, breadcrumb_key
 
 # === LOAD SERVICE ACCOUNT KEY ===
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -20,6 +30,44 @@ output_folder = "bus_data"
 processed_data_folder = "processed_data"
 extract_folder = os.path.join("extracted_json", today_str)
 
+# concurrent breadcrumb downloads sharing one keep-alive session
+MAX_WORKERS = 16
+REQUEST_TIMEOUT = (5, 60)
+REQUEST_RETRIES = 3
+
+# publish records straight from the HTTP responses; the archive is
+# written alongside as an optional side output instead of being re-read
+STREAM_MODE = True
+WRITE_ARCHIVE = True
+# "parquet": typed breadcrumbs under ARCHIVE_ROOT, partitioned by service
+# date and vehicle (read back with pipeline.archive.BreadcrumbArchive);
+# "zip": the raw JSON responses in processed_data/bus_data_<date>.zip
+ARCHIVE_FORMAT = "parquet"
+ARCHIVE_ROOT = os.path.join(processed_data_folder, "breadcrumbs")
+
+# opt-in multi-record messages: pack up to BATCH_SIZE records of one vehicle
+# into each Pub/Sub message (0 keeps the one-record-per-message format)
+BATCH_SIZE = 0
+BATCH_LINGER = 0.05  # seconds a partial batch may wait
+BATCH_COMPRESSION = None  # None, "gzip" or "zlib"
+
+# cap on unacknowledged publishes; publishing blocks while the cap is reached
+MAX_INFLIGHT_MESSAGES = 1000
+MAX_INFLIGHT_BYTES = 10 * 1024 * 1024
+PUBLISH_RETRIES = 5
+STATS_INTERVAL = 30  # seconds between publish rate / latency log lines
+
+# per-vehicle ETag / payload hash / OPD_DATE+ACT_TIME watermark kept between
+# runs: unchanged vehicles are skipped and only newer records are published
+# (None disables it and republishes everything)
+WATERMARK_PATH = os.path.join(processed_data_folder, "gather_state.sqlite")
+
+# counters and timings: a Prometheus endpoint on METRICS_PORT (None = off)
+# and a JSON snapshot rewritten every METRICS_INTERVAL seconds (None = off)
+METRICS_PORT = None
+METRICS_FILE = os.path.join("metrics", "data_gather.json")
+METRICS_INTERVAL = 30
+
 project_id = "dataengineeringproject-456307"
 topic_id = "MyTopic1"
 
@@ -31,37 +79,133 @@ topic_path = publisher.topic_path(project_id, topic_id)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s:%(message)s")
 logger = logging.getLogger(__name__)
 
-def gather_bus_data():
-    os.makedirs(output_folder, exist_ok=True)
+def read_vehicle_ids():
     vehicle_ids_path = os.path.join(script_dir, "vehicle_ids.csv")
-
     try:
         df = pd.read_csv(vehicle_ids_path, header=None)
-        vehicle_ids = df[0].astype(str).str.strip().tolist()
+        return df[0].astype(str).str.strip().tolist()
     except Exception as e:
         logger.error(f"Failed to read vehicle_ids.csv: {e}")
+        return None
+
+def open_watermarks():
+    if not WATERMARK_PATH:
+        return None
+    return WatermarkStore("breadcrumb", WATERMARK_PATH)
+
+def finish_watermarks(watermarks, publish_stats, completed=True):
+    """Advance the watermarks only once every publish of the run was acked.
+
+    A run that stopped early (``completed=False``) may have staged vehicles
+    it never published, so its state is discarded too. The caller that
+    opened the store closes it.
+    """
+    if watermarks is None:
+        return
+    if publish_stats["failed"] or not completed:
+        watermarks.discard()
+    else:
+        watermarks.commit()
+    logger.info(f"[watermark] {watermarks.summary()}")
+
+def iter_vehicle_payloads(vehicle_ids, watermarks=None):
+    """Yield (vehicle_id, raw_text, records) for every vehicle that returned data.
+
+    With a WatermarkStore, unchanged vehicles are skipped and only records
+    above each vehicle's watermark are yielded; the new state is staged for
+    ``watermarks.commit()``.
+    """
+    fetcher = VehicleFetcher(BREADCRUMB_URL, max_workers=MAX_WORKERS,
+                             timeout=REQUEST_TIMEOUT, retries=REQUEST_RETRIES)
+    headers_for = watermarks.request_headers if watermarks is not None else None
+    with fetcher:
+        for result in fetcher.iter_results(vehicle_ids, headers_for):
+            vid = result.vehicle_id
+            if result.error is not None:
+                logger.error(f"Error gathering data for vehicle {vid}: {result.error}")
+                continue
+            if watermarks is not None and watermarks.unchanged(vid, result.status_code, result.text):
+                continue
+            if result.status_code != 200:
+                logger.debug(f"Non-200 for {vid}: {result.status_code}")
+                continue
+            try:
+                records = default_codec().decode(result.text)
+            except Exception as e:
+                logger.error(f"Error gathering data for vehicle {vid}: {e}")
+                continue
+            if watermarks is not None:
+                total = len(records)
+                records, high = watermarks.filter_new(vid, records, breadcrumb_key)
+                watermarks.stage(vid, result.text, result.headers, high)
+                if not records:
+                    continue
+                if len(records) < total:
+                    # only the new tail is passed on
+                    yield vid, json.dumps(records), records
+                    continue
+            yield vid, result.text, records
+
+def open_archive(watermarks=None):
+    if not WRITE_ARCHIVE:
+        return None
+    if ARCHIVE_FORMAT == "parquet":
+        # a rerun with watermarks only carries what is new, so it adds its
+        # own part files instead of replacing the earlier run's
+        tag = today_str if watermarks is None else today_str + time.strftime("-%H%M%S")
+        return ParquetArchiveWriter(ARCHIVE_ROOT, tag)
+    return ZipArchiveWriter(zip_archive_path(watermarks))
+
+def zip_archive_path(watermarks=None):
+    zip_path = os.path.join(processed_data_folder, f"bus_data_{today_str}.zip")
+    if watermarks is not None and os.path.exists(zip_path):
+        # a rerun only carries what is new, so keep the earlier archive
+        zip_path = zip_path[:-4] + time.strftime("-%H%M%S") + ".zip"
+    return zip_path
+
+def archive_payload(archive, vid, text, records):
+    if isinstance(archive, ParquetArchiveWriter):
+        archive.add(vid, records)
+    else:
+        archive.add(f"bus_{vid}_{today_str}.json", text)
+
+def gather_bus_data(watermarks=None, zip_path=None):
+    """Stage each vehicle's payload as JSON in output_folder for publish_data.
+
+    With the zip format the staged files are zipped to ``zip_path`` (by
+    default ``zip_archive_path(watermarks)``) and removed; run() publishes
+    from the unzipped copy. With Parquet they are archived as they arrive
+    and left in place to be published.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    vehicle_ids = read_vehicle_ids()
+    if vehicle_ids is None:
         return 0
 
+    archive = open_archive(watermarks) if ARCHIVE_FORMAT == "parquet" else None
     total_records = 0
-    for vid in vehicle_ids:
-        try:
-            url = f"https://busdata.cs.pdx.edu/api/getBreadCrumbs?vehicle_id={vid}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                data = response.json()
-                total_records += len(data)
+    try:
+        for vid, text, records in iter_vehicle_payloads(vehicle_ids, watermarks):
+            try:
+                total_records += len(records)
                 file_path = os.path.join(output_folder, f"bus_{vid}_{today_str}.json")
                 with open(file_path, "w") as out:
-                    out.write(response.text)
-            else:
-                logger.debug(f"Non-200 for {vid}: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error gathering data for vehicle {vid}: {e}")
+                    out.write(text)
+                if archive is not None:
+                    archive_payload(archive, vid, text, records)
+            except Exception as e:
+                logger.error(f"Error gathering data for vehicle {vid}: {e}")
+    finally:
+        if archive is not None:
+            archive.close()
+
+    if ARCHIVE_FORMAT == "parquet":
+        return total_records
 
     os.makedirs(processed_data_folder, exist_ok=True)
-    zip_base = os.path.join(processed_data_folder, f"bus_data_{today_str}")
+    zip_path = zip_path or zip_archive_path(watermarks)
     try:
-        shutil.make_archive(zip_base, 'zip', output_folder)
+        shutil.make_archive(zip_path[:-len(".zip")], 'zip', output_folder)
     except Exception as e:
         logger.error(f"Error creating zip archive: {e}")
 
@@ -79,16 +223,40 @@ def unzip_data(zip_path, extract_to):
     except Exception as e:
         logger.error(f"Error unzipping {zip_path} to {extract_to}: {e}")
 
-def futures_callback(future):
-    try:
-        # will raise if publish failed
-        message_id = future.result()
-    except Exception as e:
-        logger.error(f"[publish] failed: {e}")
+def make_flow():
+    return FlowControlledPublisher(
+        publisher, topic_path,
+        max_messages=MAX_INFLIGHT_MESSAGES, max_bytes=MAX_INFLIGHT_BYTES,
+        max_retries=PUBLISH_RETRIES, report_interval=STATS_INTERVAL
+    )
+
+def make_batcher(flow):
+    if not BATCH_SIZE:
+        return None
+    return RecordBatcher(flow.publish, batch_size=BATCH_SIZE, linger=BATCH_LINGER,
+                         compression=BATCH_COMPRESSION)
+
+def publish_records(records, flow, batcher=None, key=None):
+    if batcher is not None:
+        batcher.add_many(records, key)
+        batcher.flush(key)
+        return len(records)
+
+    # schedule each record for publish
+    count = 0
+    for record in records:
+        count += 1
+        data = encode_record(record)
+        try:
+            flow.publish(data)
+        except Exception as e:
+            logger.error(f"Error publishing record {record.get('vehicle_id', '')}: {e}")
+    return count
 
-def publish_data(folder):
+def publish_data(folder, watermarks=None):
     count = 0
-    futures_list = []
+    flow = make_flow()
+    batcher = make_batcher(flow)
 
     for filename in os.listdir(folder):
         if not filename.endswith(".json"):
@@ -101,16 +269,7 @@ def publish_data(folder):
             logger.error(f"Error reading JSON {file_path}: {e}")
             continue
 
-        # schedule each record for publish
-        for record in records:
-            count += 1
-            data = json.dumps(record).encode("utf-8")
-            try:
-                future = publisher.publish(topic_path, data)
-                future.add_done_callback(futures_callback)
-                futures_list.append(future)
-            except Exception as e:
-                logger.error(f"Error publishing record {record.get('vehicle_id', '')}: {e}")
+        count += publish_records(records, flow, batcher, key=filename)
 
         # remove the file once its records are scheduled
         try:
@@ -118,27 +277,96 @@ def publish_data(folder):
         except Exception as e:
             logger.error(f"Error removing processed file {file_path}: {e}")
 
-    # wait for all publishes to finish, using continue instead of pass
-    for future in concurrent.futures.as_completed(futures_list):
-        continue
+    if batcher is not None:
+        batcher.close()
+
+    # wait for the in-flight publishes and any retries to finish
+    finish_watermarks(watermarks, flow.close())
 
     return count
 
+def stream_bus_data():
+    """Publish each vehicle's records as soon as its response arrives.
+
+    Nothing is staged on disk: when WRITE_ARCHIVE is set the responses
+    are archived by a background writer while publishing carries on.
+    """
+    vehicle_ids = read_vehicle_ids()
+    if vehicle_ids is None:
+        return 0, 0
+    watermarks = open_watermarks()
+    archive = open_archive(watermarks)
+
+    gathered = 0
+    published = 0
+    completed = False
+    flow = make_flow()
+    batcher = make_batcher(flow)
+    try:
+        for vid, text, records in iter_vehicle_payloads(vehicle_ids, watermarks):
+            gathered += len(records)
+            if archive is not None:
+                archive_payload(archive, vid, text, records)
+            published += publish_records(records, flow, batcher, key=vid)
+        completed = True
+    finally:
+        try:
+            if batcher is not None:
+                batcher.close()
+            if archive is not None:
+                archive.close()
+            # wait for the in-flight publishes and any retries to finish
+            finish_watermarks(watermarks, flow.close(), completed)
+        finally:
+            if watermarks is not None:
+                watermarks.close()
+
+    return gathered, published
+
 def main():
-    gathered = gather_bus_data()
-    print(f"Total breadcrumbs saved: {gathered}")
+    exporter = start_exporter(METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
+    try:
+        run()
+    finally:
+        exporter.close()
 
-    zip_path = os.path.join(processed_data_folder, f"bus_data_{today_str}.zip")
-    if os.path.exists(zip_path):
-        os.makedirs(extract_folder, exist_ok=True)
-        unzip_data(zip_path, extract_folder)
-        published = publish_data(extract_folder)
+def run():
+    if STREAM_MODE:
+        gathered, published = stream_bus_data()
+        print(f"Total breadcrumbs saved: {gathered}")
         print(f"Total records published: {published}")
+        return
 
-        try:
-            shutil.rmtree(extract_folder)
-        except Exception as e:
-            logger.error(f"Error cleaning up {extract_folder}: {e}")
+    watermarks = open_watermarks()
+    try:
+        zip_path = zip_archive_path(watermarks)
+        gathered = gather_bus_data(watermarks, zip_path)
+        print(f"Total breadcrumbs saved: {gathered}")
+
+        if ARCHIVE_FORMAT == "parquet":
+            # the staged JSON is published directly, no zip round trip
+            if os.path.isdir(output_folder):
+                published = publish_data(output_folder, watermarks)
+                print(f"Total records published: {published}")
+                try:
+                    shutil.rmtree(output_folder)
+                except Exception as e:
+                    logger.error(f"Error removing temporary folder {output_folder}: {e}")
+            return
+
+        if os.path.exists(zip_path):
+            os.makedirs(extract_folder, exist_ok=True)
+            unzip_data(zip_path, extract_folder)
+            published = publish_data(extract_folder, watermarks)
+            print(f"Total records published: {published}")
+
+            try:
+                shutil.rmtree(extract_folder)
+            except Exception as e:
+                logger.error(f"Error cleaning up {extract_folder}: {e}")
+    finally:
+        if watermarks is not None:
+            watermarks.close()
 
 if __name__ == "__main__":
     main()
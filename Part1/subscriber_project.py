@@ -1,10 +1,18 @@
-from io import StringIO
 import psycopg2
 from google.cloud import pubsub_v1
-from datetime import datetime, timedelta
 import os
-import json
-import pandas as pd
+import sys
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.envelope import decode_message
+from pipeline.transform import transform_breadcrumbs
+from pipeline.bulkload import merge_frame, replay_spilled, spill_frame
+from pipeline.routes import route_trips
+from pipeline.timeline import refresh_trips
+from pipeline.metrics import start_exporter
+from pipeline.microbatch import BUFFERED_RECORDS
 
 # === Your Config ===
 project_id = "dataengineeringproject-456307"
@@ -13,15 +21,25 @@ DBname = "trimet_data"
 DBuser = "srilakshmi"
 DBpwd = "#####"
 
+# counters and timings: a Prometheus endpoint on METRICS_PORT (None = off)
+# and a JSON snapshot rewritten every METRICS_INTERVAL seconds (None = off)
+METRICS_PORT = None
+METRICS_FILE = os.path.join("metrics", "subscriber.json")
+METRICS_INTERVAL = 30
+exporter = start_exporter(METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
+
 # === Pub/Sub Setup ===
 subscriber = pubsub_v1.SubscriberClient()
 subscription_path = subscriber.subscription_path(project_id, subscription_id)
-json_list = []
+# decoded fields go straight into typed column arrays
+buffer = breadcrumb_buffer()
 
 def callback(message: pubsub_v1.subscriber.message.Message) -> None:
     try:
-        json_message = json.loads(message.data.decode('utf-8'))
-        json_list.append(json_message)
+        # handles both single-record and batched envelope messages
+        # typed records straight from the bytes where the codec supports it
+        buffer.extend(decode_message(message, buffer.schema))
+        BUFFERED_RECORDS.set(len(buffer), subscriber="subscriber")
     except Exception as e:
         print(f"[callback] error decoding message: {e}")
     finally:
@@ -39,43 +57,19 @@ with subscriber:
         streaming_pull_future.cancel()
 
 # === Load into DataFrame ===
-df = pd.DataFrame(json_list)
+df = buffer.take_frame()
 
 if not df.empty:
     print(f"Received {len(df)} messages")
 
     # === Transformations ===
-    df['NEW_OPD_DATE'] = pd.to_datetime(df['OPD_DATE'], format='%d%b%Y:%H:%M:%S', errors='coerce')
-    df['DAY_OF_WEEK'] = df['NEW_OPD_DATE'].dt.dayofweek
-    df['DAY_NAME'] = df['DAY_OF_WEEK'].map({
-        0: 'Weekday', 1: 'Weekday', 2: 'Weekday',
-        3: 'Weekday', 4: 'Weekday', 5: 'Saturday', 6: 'Sunday'
-    })
-
-    def create_timestamp(row):
-        try:
-            opd_date = datetime.strptime(row['OPD_DATE'], '%d%b%Y:%H:%M:%S')
-            act_time = timedelta(seconds=min(row.get('ACT_TIME', 0), 86399))
-            return pd.Timestamp(opd_date + act_time)
-        except Exception as e:
-            print(f"[create_timestamp] error on row {row.name}: {e}")
-            return pd.NaT
-
-    df['TIMESTAMP'] = df.apply(create_timestamp, axis=1)
-    df.sort_values(by=['EVENT_NO_TRIP', 'TIMESTAMP', 'VEHICLE_ID'], inplace=True)
-
-    # Calculate speed (meters per second)
-    df['SPEED'] = df.groupby('EVENT_NO_TRIP')['METERS'].diff() / df.groupby('EVENT_NO_TRIP')['ACT_TIME'].diff()
-    df['SPEED'] = df['SPEED'].bfill().clip(lower=0)
-
-    # Fill missing GPS coords
-    df['GPS_LATITUDE'] = df['GPS_LATITUDE'].fillna(0.0)
-    df['GPS_LONGITUDE'] = df['GPS_LONGITUDE'].fillna(0.0)
+    df = transform_breadcrumbs(df)
 
     # Dedupe for trip table
     result_df = df.drop_duplicates(subset=['EVENT_NO_TRIP'], keep='first').copy()
-    result_df.loc[:, 'ROUTE_ID'] = 0
-    result_df.loc[:, 'DIRECTION'] = 'Out'  # ENUM-safe value
+    # unknown until the trip's stop events are indexed (pipeline/routes.py)
+    result_df.loc[:, 'ROUTE_ID'] = None
+    result_df.loc[:, 'DIRECTION'] = None
 
     # Prepare trip DataFrame
     df_trip = result_df[[
@@ -108,23 +102,27 @@ if not df.empty:
     )
 
     def copy_from_df(conn, df, table):
-        buffer = StringIO()
-        df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
         cursor = conn.cursor()
         try:
-            cursor.copy_from(buffer, table, sep=",")
+            # staged and merged on the natural key, so reruns add no duplicates
+            merge_frame(cursor, df, table)
             conn.commit()
-            print(f"[copy_from_df] Loaded {table} with {len(df)} rows")
         except Exception as e:
             print(f"[copy_from_df] Error loading {table}: {e}")
             conn.rollback()
+            spill_frame(df, table)
         finally:
             cursor.close()
 
+    replay_spilled(conn)
     copy_from_df(conn, df_trip, "trip")
     copy_from_df(conn, df_breadcrumb, "breadcrumb")
+    route_trips(conn, df_trip['trip_id'])
+    refresh_trips(conn, df_trip['trip_id'])
 
     conn.close()
 else:
     print("No messages received.")
+
+BUFFERED_RECORDS.set(0, subscriber="subscriber")
+exporter.close()
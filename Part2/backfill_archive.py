@@ -0,0 +1,81 @@
+"""Reload trips and breadcrumbs into Postgres from the Parquet archive.
+
+data_gather.py archives each day's breadcrumbs under ARCHIVE_ROOT
+(pipeline/archive.py). This replays any range of it through the same
+transform, validation and merge as updated_subscriber.py, one service date
+at a time, without Pub/Sub or the busdata API. The merge skips rows that
+are already loaded, so a range can be backfilled again safely.
+
+    python backfill_archive.py 2023-01-01 2023-01-31
+    python backfill_archive.py 2023-01-15 --vehicles 2901,2902
+"""
+import argparse
+import os
+import sys
+import time
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.archive import BreadcrumbArchive
+from pipeline.metrics import start_exporter
+from pipeline.timeline import refresh_trips
+from pipeline.transform import transform_breadcrumbs
+from updated_subscriber import build_tables, get_connection, load_batch, validate
+
+# === Config ===
+ARCHIVE_ROOT = os.path.join("processed_data", "breadcrumbs")
+# only the columns the transform, validation and tables read are decoded
+COLUMNS = ["EVENT_NO_TRIP", "OPD_DATE", "VEHICLE_ID", "METERS", "ACT_TIME",
+           "GPS_LONGITUDE", "GPS_LATITUDE"]
+
+# counters and timings: a Prometheus endpoint on METRICS_PORT (None = off)
+# and a JSON snapshot rewritten every METRICS_INTERVAL seconds (None = off)
+METRICS_PORT = None
+METRICS_FILE = os.path.join("metrics", "backfill_archive.json")
+METRICS_INTERVAL = 30
+
+
+def backfill(conn, archive, start=None, end=None, vehicles=None):
+    """Load every archived service date in [start, end]; returns (rows, trips, breadcrumbs)."""
+    totals = [0, 0, 0]
+    for day, df in archive.iter_days(COLUMNS, start, end, vehicles):
+        started = time.perf_counter()
+        rows = len(df)
+        df = validate(transform_breadcrumbs(df))
+        if df.empty:
+            print(f"[backfill] {day}: no valid rows in {rows}")
+            continue
+        df_trip, df_breadcrumb = build_tables(df)
+        trips, breadcrumbs = load_batch(conn, df_trip, df_breadcrumb)
+        refresh_trips(conn, df_trip['trip_id'])
+        totals[0] += rows
+        totals[1] += trips
+        totals[2] += breadcrumbs
+        print(f"[backfill] {day}: {rows} rows read, {trips} new trips, {breadcrumbs} new breadcrumbs "
+              f"in {time.perf_counter() - started:.1f}s")
+    return tuple(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("start", nargs="?", help="first service date (YYYY-MM-DD), default the oldest")
+    parser.add_argument("end", nargs="?", help="last service date, default start (or the newest)")
+    parser.add_argument("--vehicles", help="comma-separated vehicle ids, default all")
+    parser.add_argument("--root", default=ARCHIVE_ROOT, help="archive directory")
+    args = parser.parse_args()
+    end = args.end or args.start
+    vehicles = [int(v) for v in args.vehicles.split(",")] if args.vehicles else None
+
+    archive = BreadcrumbArchive(args.root)
+    exporter = start_exporter(METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
+    started = time.perf_counter()
+    try:
+        rows, trips, breadcrumbs = backfill(get_connection(), archive, args.start, end, vehicles)
+    finally:
+        exporter.close()
+    print(f"Backfilled {rows} archived rows: {trips} new trips, {breadcrumbs} new breadcrumbs "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
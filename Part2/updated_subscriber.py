@@ -1,10 +1,22 @@
-from io import StringIO
 import psycopg2
 from google.cloud import pubsub_v1
-from datetime import datetime, timedelta
 import os
-import json
-import pandas as pd
+import sys
+import signal
+from functools import partial
+from datetime import date
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.bulkload import merge_frame
+from pipeline.columnar import BREADCRUMB_SCHEMA, breadcrumb_buffer
+from pipeline.envelope import decode_message
+from pipeline.metrics import start_exporter
+from pipeline.microbatch import MicroBatcher
+from pipeline.routes import apply_routes
+from pipeline.timeline import refresh_trips
+from pipeline.transform import transform_breadcrumbs
+from pipeline.validation import BREADCRUMB_RULES, validate as validate_rules, report, write_rejected
 
 # === Config ===
 project_id = "dataengineeringproject-456307"
@@ -13,146 +25,56 @@ DBname = "trimet_data"
 DBuser = "srilakshmi"
 DBpwd = "####"
 
-# === Pub/Sub Setup ===
-subscriber = pubsub_v1.SubscriberClient()
-subscription_path = subscriber.subscription_path(project_id, subscription_id)
-json_list = []
+# === Micro-batching ===
+# transform, validate and COPY every BATCH_RECORDS records or BATCH_SECONDS
+# seconds; messages are acked only once their batch has committed
+BATCH_RECORDS = 5000
+BATCH_SECONDS = 30
+# Pub/Sub stops delivering while this many messages wait on a batch
+MAX_LEASED_MESSAGES = 20000
 
-def callback(message: pubsub_v1.subscriber.message.Message) -> None:
-    try:
-        json_message = json.loads(message.data.decode('utf-8'))
-        json_list.append(json_message)
-    except Exception as e:
-        print(f"[callback] error decoding message: {e}")
-    finally:
-        message.ack()
-
-streaming_pull_future = subscriber.subscribe(subscription_path, callback=callback)
-print(f"Listening for messages on {subscription_path}...\n")
-
-with subscriber:
-    try:
-        streaming_pull_future.result()  # infinite loop
-    except KeyboardInterrupt:
-        print("Stopping subscriber...")
-        streaming_pull_future.cancel()
+# rows failing validation are appended here with the rules they broke
+REJECTED_FOLDER = "rejected_rows"
 
-# === Load into DataFrame ===
-df = pd.DataFrame(json_list)
+# counters and timings: a Prometheus endpoint on METRICS_PORT (None = off)
+# and a JSON snapshot rewritten every METRICS_INTERVAL seconds (None = off)
+METRICS_PORT = None
+METRICS_FILE = os.path.join("metrics", "updated_subscriber.json")
+METRICS_INTERVAL = 30
 
-if not df.empty:
-    print(f"Received {len(df)} messages")
+conn = None
+totals = {"received": 0, "trips": 0, "breadcrumbs": 0}
 
-    df['NEW_OPD_DATE'] = pd.to_datetime(df['OPD_DATE'], format='%d%b%Y:%H:%M:%S', errors='coerce')
-    df['DAY_OF_WEEK'] = df['NEW_OPD_DATE'].dt.dayofweek
-    df['DAY_NAME'] = df['DAY_OF_WEEK'].map({
-        0: 'Weekday', 1: 'Weekday', 2: 'Weekday',
-        3: 'Weekday', 4: 'Weekday', 5: 'Saturday', 6: 'Sunday'
-    })
 
-    def create_timestamp(row):
-        try:
-            opd_date = datetime.strptime(row['OPD_DATE'], '%d%b%Y:%H:%M:%S')
-            act_time = timedelta(seconds=min(row.get('ACT_TIME', 0), 86399))
-            return pd.Timestamp(opd_date + act_time)
-        except Exception as e:
-            print(f"[create_timestamp] error on row {row.name}: {e}")
-            return pd.NaT
-
-    df['TIMESTAMP'] = df.apply(create_timestamp, axis=1)
-    df.sort_values(by=['EVENT_NO_TRIP', 'TIMESTAMP', 'VEHICLE_ID'], inplace=True)
-
-    df['SPEED'] = df.groupby('EVENT_NO_TRIP')['METERS'].diff() / df.groupby('EVENT_NO_TRIP')['ACT_TIME'].diff()
-    df['SPEED'] = df['SPEED'].bfill().clip(lower=0)
-
-    df['GPS_LATITUDE'] = df['GPS_LATITUDE'].fillna(0.0)
-    df['GPS_LONGITUDE'] = df['GPS_LONGITUDE'].fillna(0.0)
-
-    # === Assertions (Validation) ===
-    def assert_opd_date(row):
-        try:
-            assert isinstance(row['OPD_DATE'], str) and len(row['OPD_DATE']) > 0
-        except AssertionError:
-            raise ValueError("Invalid OPD_DATE")
-
-    def assert_vehicle_id(row):
-        try:
-            assert row['VEHICLE_ID'] > 0
-        except AssertionError:
-            raise ValueError("Invalid VEHICLE_ID")
-
-    def assert_act_time(row):
-        try:
-            assert 0 <= row.get('ACT_TIME', -1) <= 86399
-        except AssertionError:
-            raise ValueError("Invalid ACT_TIME")
-
-    def assert_gps_lat(row):
-        try:
-            assert -90.0 <= row['GPS_LATITUDE'] <= 90.0
-        except AssertionError:
-            raise ValueError("Invalid GPS_LATITUDE")
-
-    def assert_gps_long(row):
-        try:
-            assert -180.0 <= row['GPS_LONGITUDE'] <= 180.0
-        except AssertionError:
-            raise ValueError("Invalid GPS_LONGITUDE")
-
-    def assert_event_trip(row):
-        try:
-            assert row['EVENT_NO_TRIP'] > 0
-        except AssertionError:
-            raise ValueError("Invalid EVENT_NO_TRIP")
-
-    def assert_meters(row):
-        try:
-            assert row['METERS'] >= 0
-        except AssertionError:
-            raise ValueError("Invalid METERS value")
+def get_connection():
+    global conn
+    if conn is None or conn.closed:
+        conn = psycopg2.connect(
+            host="localhost",
+            database=DBname,
+            user=DBuser,
+            password=DBpwd
+        )
+    return conn
 
-    def assert_speed(row):
-        try:
-            assert row['SPEED'] >= 0
-        except AssertionError:
-            raise ValueError("Invalid SPEED")
 
-    def assert_timestamp(row):
-        try:
-            assert not pd.isna(row['TIMESTAMP'])
-        except AssertionError:
-            raise ValueError("Missing TIMESTAMP")
+# === Validation ===
+def validate(df):
+    result = validate_rules(df, BREADCRUMB_RULES)
+    report(result, label="breadcrumb")
+    if REJECTED_FOLDER:
+        path = os.path.join(REJECTED_FOLDER, f"breadcrumb_{date.today().isoformat()}.csv")
+        write_rejected(result.rejected, path)
+    return result.valid
 
-    def assert_day_of_week(row):
-        try:
-            assert row['DAY_OF_WEEK'] in range(7)
-        except AssertionError:
-            raise ValueError("Invalid DAY_OF_WEEK")
 
-    # === Filter out invalid rows ===
-    valid_rows = []
-    for i, row in df.iterrows():
-        try:
-            assert_opd_date(row)
-            assert_vehicle_id(row)
-            assert_act_time(row)
-            assert_gps_lat(row)
-            assert_gps_long(row)
-            assert_event_trip(row)
-            assert_meters(row)
-            assert_speed(row)
-            assert_timestamp(row)
-            assert_day_of_week(row)
-            valid_rows.append(row)
-        except Exception as e:
-            print(f"[Validation] Row {i} failed validation: {e}")
-
-    df = pd.DataFrame(valid_rows)
-
-    # === Transformation for DB ===
+# === Transformation for DB ===
+def build_tables(df):
     result_df = df.drop_duplicates(subset=['EVENT_NO_TRIP'], keep='first').copy()
-    result_df.loc[:, 'ROUTE_ID'] = 0
-    result_df.loc[:, 'DIRECTION'] = 'Out'
+    # the breadcrumb feed has no route or direction; load_batch fills them
+    # in from the trip's stop events (pipeline/routes.py)
+    result_df.loc[:, 'ROUTE_ID'] = None
+    result_df.loc[:, 'DIRECTION'] = None
 
     df_trip = result_df[[
         'EVENT_NO_TRIP', 'ROUTE_ID', 'VEHICLE_ID', 'DAY_NAME', 'DIRECTION'
@@ -173,45 +95,62 @@ if not df.empty:
         'SPEED': 'speed',
         'EVENT_NO_TRIP': 'trip_id'
     })
+    return df_trip, df_breadcrumb
 
-    # === Insert into PostgreSQL ===
-    conn = psycopg2.connect(
-        host="localhost",
-        database=DBname,
-        user=DBuser,
-        password=DBpwd
-    )
 
-    def copy_from_df(conn, df, table):
-        buffer = StringIO()
-        df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
-        cursor = conn.cursor()
-        try:
-            cursor.copy_from(buffer, table, sep=",")
-            conn.commit()
-            print(f"[copy_from_df] Loaded {table} with {len(df)} rows")
-        except Exception as e:
-            print(f"[copy_from_df] Error loading {table}: {e}")
-            conn.rollback()
-        finally:
-            cursor.close()
-
-    copy_from_df(conn, df_trip, "trip")
-    copy_from_df(conn, df_breadcrumb, "breadcrumb")
-    conn.close()
-    
-    print(f"Total messages received: {len(json_list)}")
-    print(f"Valid trips inserted: {len(df_trip)}")
-    print(f"Valid breadcrumbs inserted: {len(df_breadcrumb)}")
+# === Insert into PostgreSQL ===
+def load_batch(conn, df_trip, df_breadcrumb):
+    """Merge one batch's trips and breadcrumbs in a single transaction.
 
+    A trip's breadcrumbs usually span several batches and redelivered
+    batches repeat rows; both are dropped on the natural keys, so a failed
+    batch can simply be nacked and loaded again. Trips whose stop events are
+    already indexed get their route here; the rest get it when those arrive.
+    Returns the number of new trips and breadcrumbs.
+    """
+    cursor = conn.cursor()
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            database=DBname,
-            user=DBuser,
-            password=DBpwd
-        )
+        trips = merge_frame(cursor, df_trip, "trip")
+        breadcrumbs = merge_frame(cursor, df_breadcrumb, "breadcrumb")
+        apply_routes(cursor, df_trip['trip_id'])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return trips.merged, breadcrumbs.merged
+
+
+def process_batch(records):
+    """Run one micro-batch (a breadcrumb ColumnBuffer) through transform, validation and COPY.
+
+    Raising makes the batcher nack the batch's messages for redelivery.
+    """
+    df = records.take_frame()
+    if df.empty:
+        return
+    totals["received"] += len(df)
+
+    df = validate(transform_breadcrumbs(df))
+    if df.empty:
+        print("[batch] no valid rows in batch")
+        return
+
+    df_trip, df_breadcrumb = build_tables(df)
+    trips, breadcrumbs = load_batch(get_connection(), df_trip, df_breadcrumb)
+    totals["trips"] += trips
+    totals["breadcrumbs"] += breadcrumbs
+    refresh_trips(get_connection(), df_trip['trip_id'])
+
+
+def print_summary():
+    print(f"Total messages received: {totals['received']}")
+    print(f"Valid trips inserted: {totals['trips']}")
+    print(f"Valid breadcrumbs inserted: {totals['breadcrumbs']}")
+
+    try:
+        conn = get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM trip;")
         total_trips = cursor.fetchone()[0]
@@ -222,5 +161,39 @@ if not df.empty:
         conn.close()
     except Exception as e:
         print(f"[Summary] Failed to fetch DB row counts: {e}")
-else:
-    print("No messages received.")
+
+
+def main():
+    # systemd stops the service with SIGTERM; shut down the same way as Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = subscriber.subscription_path(project_id, subscription_id)
+    exporter = start_exporter(METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
+    batcher = MicroBatcher(process_batch, max_records=BATCH_RECORDS, max_seconds=BATCH_SECONDS,
+                           name="updated_subscriber", buffer=breadcrumb_buffer,
+                           decode=partial(decode_message, schema=BREADCRUMB_SCHEMA))
+    flow_control = pubsub_v1.types.FlowControl(max_messages=MAX_LEASED_MESSAGES)
+
+    streaming_pull_future = subscriber.subscribe(
+        subscription_path, callback=batcher.callback, flow_control=flow_control
+    )
+    print(f"Listening for messages on {subscription_path}...\n")
+
+    with subscriber:
+        try:
+            streaming_pull_future.result()  # runs until interrupted
+        except KeyboardInterrupt:
+            print("Stopping subscriber...")
+        except Exception as e:
+            print(f"[Pub/Sub] streaming pull terminated: {e}")
+        # commit and ack what is buffered while the stream can still send acks
+        batcher.close()
+        streaming_pull_future.cancel()
+
+    print_summary()
+    exporter.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Breadcrumb maps for the q1-q5_3 questions from one entry point.
+
+Each question is a view: a query with bound parameters and the defaults
+the q*.py scripts hardcoded. Any parameter can be overridden from the
+command line, and results come through a Parquet cache
+(pipeline/querycache.py) that is only bypassed once new data has been
+loaded for the dates the view covers, so restyling a map doesn't rescan
+breadcrumb.
+
+    python visualize.py q5_1 --route 20 --date 2023-01-26 --mode grid
+    python visualize.py q4 --bbox -122.655 45.503 -122.643 45.514 --start 2023-01-15 --end "2023-01-15 11:00"
+    python visualize.py --list
+"""
+import argparse
+import os
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import partial
+
+import psycopg2
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from pipeline import maps
+from pipeline.querycache import CACHE_FOLDER, QueryCache, dates_between
+
+DB_CONFIG = {
+    "dbname": "trimet_data",
+    "user": "srilakshmi",
+    "password": "####",
+    "host": "localhost",
+    "port": "5432",
+}
+
+View = namedtuple("View", ["description", "query", "defaults", "output", "zoom_start", "location", "popup", "radius"])
+
+# bounding boxes as point(longitude, latitude) <@ box(...) so the GiST index
+# applies; time windows as plain tstamp ranges so partitions are pruned
+BOX = "box(point(%(west)s, %(south)s), point(%(east)s, %(north)s))"
+
+VIEWS = {
+    "q1": View(
+        "latest trip with a route through a bounding box (default: near the bridge)",
+        f"""
+        SELECT longitude, latitude, speed
+        FROM breadcrumb
+        WHERE trip_id = (
+            SELECT b.trip_id
+            FROM breadcrumb b
+            INNER JOIN trip t ON t.trip_id = b.trip_id
+            WHERE point(b.longitude, b.latitude) <@ {BOX}
+              AND t.route_id > 0
+            ORDER BY b.tstamp DESC
+            LIMIT 1
+        )
+        AND latitude IS NOT NULL AND longitude IS NOT NULL
+        """,
+        {"west": -122.711662, "south": 45.506022, "east": -122.700316, "north": 45.516636},
+        "q1_visualize.html", 13, None, True, 2),
+    "q2": View(
+        "first trip of a route in a time window (default: route 20, 2023-01-26 16:00-19:00)",
+        """
+        SELECT longitude, latitude, speed
+        FROM breadcrumb
+        WHERE trip_id = (
+            SELECT b.trip_id
+            FROM breadcrumb b
+            JOIN trip t ON b.trip_id = t.trip_id
+            WHERE t.route_id = %(route_id)s
+              AND b.tstamp >= %(start)s
+              AND b.tstamp < %(end)s
+            ORDER BY b.tstamp
+            LIMIT 1
+        )
+        """,
+        {"route_id": 20, "start": "2023-01-26 16:00", "end": "2023-01-26 19:00"},
+        "q2_visualize.html", 13, None, False, 2),
+    "q3": View(
+        "given trips in a time window (default: two trips, Sunday 2023-01-15 09:00-12:00)",
+        """
+        SELECT b.latitude, b.longitude, b.speed
+        FROM breadcrumb b
+        JOIN trip t ON t.trip_id = b.trip_id
+        WHERE b.trip_id = ANY(%(trip_ids)s::bigint[])
+          AND b.tstamp >= %(start)s
+          AND b.tstamp < %(end)s
+          AND b.latitude IS NOT NULL
+          AND b.longitude IS NOT NULL
+        """,
+        {"trip_ids": [238332615, 238332716], "start": "2023-01-15 09:00", "end": "2023-01-15 12:00"},
+        "q3_visualization.html", 14, None, True, 2),
+    "q4": View(
+        "every breadcrumb in a bounding box and time window (default: Ladd's Circle, 2023-01-15 morning)",
+        f"""
+        SELECT latitude, longitude, speed
+        FROM breadcrumb
+        WHERE tstamp >= %(start)s
+          AND tstamp < %(end)s
+          AND point(longitude, latitude) <@ {BOX}
+          AND latitude IS NOT NULL
+          AND longitude IS NOT NULL
+        """,
+        {"west": -122.655, "south": 45.503, "east": -122.643, "north": 45.514,
+         "start": "2023-01-15", "end": "2023-01-15 11:00"},
+        "q4_visualize_laddcircle.html", 14, [45.508537, -122.649434], True, 2),
+    "q5_1": View(
+        "one route for a day (default: route 35 on 2023-01-15)",
+        """
+        SELECT b.latitude, b.longitude, b.speed
+        FROM breadcrumb b
+        JOIN trip t ON b.trip_id = t.trip_id
+        WHERE t.route_id = %(route_id)s
+          AND b.tstamp >= %(start)s
+          AND b.tstamp < %(end)s
+          AND b.latitude IS NOT NULL
+          AND b.longitude IS NOT NULL
+        """,
+        {"route_id": 35, "start": "2023-01-15", "end": "2023-01-16"},
+        "q5a_route20_20230126.html", 13, None, True, 2),
+    "q5_2": View(
+        "every breadcrumb in a time window (default: late night 2023-01-15 22:00-24:00)",
+        """
+        SELECT latitude, longitude, speed
+        FROM breadcrumb
+        WHERE tstamp >= %(start)s
+          AND tstamp < %(end)s
+          AND latitude IS NOT NULL
+          AND longitude IS NOT NULL
+        """,
+        {"start": "2023-01-15 22:00", "end": "2023-01-16"},
+        "q7_late_night_trips.html", 13, None, True, 2),
+    "q5_3": View(
+        "breadcrumbs above a speed in a time window (default: > 25 m/s on 2023-01-16)",
+        """
+        SELECT latitude, longitude, speed
+        FROM breadcrumb
+        WHERE speed > %(min_speed)s
+          AND tstamp >= %(start)s
+          AND tstamp < %(end)s
+          AND latitude IS NOT NULL
+          AND longitude IS NOT NULL
+        """,
+        {"min_speed": 25, "start": "2023-01-16", "end": "2023-01-17"},
+        "q5c_high_speed_segments.html", 13, None, True, 3),
+}
+
+
+def view_params(view, args):
+    """The view's defaults overridden by the command line; errors on options the view has no use for."""
+    given = {}
+    if args.date is not None:
+        day = datetime.fromisoformat(args.date)
+        given["start"], given["end"] = day, day + timedelta(days=1)
+    if args.start is not None:
+        given["start"] = args.start
+    if args.end is not None:
+        given["end"] = args.end
+    if args.route is not None:
+        given["route_id"] = args.route
+    if args.trips is not None:
+        given["trip_ids"] = args.trips
+    if args.bbox is not None:
+        given.update(zip(("west", "south", "east", "north"), args.bbox))
+    if args.min_speed is not None:
+        given["min_speed"] = args.min_speed
+
+    unknown = sorted(set(given) - set(view.defaults))
+    if unknown:
+        raise ValueError(f"{args.view} takes no {', '.join(unknown)}")
+    params = {**view.defaults, **given}
+    for name in ("start", "end"):
+        if name in params and not isinstance(params[name], datetime):
+            params[name] = datetime.fromisoformat(params[name])
+    return params
+
+
+def covered_dates(params):
+    """Service dates a view's results depend on; None when it isn't bounded in time."""
+    return dates_between(params.get("start"), params.get("end"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("view", nargs="?", choices=sorted(VIEWS), help="question to map")
+    parser.add_argument("--list", action="store_true", help="describe the views and their defaults")
+    parser.add_argument("--date", help="one service day (YYYY-MM-DD), sets --start/--end")
+    parser.add_argument("--start", help="window start, e.g. '2023-01-15 09:00'")
+    parser.add_argument("--end", help="window end (exclusive)")
+    parser.add_argument("--route", type=int, help="route_id")
+    parser.add_argument("--trips", type=lambda s: [int(t) for t in s.split(",")], help="comma-separated trip ids")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--min-speed", type=float, help="m/s")
+    parser.add_argument("--mode", default="auto", choices=maps.MODES, help="see pipeline/maps.py")
+    parser.add_argument("--cell", type=float, default=maps.CELL_METERS, help="grid cell in meters")
+    parser.add_argument("--out", help="HTML file (default: the q script's file name)")
+    parser.add_argument("--dsn", help="libpq connection string instead of DB_CONFIG")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="cache folder")
+    parser.add_argument("--no-cache", action="store_true", help="always query Postgres")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the cache first")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, view in VIEWS.items():
+            print(f"{name:5s} {view.description}\n      defaults: {view.defaults}")
+        return
+    if args.view is None:
+        parser.error("a view is required (see --list)")
+    view = VIEWS[args.view]
+    try:
+        params = view_params(view, args)
+    except ValueError as e:
+        parser.error(str(e))
+
+    cache = QueryCache(args.cache, enabled=not args.no_cache)
+    if args.clear_cache:
+        print(f"Removed {cache.clear()} cached results")
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    try:
+        m = maps.render(conn, view.query, params, mode=args.mode, location=view.location,
+                        zoom_start=view.zoom_start, popup=view.popup, radius=view.radius,
+                        cell_m=args.cell, read=partial(cache.read, dates=covered_dates(params)))
+    finally:
+        conn.close()
+
+    if m is None:
+        print(f"No data found for {args.view} with {params}")
+        return
+    output = args.out or view.output
+    m.save(output)
+    print(f"Saved {output} ({cache.hits} cached, {cache.misses} queried)")
+
+
+if __name__ == "__main__":
+    main()
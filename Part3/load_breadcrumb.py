@@ -1,9 +1,18 @@
+import json
 import os
+import sys
 import pandas as pd
-import requests
-from datetime import datetime, timedelta
 import psycopg2
-from io import StringIO
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.bulkload import merge_frame, replay_spilled, spill_frame
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.fetcher import VehicleFetcher
+from pipeline.metrics import start_exporter
+from pipeline.timeline import refresh_trips
+from pipeline.transform import transform_breadcrumbs as shared_transform
+from pipeline.watermark import WatermarkStore, breadcrumb_key
 
 VEHICLE_IDS_CSV = "vehicle_ids.csv"
 DB_CONFIG = {
@@ -14,76 +23,118 @@ DB_CONFIG = {
     "port": 5432
 }
 URL_TEMPLATE = "https://busdata.cs.pdx.edu/api/getBreadCrumbs?vehicle_id={}"
+# per-request timeout (connect, read) and retries, so one hung vehicle can't stall the load
+REQUEST_TIMEOUT = (5, 60)
+REQUEST_RETRIES = 3
+# "binary" skips text formatting of timestamps and floats; "csv" is easier to debug
+COPY_FORMAT = "binary"
+# per-vehicle ETag / payload hash / OPD_DATE+ACT_TIME watermark of what is
+# already loaded, so reruns skip unchanged vehicles (None disables it)
+WATERMARK_PATH = "load_breadcrumb_state.sqlite"
+# counters and timings: a Prometheus endpoint on METRICS_PORT (None = off)
+# and a JSON snapshot rewritten every METRICS_INTERVAL seconds (None = off)
+METRICS_PORT = None
+METRICS_FILE = os.path.join("metrics", "load_breadcrumb.json")
+METRICS_INTERVAL = 30
 
-def fetch_breadcrumb_data(vehicle_id):
-    url = URL_TEMPLATE.format(vehicle_id)
+def fetch_breadcrumb_data(result, watermarks=None):
+    """The new records in one vehicle's FetchResult; failures are logged and yield []."""
+    vid = result.vehicle_id
+    if result.error is not None:
+        print(f"[fetch] vehicle {vid} failed after {result.attempts} attempts: {result.error}")
+        return []
+    if watermarks is not None and watermarks.unchanged(vid, result.status_code, result.text):
+        return []
+    if result.status_code != 200 or not result.text.strip():
+        return []
     try:
-        response = requests.get(url)
-        if response.status_code == 200 and response.text.strip():
-            return response.json()
-    except:
-        pass
-    return []
+        records = json.loads(result.text)
+    except ValueError as e:
+        print(f"[fetch] vehicle {vid} returned invalid JSON: {e}")
+        return []
+    if watermarks is not None:
+        records, high = watermarks.filter_new(vid, records, breadcrumb_key)
+        watermarks.stage(vid, result.text, result.headers, high)
+    return records
 
-def transform_breadcrumbs(records):
-    df = pd.DataFrame(records)
+def transform_breadcrumbs(df):
     if df.empty or 'OPD_DATE' not in df.columns:
         return pd.DataFrame()
 
-    df['OPD_DATE'] = pd.to_datetime(df['OPD_DATE'], format="%d%b%Y:%H:%M:%S", errors='coerce')
-    df = df.dropna(subset=['OPD_DATE'])
-
-    def to_timestamp(row):
-        try:
-            return row['OPD_DATE'] + timedelta(seconds=min(int(row.get('ACT_TIME', 0)), 86399))
-        except:
-            return pd.NaT
+    for col in ('EVENT_NO_TRIP', 'METERS', 'ACT_TIME', 'GPS_LATITUDE', 'GPS_LONGITUDE'):
+        df[col] = pd.to_numeric(df.get(col), errors='coerce')
 
-    df['tstamp'] = df.apply(to_timestamp, axis=1)
-    df['latitude'] = pd.to_numeric(df.get('GPS_LATITUDE', None), errors='coerce')
-    df['longitude'] = pd.to_numeric(df.get('GPS_LONGITUDE', None), errors='coerce')
-    df['speed'] = pd.to_numeric(df.get('SPEED', None), errors='coerce')
-    df['trip_id'] = pd.to_numeric(df.get('EVENT_NO_TRIP', None), errors='coerce')
+    # missing GPS stays NULL here rather than being zero-filled
+    df = shared_transform(df, fill_gps=False)
+    df = df.dropna(subset=['TIMESTAMP'])
 
-    breadcrumb_df = df[['tstamp', 'latitude', 'longitude', 'speed', 'trip_id']]
-    breadcrumb_df = breadcrumb_df.dropna(subset=['tstamp'])
+    breadcrumb_df = df[[
+        'TIMESTAMP', 'GPS_LATITUDE', 'GPS_LONGITUDE', 'SPEED', 'EVENT_NO_TRIP'
+    ]].rename(columns={
+        'TIMESTAMP': 'tstamp',
+        'GPS_LATITUDE': 'latitude',
+        'GPS_LONGITUDE': 'longitude',
+        'SPEED': 'speed',
+        'EVENT_NO_TRIP': 'trip_id'
+    })
 
     return breadcrumb_df
 
 def copy_from_df(conn, df, table_name):
-    buffer = StringIO()
-    df = df.where(pd.notnull(df), None)
-    df.to_csv(buffer, index=False, header=False, sep=",", na_rep='\\N')
-    buffer.seek(0)
     cursor = conn.cursor()
     try:
-        cursor.copy_from(buffer, table_name, sep=",", null='\\N')
+        # merges on (trip_id, tstamp), so rerunning the loader adds nothing twice
+        merge_frame(cursor, df, table_name, fmt=COPY_FORMAT)
         conn.commit()
-    except:
+    except Exception as e:
+        print(f"[copy_from_df] Error loading {table_name}: {e}")
         conn.rollback()
+        # the spilled batch is replayed on the next run, so it still counts as handled
+        spill_frame(df, table_name)
     finally:
         cursor.close()
 
 def main():
     if not os.path.exists(VEHICLE_IDS_CSV):
         return
+    exporter = start_exporter(METRICS_PORT, METRICS_FILE, METRICS_INTERVAL)
+    try:
+        load()
+    finally:
+        exporter.close()
 
+def load():
     vehicle_ids = pd.read_csv(VEHICLE_IDS_CSV, header=None)[0].astype(str).tolist()
-    all_records = []
-    for vid in vehicle_ids:
-        data = fetch_breadcrumb_data(vid)
-        if data:
-            all_records.extend(data)
+    watermarks = WatermarkStore("breadcrumb", WATERMARK_PATH) if WATERMARK_PATH else None
+    try:
+        buffer = breadcrumb_buffer()
+        headers_for = watermarks.request_headers if watermarks is not None else None
+        with VehicleFetcher(URL_TEMPLATE, timeout=REQUEST_TIMEOUT, retries=REQUEST_RETRIES) as fetcher:
+            for result in fetcher.iter_results(vehicle_ids, headers_for):
+                data = fetch_breadcrumb_data(result, watermarks)
+                if data:
+                    buffer.extend(data)
+        if watermarks is not None:
+            print(f"[watermark] {watermarks.summary()}")
 
-    df = transform_breadcrumbs(all_records)
-    if df.empty:
-        return
+        df = transform_breadcrumbs(buffer.take_frame())
+        if df.empty:
+            if watermarks is not None:
+                watermarks.commit()
+            return
 
-    print(f"Final breadcrumb rows ready to insert: {len(df)}")
+        print(f"Final breadcrumb rows ready to insert: {len(df)}")
 
-    conn = psycopg2.connect(**DB_CONFIG)
-    copy_from_df(conn, df, "breadcrumb")
-    conn.close()
+        conn = psycopg2.connect(**DB_CONFIG)
+        replay_spilled(conn)
+        copy_from_df(conn, df, "breadcrumb")
+        if watermarks is not None:
+            watermarks.commit()
+        refresh_trips(conn, df['trip_id'])
+        conn.close()
+    finally:
+        if watermarks is not None:
+            watermarks.close()
 
 if __name__ == "__main__":
     main()
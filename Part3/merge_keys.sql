@@ -0,0 +1,26 @@
+-- Adds the natural-key constraints the loaders merge on to a database
+-- created with an older stop.sql. Duplicate rows left by earlier reruns are
+-- removed first (the copy with the lowest ctid is kept).
+
+BEGIN;
+
+DELETE FROM breadcrumb a
+USING breadcrumb b
+WHERE a.trip_id = b.trip_id
+  AND a.tstamp = b.tstamp
+  AND a.ctid > b.ctid;
+
+ALTER TABLE breadcrumb
+    ADD CONSTRAINT breadcrumb_trip_id_tstamp_key UNIQUE (trip_id, tstamp);
+
+DELETE FROM stop_events a
+USING stop_events b
+WHERE a.trip_id = b.trip_id
+  AND a.location_id = b.location_id
+  AND a.arrive_time = b.arrive_time
+  AND a.ctid > b.ctid;
+
+ALTER TABLE stop_events
+    ADD CONSTRAINT stop_events_trip_id_location_id_arrive_time_key UNIQUE (trip_id, location_id, arrive_time);
+
+COMMIT;
@@ -0,0 +1,72 @@
+-- Migrates a database created with an older stop.sql to the partitioned
+-- breadcrumb layout: BIGINT trip ids, monthly range partitions on tstamp,
+-- BRIN on tstamp, b-tree on (trip_id, tstamp) and a GiST index on
+-- point(longitude, latitude). Existing rows are copied over, duplicates
+-- dropped. Run once: psql -d trimet_data -f partition_breadcrumb.sql
+-- The old breadcrumb goes with its triggers and trip_full_view with it, so
+-- rerun the files built on them afterwards (each is safe to rerun):
+--   psql -d trimet_data -f trip_timeline.sql -f speed_stats.sql -f trip_routes.sql
+
+BEGIN;
+
+DROP VIEW IF EXISTS trip_full_view;
+-- staging tables copy the old column types; the loaders recreate them
+DROP TABLE IF EXISTS trip_staging, breadcrumb_staging, stop_events_staging;
+
+ALTER TABLE trip
+    ALTER COLUMN trip_id TYPE BIGINT USING trip_id::numeric::bigint,
+    ALTER COLUMN route_id TYPE INTEGER USING route_id::numeric::integer;
+ALTER TABLE stop_events
+    ALTER COLUMN trip_id TYPE BIGINT USING trip_id::numeric::bigint;
+
+ALTER TABLE breadcrumb RENAME TO breadcrumb_heap;
+ALTER TABLE breadcrumb_heap DROP CONSTRAINT IF EXISTS breadcrumb_trip_id_tstamp_key;
+
+CREATE TABLE breadcrumb (
+    trip_id BIGINT,
+    tstamp TIMESTAMP,
+    latitude FLOAT,
+    longitude FLOAT,
+    speed FLOAT,
+    UNIQUE (trip_id, tstamp)
+) PARTITION BY RANGE (tstamp);
+
+CREATE TABLE breadcrumb_default PARTITION OF breadcrumb DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_breadcrumb_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day);
+    partition_name TEXT := 'breadcrumb_' || to_char(day, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF breadcrumb FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + INTERVAL '1 month'
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_breadcrumb_partition(month::date)
+FROM (SELECT DISTINCT date_trunc('month', tstamp) AS month FROM breadcrumb_heap WHERE tstamp IS NOT NULL) months;
+
+-- ordered by time so each partition's BRIN ranges stay tight
+INSERT INTO breadcrumb (trip_id, tstamp, latitude, longitude, speed)
+SELECT trip_id::numeric::bigint, tstamp, latitude, longitude, speed
+FROM breadcrumb_heap
+ORDER BY tstamp
+ON CONFLICT DO NOTHING;
+
+CREATE INDEX breadcrumb_tstamp_brin ON breadcrumb USING brin (tstamp) WITH (autosummarize = on);
+CREATE INDEX breadcrumb_position_gist ON breadcrumb USING gist (point(longitude, latitude));
+
+DROP TABLE breadcrumb_heap;
+
+COMMIT;
+
+ANALYZE trip;
+ANALYZE breadcrumb;
+ANALYZE stop_events;
+
+-- now rerun trip_timeline.sql (trip_full_view), speed_stats.sql (the
+-- breadcrumb_speed_stats trigger) and trip_routes.sql
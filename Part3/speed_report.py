@@ -0,0 +1,78 @@
+"""Breadcrumb speeds for an area and hours of the week, from speed_stats.
+
+Reads the summary Part3/speed_stats.sql keeps current on every load
+instead of scanning breadcrumb (pipeline/speedstats.py), e.g.
+
+    python speed_report.py --bbox -122.711662 45.506022 -122.700316 45.516636
+    python speed_report.py --days weekdays --hours 16-19 --map rush_hour.html
+    python speed_report.py --hours 22-24 --min-speed 25
+    python speed_report.py --rebuild      # count breadcrumbs loaded before speed_stats existed
+"""
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import maps, speedstats
+
+DB_CONFIG = {
+    "host": "localhost",
+    "database": "trimet_data",
+    "user": "srilakshmi",
+    "password": "####",
+}
+
+
+def hour_span(text):
+    first, _, last = text.partition("-")
+    return int(first), int(last or int(first) + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("WEST", "SOUTH", "EAST", "NORTH"))
+    parser.add_argument("--days", default="all", choices=sorted(speedstats.DAYS))
+    parser.add_argument("--hours", type=hour_span, help="hours of the day, e.g. 16-19 or 22-2 (default all)")
+    parser.add_argument("--min-speed", type=float, help="also report the share of breadcrumbs at or above this (m/s)")
+    parser.add_argument("--map", help="also draw the cells' mean speed to this HTML file")
+    parser.add_argument("--rebuild", action="store_true", help="recount speed_stats from breadcrumb first")
+    parser.add_argument("--dsn", help="libpq connection string instead of DB_CONFIG")
+    args = parser.parse_args()
+
+    hours = None
+    if args.hours or args.days != "all":
+        hours = speedstats.hours(args.days, *(args.hours or (0, 24)))
+
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    try:
+        if args.rebuild:
+            started = time.perf_counter()
+            rows = speedstats.rebuild(conn)
+            print(f"[speed_stats] rebuilt {rows} cell-hours in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        stats = speedstats.summary(conn, args.bbox, hours, args.min_speed)
+        elapsed = time.perf_counter() - started
+        cells = speedstats.cells(conn, args.bbox, hours) if args.map else None
+    finally:
+        conn.close()
+
+    if not stats["n"]:
+        print("No breadcrumbs with a speed for that area and time.")
+        return
+    print(f"{stats['n']} breadcrumbs from {stats['rows']} summary rows in {elapsed * 1000:.1f} ms")
+    print(f"  mean {stats['mean']:.2f} m/s, max {stats['max']:.2f} m/s, "
+          + ", ".join(f"p{q} {stats[f'p{q}']:.1f}" for q in speedstats.PERCENTILES))
+    if args.min_speed is not None:
+        print(f"  at or above {args.min_speed:g} m/s: {stats['share_above']:.2%}")
+    if cells is not None:
+        m = maps.cells_map(cells, speedstats.CELL_METERS)
+        m.save(args.map)
+        print(f"Saved {args.map}")
+
+
+if __name__ == "__main__":
+    main()
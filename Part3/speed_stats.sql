@@ -0,0 +1,132 @@
+-- Speed statistics: every breadcrumb with a speed, counted into a grid cell
+-- and an hour of the week, so speed questions (a bridge, a rush hour, late
+-- night, speeding) read a few summary rows instead of scanning breadcrumb.
+-- Run after stop.sql:
+--   psql -d trimet_data -f stop.sql -f trip_timeline.sql -f speed_stats.sql
+-- A trigger folds the rows each load inserts into the summary in the same
+-- statement, so every loader keeps it current and a redelivered batch,
+-- whose rows the merge skips, is not counted twice. Existing breadcrumbs
+-- are counted with SELECT rebuild_speed_stats().
+--
+-- Cells are the 200 m squares of the lattice pipeline/maps.py draws
+-- (floor(longitude / lon_step), floor(latitude / lat_step)); hour_of_week
+-- is 0 for Monday 00:00-00:59 through 167 for Sunday 23:00. Speeds are
+-- kept as a histogram of 1 m/s bins, the last one open-ended: histograms
+-- add up element by element, so cells and hours merge into exact counts
+-- and percentiles to within a bin. Keep these in step with
+-- pipeline/speedstats.py.
+
+DROP TRIGGER IF EXISTS breadcrumb_speed_stats ON breadcrumb;
+
+CREATE TABLE IF NOT EXISTS speed_stats (
+    gx INTEGER NOT NULL,
+    gy INTEGER NOT NULL,
+    hour_of_week SMALLINT NOT NULL,
+    n BIGINT NOT NULL,
+    sum_speed FLOAT NOT NULL,
+    max_speed FLOAT NOT NULL,
+    hist INTEGER[] NOT NULL,
+    PRIMARY KEY (gx, gy, hour_of_week)
+);
+CREATE INDEX IF NOT EXISTS speed_stats_hour ON speed_stats (hour_of_week);
+
+-- the same over the whole city, for questions with no area
+CREATE TABLE IF NOT EXISTS speed_stats_hourly (
+    hour_of_week SMALLINT PRIMARY KEY,
+    n BIGINT NOT NULL,
+    sum_speed FLOAT NOT NULL,
+    max_speed FLOAT NOT NULL,
+    hist INTEGER[] NOT NULL
+);
+
+-- element-wise sum of two histograms
+CREATE OR REPLACE FUNCTION speed_hist_add(a INTEGER[], b INTEGER[]) RETURNS INTEGER[] AS $$
+    SELECT array_agg(coalesce(x, 0) + coalesce(y, 0) ORDER BY i)
+    FROM unnest(a, b) WITH ORDINALITY AS u(x, y, i)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- a histogram from (bin, count) pairs
+CREATE OR REPLACE FUNCTION speed_hist(bins INTEGER[], counts BIGINT[]) RETURNS INTEGER[] AS $$
+    SELECT array_agg(coalesce(c, 0)::integer ORDER BY b)
+    FROM generate_series(0, 39) b
+    LEFT JOIN unnest(bins, counts) AS u(bin, c) ON u.bin = b
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The statement adding the breadcrumbs of ``source`` (a table name or a
+-- parenthesized query) to speed_stats and speed_stats_hourly; the trigger
+-- and the rebuild both EXECUTE it. Rows are upserted in key order so
+-- concurrent loads lock them in the same order.
+CREATE OR REPLACE FUNCTION speed_stats_merge_sql(source TEXT) RETURNS TEXT AS $$
+    SELECT format($sql$
+        WITH buckets AS (
+            SELECT floor(r.longitude / (200 / 111320.0 / cos(radians(45.52))))::integer AS gx,
+                   floor(r.latitude / (200 / 111320.0))::integer AS gy,
+                   ((extract(isodow FROM r.tstamp)::integer - 1) * 24
+                    + extract(hour FROM r.tstamp)::integer)::smallint AS hour_of_week,
+                   least(floor(r.speed / 1.0)::integer, 39) AS bin,
+                   count(*) AS n, sum(r.speed) AS sum_speed, max(r.speed) AS max_speed
+            FROM %s r
+            WHERE r.speed >= 0 AND r.latitude IS NOT NULL AND r.longitude IS NOT NULL
+              AND r.tstamp IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        ), cells AS (
+            INSERT INTO speed_stats AS s (gx, gy, hour_of_week, n, sum_speed, max_speed, hist)
+            SELECT gx, gy, hour_of_week, sum(n), sum(sum_speed), max(max_speed),
+                   speed_hist(array_agg(bin), array_agg(n))
+            FROM buckets
+            GROUP BY gx, gy, hour_of_week
+            ORDER BY gx, gy, hour_of_week
+            ON CONFLICT (gx, gy, hour_of_week) DO UPDATE SET
+                n = s.n + EXCLUDED.n,
+                sum_speed = s.sum_speed + EXCLUDED.sum_speed,
+                max_speed = greatest(s.max_speed, EXCLUDED.max_speed),
+                hist = speed_hist_add(s.hist, EXCLUDED.hist)
+        )
+        INSERT INTO speed_stats_hourly AS s (hour_of_week, n, sum_speed, max_speed, hist)
+        SELECT hour_of_week, sum(n), sum(sum_speed), max(max_speed), speed_hist(array_agg(bin), array_agg(n))
+        FROM (
+            SELECT hour_of_week, bin, sum(n)::bigint AS n, sum(sum_speed) AS sum_speed, max(max_speed) AS max_speed
+            FROM buckets
+            GROUP BY hour_of_week, bin
+        ) city
+        GROUP BY hour_of_week
+        ORDER BY hour_of_week
+        ON CONFLICT (hour_of_week) DO UPDATE SET
+            n = s.n + EXCLUDED.n,
+            sum_speed = s.sum_speed + EXCLUDED.sum_speed,
+            max_speed = greatest(s.max_speed, EXCLUDED.max_speed),
+            hist = speed_hist_add(s.hist, EXCLUDED.hist)
+    $sql$, source)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION breadcrumb_speed_stats() RETURNS TRIGGER AS $$
+BEGIN
+    EXECUTE speed_stats_merge_sql('inserted');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- only rows actually inserted are in the transition table: those an
+-- ON CONFLICT DO NOTHING merge skips are not counted again
+CREATE TRIGGER breadcrumb_speed_stats
+    AFTER INSERT ON breadcrumb
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION breadcrumb_speed_stats();
+
+-- Count every breadcrumb already loaded, a month at a time.
+CREATE OR REPLACE FUNCTION rebuild_speed_stats() RETURNS BIGINT AS $$
+DECLARE
+    month DATE;
+    cells BIGINT := 0;
+BEGIN
+    TRUNCATE speed_stats, speed_stats_hourly;
+    FOR month IN
+        SELECT DISTINCT date_trunc('month', tstamp)::date FROM breadcrumb WHERE tstamp IS NOT NULL ORDER BY 1
+    LOOP
+        EXECUTE speed_stats_merge_sql(format('(SELECT * FROM breadcrumb WHERE tstamp >= %L AND tstamp < %L)',
+                                             month, month + INTERVAL '1 month'));
+    END LOOP;
+    SELECT count(*) INTO cells FROM speed_stats;
+    RETURN cells;
+END;
+$$ LANGUAGE plpgsql;
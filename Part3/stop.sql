@@ -2,29 +2,62 @@ DROP TABLE IF EXISTS trip CASCADE;
 DROP TABLE IF EXISTS breadcrumb;
 DROP TABLE IF EXISTS stop_events;
 DROP VIEW IF EXISTS trip_full_view;
+DROP TABLE IF EXISTS trip_timeline;
+DROP TABLE IF EXISTS trip_staging, breadcrumb_staging, stop_events_staging;
+DROP TABLE IF EXISTS load_log;
+DROP TABLE IF EXISTS speed_stats, speed_stats_hourly;
+DROP TABLE IF EXISTS trip_route;
 
 -- 1. Trip table
 CREATE TABLE trip (
-    trip_id TEXT PRIMARY KEY,
-    route_id TEXT,
+    trip_id BIGINT PRIMARY KEY,
+    route_id INTEGER,
     vehicle_id TEXT,
     service_key TEXT,
     direction TEXT
 );
 
--- 2. Breadcrumb table
+-- 2. Breadcrumb table, one partition per month of tstamp
 CREATE TABLE breadcrumb (
-    trip_id TEXT,
+    trip_id BIGINT,
     tstamp TIMESTAMP,
     latitude FLOAT,
     longitude FLOAT,
-    speed FLOAT
-);
+    speed FLOAT,
+    -- natural key the loaders merge on (pipeline/bulkload.py); its b-tree
+    -- also serves trip_id lookups and per-trip time ranges
+    UNIQUE (trip_id, tstamp)
+) PARTITION BY RANGE (tstamp);
+
+-- rows with a NULL or unexpected tstamp land here instead of failing
+CREATE TABLE breadcrumb_default PARTITION OF breadcrumb DEFAULT;
+
+-- the loaders call this for every month in a batch before merging it
+CREATE OR REPLACE FUNCTION create_breadcrumb_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day);
+    partition_name TEXT := 'breadcrumb_' || to_char(day, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF breadcrumb FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + INTERVAL '1 month'
+        );
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- breadcrumbs arrive in time order, so a BRIN index on tstamp stays tiny;
+-- autosummarize lets autovacuum summarize newly filled page ranges, which
+-- otherwise match every query until the next VACUUM
+CREATE INDEX breadcrumb_tstamp_brin ON breadcrumb USING brin (tstamp) WITH (autosummarize = on);
+-- bounding-box filters: point(longitude, latitude) <@ box(...)
+CREATE INDEX breadcrumb_position_gist ON breadcrumb USING gist (point(longitude, latitude));
 
 -- 3. Stop Events table
 CREATE TABLE stop_events (
     vehicle_number TEXT,
-    trip_id TEXT,
+    trip_id BIGINT,
     stop_time TEXT,
     leave_time TEXT,
     arrive_time TEXT,
@@ -38,37 +71,23 @@ CREATE TABLE stop_events (
     lift TEXT,
     ons TEXT,
     offs TEXT,
-    estimated_load TEXT
+    estimated_load TEXT,
+    UNIQUE (trip_id, location_id, arrive_time)
 );
 
--- 4. SQL VIEW to integrate all data
-CREATE OR REPLACE VIEW trip_full_view AS
-SELECT
-    t.trip_id,
-    t.vehicle_id,
-    t.route_id,
-    t.service_key,
-    t.direction,
-
-    -- Breadcrumb data
-    b.tstamp,
-    b.latitude,
-    b.longitude,
-    b.speed,
-
-    -- Stop Events data
-    s.stop_time,
-    s.leave_time,
-    s.arrive_time,
-    s.location_id,
-    s.dwell,
-    s.ons,
-    s.offs,
-    s.estimated_load,
-    s.maximum_speed,
-    s.train_mileage,
-    s.lift
+-- 4. Load log: a row per service date each committed load added rows for
+-- (pipeline/bulkload.py), so cached query results (pipeline/querycache.py)
+-- know when a date they cover has changed. Safe to run on its own against
+-- an existing database.
+CREATE TABLE IF NOT EXISTS load_log (
+    id BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    service_date DATE NOT NULL,
+    rows INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+CREATE INDEX IF NOT EXISTS load_log_service_date ON load_log (service_date, id);
 
-FROM trip t
-LEFT JOIN breadcrumb b ON t.trip_id = b.trip_id
-LEFT JOIN stop_events s ON t.trip_id = s.trip_id;
+-- 5. trip_full_view is built on the trip_timeline table; run trip_timeline.sql next,
+-- then speed_stats.sql for the speed summary the loads keep current and
+-- trip_routes.sql for the trips' routes from their stop events
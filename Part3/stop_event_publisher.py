@@ -1,17 +1,31 @@
 import os
+import sys
 import json
-import requests
 import shutil
 import logging
 from datetime import date
 from google.cloud import pubsub_v1
 import pandas as pd
-import concurrent.futures
-from bs4 import BeautifulSoup
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.envelope import RecordBatcher, encode_record
+from pipeline.fetcher import VehicleFetcher, STOP_EVENT_URL
+from pipeline.gather import PipelinedGather
+from pipeline.metrics import start_exporter
+from pipeline.publishing import FlowControlledPublisher
+from pipeline.stop_pages import parse_stop_events
+from pipeline.watermark import WatermarkStore, page_service_date, stop_event_key
 
 
 class StopEventPublisher:
-    def __init__(self, project_id, topic_id, key_path, vehicle_file):
+    def __init__(self, project_id, topic_id, key_path, vehicle_file,
+                 batch_size=0, batch_linger=0.05, batch_compression=None,
+                 max_inflight_messages=1000, max_inflight_bytes=10 * 1024 * 1024,
+                 stats_interval=30, watermark_path="stop_event_state.sqlite",
+                 fetch_workers=16, parse_workers=2, queue_pages=4, stream=True,
+                 metrics_port=None, metrics_file=os.path.join("metrics", "stop_event_publisher.json"),
+                 metrics_interval=30):
         self.project_id = project_id
         self.topic_id = topic_id
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = key_path
@@ -21,58 +35,148 @@ class StopEventPublisher:
         self.topic_path = self.publisher.topic_path(project_id, topic_id)
         self.today_str = date.today().isoformat()
 
+        # opt-in multi-record messages, one trip's stop events per envelope;
+        # batch_size=0 keeps one message per stop event
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self.batch_compression = batch_compression
+
+        # cap on unacknowledged publishes; publishing blocks while it is reached
+        self.max_inflight_messages = max_inflight_messages
+        self.max_inflight_bytes = max_inflight_bytes
+        self.stats_interval = stats_interval
+
+        # per-vehicle ETag / page hash / arrive_time watermark kept between
+        # runs; None republishes every page in full
+        self.watermarks = WatermarkStore("stop_event", watermark_path) if watermark_path else None
+
+        # pages download on fetch_workers threads and parse in parse_workers
+        # processes (0 parses on the fetch thread); queue_pages bounds how far
+        # each stage may run ahead. stream publishes records as pages parse
+        # instead of staging them as JSON files first.
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.queue_pages = queue_pages
+        self.stream = stream
+        self.gather_stats = None
+
+        # a Prometheus endpoint on metrics_port and/or a JSON snapshot every
+        # metrics_interval seconds; None turns either off
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+
         logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s:%(message)s")
         self.logger = logging.getLogger(__name__)
 
-    def gather_data(self):
-        os.makedirs(self.output_folder, exist_ok=True)
+    def read_vehicle_ids(self):
         try:
             df = pd.read_csv(self.vehicle_file, header=None)
-            vehicle_ids = df[0].astype(str).str.strip().tolist()
+            return df[0].astype(str).str.strip().tolist()
         except Exception as e:
             self.logger.error(f"Failed to read vehicle_ids.csv: {e}")
+            return None
+
+    def iter_stop_events(self, vehicle_ids):
+        """Yield (vehicle_id, records) as each page is fetched and parsed."""
+        fetcher = VehicleFetcher(STOP_EVENT_URL, max_workers=self.fetch_workers, timeout=10,
+                                 headers={'User-Agent': 'Mozilla/5.0'})
+        accept, headers_for = None, None
+        if self.watermarks is not None:
+            headers_for = self.watermarks.request_headers
+            accept = lambda result: not self.watermarks.unchanged(
+                result.vehicle_id, result.status_code, result.text)
+        gather = PipelinedGather(fetcher, parse_stop_events, parse_workers=self.parse_workers,
+                                 queue_pages=self.queue_pages, accept=accept, name="stop-gather")
+        with fetcher:
+            for vid, result, records in gather.run(vehicle_ids, headers_for):
+                if self.watermarks is not None:
+                    key = stop_event_key(page_service_date(result.text, self.today_str))
+                    records, high = self.watermarks.filter_new(vid, records, key)
+                    self.watermarks.stage(vid, result.text, result.headers, high)
+                if not records:
+                    self.logger.debug(f"No new stop data for vehicle {vid}")
+                    continue
+                yield vid, records
+        self.gather_stats = gather.stats
+
+    def gather_data(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        vehicle_ids = self.read_vehicle_ids()
+        if vehicle_ids is None:
             return 0
 
         total_records = 0
-        for vid in vehicle_ids:
-            url = f"https://busdata.cs.pdx.edu/api/getStopEvents?vehicle_num={vid}"
+        for vid, records in self.iter_stop_events(vehicle_ids):
             try:
-                response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-                if response.status_code == 200 and "<table>" in response.text:
-                    records = self.parse_html(response.text)
-                    total_records += len(records)
-                    file_path = os.path.join(self.output_folder, f"stop_{vid}_{self.today_str}.json")
-                    with open(file_path, "w") as out:
-                        json.dump(records, out)
-                else:
-                    self.logger.warning(f"No stop data for vehicle {vid} - Status: {response.status_code}")
+                total_records += len(records)
+                file_path = os.path.join(self.output_folder, f"stop_{vid}_{self.today_str}.json")
+                with open(file_path, "w") as out:
+                    json.dump(records, out)
             except Exception as e:
                 self.logger.error(f"Error gathering stop data for vehicle {vid}: {e}")
 
         return total_records
 
     def parse_html(self, html_content):
-        soup = BeautifulSoup(html_content, 'html.parser')
-        table = soup.find("table")
-        if not table:
-            return []
-
-        rows = table.find_all("tr")
-        header = [th.text.strip() for th in rows[0].find_all("th")]
-        records = []
-
-        for row in rows[1:]:
-            cells = row.find_all("td")
-            if len(cells) != len(header):
-                continue
-            record = {header[i]: cells[i].text.strip() for i in range(len(cells))}
-            records.append(record)
+        # streams every per-trip table; no DOM is built
+        return parse_stop_events(html_content)
+
+    def make_flow(self):
+        return FlowControlledPublisher(
+            self.publisher, self.topic_path,
+            max_messages=self.max_inflight_messages, max_bytes=self.max_inflight_bytes,
+            report_interval=self.stats_interval, name="stop-publish"
+        )
+
+    def make_batcher(self, flow):
+        if not self.batch_size:
+            return None
+        return RecordBatcher(flow.publish, batch_size=self.batch_size,
+                             linger=self.batch_linger, compression=self.batch_compression)
+
+    def publish_records(self, records, flow, batcher=None):
+        if batcher is not None:
+            for record in records:
+                batcher.add(record, key=record.get("trip_number"))
+            batcher.flush(all_keys=True)
+            return len(records)
+
+        count = 0
+        for record in records:
+            count += 1
+            data = encode_record(record)
+            try:
+                flow.publish(data)
+            except Exception as e:
+                self.logger.error(f"Error publishing: {e}")
+        return count
+
+    def stream_data(self):
+        """Publish each page's stop events as soon as it is parsed; returns (gathered, published)."""
+        vehicle_ids = self.read_vehicle_ids()
+        if vehicle_ids is None:
+            return 0, 0
 
-        return records
+        gathered = 0
+        published = 0
+        flow = self.make_flow()
+        batcher = self.make_batcher(flow)
+        try:
+            for vid, records in self.iter_stop_events(vehicle_ids):
+                gathered += len(records)
+                published += self.publish_records(records, flow, batcher)
+        finally:
+            if batcher is not None:
+                batcher.close()
+
+        self.finish_watermarks(flow.close())
+        return gathered, published
 
     def publish_data(self):
         count = 0
-        futures_list = []
+        flow = self.make_flow()
+        batcher = self.make_batcher(flow)
         for filename in os.listdir(self.output_folder):
             if not filename.endswith(".json"):
                 continue
@@ -84,29 +188,51 @@ class StopEventPublisher:
                 self.logger.error(f"Error reading JSON {file_path}: {e}")
                 continue
 
-            for record in records:
-                count += 1
-                data = json.dumps(record).encode("utf-8")
-                try:
-                    future = self.publisher.publish(self.topic_path, data)
-                    future.add_done_callback(lambda f: f.result())
-                    futures_list.append(future)
-                except Exception as e:
-                    self.logger.error(f"Error publishing: {e}")
-
+            count += self.publish_records(records, flow, batcher)
             os.remove(file_path)
 
-        for future in concurrent.futures.as_completed(futures_list):
-            continue
+        if batcher is not None:
+            batcher.close()
+
+        # wait for the in-flight publishes and any retries to finish
+        self.finish_watermarks(flow.close())
 
         return count
 
+    def finish_watermarks(self, publish_stats):
+        """Advance the watermarks only once every publish of the run was acked."""
+        if self.watermarks is None:
+            return
+        if publish_stats["failed"]:
+            self.watermarks.discard()
+        else:
+            self.watermarks.commit()
+        self.logger.info(f"[watermark] {self.watermarks.summary()}")
+
     def run(self):
-        gathered = self.gather_data()
-        print(f"Total stop events gathered: {gathered}")
-        published = self.publish_data()
-        print(f"Total stop events published: {published}")
-        shutil.rmtree(self.output_folder, ignore_errors=True)
+        exporter = start_exporter(self.metrics_port, self.metrics_file, self.metrics_interval)
+        try:
+            self._run()
+        finally:
+            exporter.close()
+
+    def _run(self):
+        try:
+            if self.stream:
+                gathered, published = self.stream_data()
+                print(f"Total stop events gathered: {gathered}")
+                print(f"Total stop events published: {published}")
+                return
+
+            gathered = self.gather_data()
+            print(f"Total stop events gathered: {gathered}")
+            published = self.publish_data()
+            print(f"Total stop events published: {published}")
+            shutil.rmtree(self.output_folder, ignore_errors=True)
+        finally:
+            # committed or discarded by finish_watermarks; closed even if a stage raised
+            if self.watermarks is not None:
+                self.watermarks.close()
 
 
 if __name__ == "__main__":
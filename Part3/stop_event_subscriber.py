@@ -1,23 +1,43 @@
-import json
-import pandas as pd
+import os
+import sys
 import psycopg2
-from io import StringIO
 from google.cloud import pubsub_v1
 
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.bulkload import merge_frame, replay_spilled, spill_frame
+from pipeline.columnar import stop_event_buffer
+from pipeline.envelope import decode_message
+from pipeline.metrics import start_exporter
+from pipeline.microbatch import BUFFERED_RECORDS
+from pipeline.routes import index_routes
+from pipeline.timeline import refresh_trips
+from pipeline.validation import STOP_EVENT_COLUMNS, STOP_EVENT_RULES, cast_stop_events, validate, report
+
 
 class StopEventSubscriber:
-    def __init__(self, project_id, subscription_id, db_config):
+    def __init__(self, project_id, subscription_id, db_config,
+                 metrics_port=None, metrics_file=os.path.join("metrics", "stop_event_subscriber.json"),
+                 metrics_interval=30):
         self.project_id = project_id
         self.subscription_id = subscription_id
         self.db_config = db_config
         self.subscriber = pubsub_v1.SubscriberClient()
         self.subscription_path = self.subscriber.subscription_path(project_id, subscription_id)
-        self.json_list = []
+        # decoded fields go straight into typed column arrays
+        self.buffer = stop_event_buffer()
+
+        # a Prometheus endpoint on metrics_port and/or a JSON snapshot every
+        # metrics_interval seconds; None turns either off
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
 
     def callback(self, message: pubsub_v1.subscriber.message.Message):
         try:
-            json_message = json.loads(message.data.decode('utf-8'))
-            self.json_list.append(json_message)
+            # handles both single-record and batched envelope messages
+            self.buffer.extend(decode_message(message, self.buffer.schema))
+            BUFFERED_RECORDS.set(len(self.buffer), subscriber="stop_event_subscriber")
         except Exception as e:
             print(f"[callback] error decoding message: {e}")
         finally:
@@ -33,135 +53,64 @@ class StopEventSubscriber:
                 print(f"[Pub/Sub] streaming pull terminated: {e}")
                 streaming_pull.cancel()
 
-    def validate_row(self, row):
-        try:
-            self.validate_vehicle_number(row)
-            self.validate_stop_time(row)
-            self.validate_maximum_speed(row)
-            self.validate_direction(row)
-            self.validate_trip_number(row)
-            self.validate_service_key(row)
-            self.validate_arrive_before_leave(row)
-            self.validate_estimated_load(row)
-            self.validate_dwell(row)
-            self.validate_location_id(row)
-            return True
-        except:
-            return False
-
-    def validate_vehicle_number(self, row):
-        try:
-            assert row["vehicle_number"].isdigit()
-        except:
-            raise
-
-    def validate_stop_time(self, row):
-        try:
-            assert row["stop_time"] not in (None, "", " ")
-        except:
-            raise
-
-    def validate_maximum_speed(self, row):
-        try:
-            speed = float(row.get("maximum_speed", 0))
-            assert 0 <= speed <= 70
-        except:
-            raise
-
-    def validate_direction(self, row):
-        try:
-            assert row["direction"] in ["0", "1"]
-        except:
-            raise
-
-    def validate_trip_number(self, row):
-        try:
-            assert row["trip_number"].isdigit()
-        except:
-            raise
-
-    def validate_service_key(self, row):
-        try:
-            assert row["service_key"] in ["W", "S", "U"]
-        except:
-            raise
-
-    def validate_arrive_before_leave(self, row):
-        try:
-            assert row["arrive_time"] <= row["leave_time"]
-        except:
-            raise
-
-    def validate_estimated_load(self, row):
-        try:
-            assert row["estimated_load"] in ["", "low", "medium", "high"]
-        except:
-            raise
-
-    def validate_dwell(self, row):
-        try:
-            assert int(row["dwell"]) >= 0
-        except:
-            raise
-
-    def validate_location_id(self, row):
-        try:
-            assert row["location_id"].isdigit()
-        except:
-            raise
-
     def load_to_postgres(self, table_name):
-        df = pd.DataFrame(self.json_list)
+        df = self.buffer.take_frame()
         if df.empty:
             print("No messages received.")
             return
 
         print(f"Received {len(df)} stop events")
 
-        expected_columns = [
-            'vehicle_number', 'leave_time', 'train', 'route_number', 'direction',
-            'service_key', 'trip_number', 'stop_time', 'arrive_time', 'dwell',
-            'location_id', 'door', 'lift', 'ons', 'offs', 'estimated_load',
-            'maximum_speed', 'train_mileage', 'pattern_distance', 'location_distance',
-            'x_coordinate', 'y_coordinate', 'data_source', 'schedule_status'
-        ]
-
         try:
-            df = df[expected_columns]
+            df = df[STOP_EVENT_COLUMNS]
         except KeyError as e:
             print(f"Missing columns in incoming data: {e}")
             return
 
-        valid_rows = []
-        for _, row in df.iterrows():
-            row_dict = row.to_dict()
-            if self.validate_row(row_dict):
-                valid_rows.append(row_dict)
-
-        if not valid_rows:
+        # cast once, then every rule is a column mask
+        result = validate(df, STOP_EVENT_RULES, typed=cast_stop_events(df))
+        report(result, label="stop_events")
+        if result.valid.empty:
             print("No valid records after validation.")
             return
 
-        valid_df = pd.DataFrame(valid_rows)
+        valid_df = result.valid
         conn = psycopg2.connect(**self.db_config)
-        buffer = StringIO()
-        valid_df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
+        # batches that failed on earlier runs go in first
+        replay_spilled(conn)
         cursor = conn.cursor()
         try:
-            cursor.copy_from(buffer, table_name, sep=",")
+            # maps the 24 page fields onto the 16 stop_events columns; events
+            # already loaded by an earlier run are skipped
+            stats = merge_frame(cursor, valid_df, table_name)
+            # index these trips' routes and fill in any already loaded
+            indexed, routed = index_routes(cursor, valid_df['trip_number'])
             conn.commit()
-            print(f"Loaded {table_name} with {len(valid_df)} validated rows")
         except Exception as e:
             print(f"Error loading {table_name}: {e}")
             conn.rollback()
+            spill_frame(valid_df, table_name)
+            conn.close()
+            return
         finally:
             cursor.close()
+        print(f"Loaded {table_name} with {stats.merged} new of {len(valid_df)} validated rows")
+        print(f"[routes] {indexed} trips indexed, {routed} loaded trips routed")
+        # re-match these trips' breadcrumbs to their stops; the events are
+        # committed by now, so a failure here must not spill them again
+        try:
+            refresh_trips(conn, valid_df['trip_number'])
+        finally:
             conn.close()
 
     def run(self):
-        self.listen()
-        self.load_to_postgres("stop_events")
+        exporter = start_exporter(self.metrics_port, self.metrics_file, self.metrics_interval)
+        try:
+            self.listen()
+            self.load_to_postgres("stop_events")
+            BUFFERED_RECORDS.set(0, subscriber="stop_event_subscriber")
+        finally:
+            exporter.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+-- Trip routes: the route, direction and service key of each trip, taken
+-- from its stop events, since the breadcrumb feed carries none of them.
+-- Run after stop.sql:
+--   psql -d trimet_data -f stop.sql -f trip_timeline.sql -f speed_stats.sql -f trip_routes.sql
+-- The stop-event loader indexes the trips of every batch it loads
+-- (index_trip_routes) and fills in those trips where they are already
+-- loaded; the breadcrumb loaders apply the index to the trips they load
+-- (apply_trip_routes), so whichever feed arrives first, a trip gets its
+-- route once both have. For a database loaded before this file:
+--   SELECT index_trip_routes(ARRAY(SELECT DISTINCT trip_id FROM stop_events));
+--   SELECT apply_trip_routes();
+-- Trips whose route changes are recorded in load_log under the date of
+-- their first breadcrumb, so cached query results filtered on route
+-- (pipeline/querycache.py) are refreshed.
+
+CREATE TABLE IF NOT EXISTS trip_route (
+    trip_id BIGINT PRIMARY KEY,
+    route_id INTEGER,
+    direction TEXT,
+    service_key TEXT
+);
+
+-- Copy trip_route onto the given trips (all trips if NULL) where it differs;
+-- returns the trips changed.
+CREATE OR REPLACE FUNCTION apply_trip_routes(trip_ids BIGINT[] DEFAULT NULL)
+RETURNS BIGINT AS $$
+DECLARE
+    changed_trips BIGINT;
+BEGIN
+    WITH changed AS (
+        UPDATE trip t
+        SET route_id = r.route_id,
+            direction = r.direction,
+            service_key = coalesce(r.service_key, t.service_key)
+        FROM trip_route r
+        WHERE r.trip_id = t.trip_id
+          AND (trip_ids IS NULL OR t.trip_id = ANY(trip_ids))
+          AND (t.route_id, t.direction, t.service_key)
+              IS DISTINCT FROM (r.route_id, r.direction, coalesce(r.service_key, t.service_key))
+        RETURNING t.trip_id
+    ), days AS (
+        SELECT (SELECT min(b.tstamp)::date FROM breadcrumb b WHERE b.trip_id = c.trip_id) AS day
+        FROM changed c
+    ), logged AS (
+        INSERT INTO load_log (table_name, service_date, rows)
+        SELECT 'trip', day, count(*) FROM days WHERE day IS NOT NULL GROUP BY day
+    )
+    SELECT count(*) INTO changed_trips FROM changed;
+    RETURN changed_trips;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Index the given trips from their stop events: the most common route,
+-- direction (0 out, 1 back) and service key (W, S, U, as the breadcrumb
+-- loaders name days) of each; returns the trips added or changed.
+CREATE OR REPLACE FUNCTION index_trip_routes(trip_ids BIGINT[])
+RETURNS BIGINT AS $$
+    WITH indexed AS (
+        INSERT INTO trip_route AS r (trip_id, route_id, direction, service_key)
+        SELECT trip_id,
+               (mode() WITHIN GROUP (ORDER BY route_id) FILTER (WHERE route_id ~ '^[0-9]{1,9}$'))::integer,
+               CASE mode() WITHIN GROUP (ORDER BY direction) WHEN '0' THEN 'Out' WHEN '1' THEN 'Back' END,
+               CASE mode() WITHIN GROUP (ORDER BY service_key)
+                   WHEN 'W' THEN 'Weekday' WHEN 'S' THEN 'Saturday' WHEN 'U' THEN 'Sunday' END
+        FROM stop_events
+        WHERE trip_id = ANY(trip_ids)
+        GROUP BY trip_id
+        ORDER BY trip_id
+        ON CONFLICT (trip_id) DO UPDATE SET
+            route_id = EXCLUDED.route_id,
+            direction = EXCLUDED.direction,
+            service_key = EXCLUDED.service_key
+        WHERE (r.route_id, r.direction, r.service_key)
+              IS DISTINCT FROM (EXCLUDED.route_id, EXCLUDED.direction, EXCLUDED.service_key)
+        RETURNING 1
+    )
+    SELECT count(*) FROM indexed
+$$ LANGUAGE sql;
@@ -0,0 +1,119 @@
+-- Trip timeline: every breadcrumb with its trip and the stop event nearest
+-- to it in time, replacing the trip_full_view cross product (every
+-- breadcrumb x every stop of the trip). Run after stop.sql:
+--   psql -d trimet_data -f stop.sql -f trip_timeline.sql
+-- The loaders keep it current by calling refresh_trip_timeline_trips() for
+-- the trips each batch touched (pipeline/timeline.py); a whole service day
+-- is rebuilt with SELECT refresh_trip_timeline('2023-01-15').
+
+DROP VIEW IF EXISTS trip_full_view;
+
+-- stop-event times are seconds after midnight of the service day, stored as text
+CREATE OR REPLACE FUNCTION stop_seconds(t TEXT) RETURNS INTEGER AS $$
+    SELECT CASE WHEN t ~ '^[0-9]{1,6}$' THEN t::integer END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- the as-of lookups below probe this once or twice per breadcrumb
+CREATE INDEX IF NOT EXISTS stop_events_trip_arrive ON stop_events (trip_id, stop_seconds(arrive_time));
+
+CREATE TABLE IF NOT EXISTS trip_timeline (
+    trip_id BIGINT NOT NULL,
+    service_date DATE NOT NULL,
+    route_id INTEGER,
+    vehicle_id TEXT,
+    service_key TEXT,
+    direction TEXT,
+
+    -- Breadcrumb data
+    tstamp TIMESTAMP NOT NULL,
+    latitude FLOAT,
+    longitude FLOAT,
+    speed FLOAT,
+
+    -- nearest stop event by time; stop_offset is arrive_time minus the
+    -- breadcrumb's time of day in seconds (negative: the stop is behind)
+    location_id TEXT,
+    stop_time TEXT,
+    arrive_time TEXT,
+    leave_time TEXT,
+    stop_offset INTEGER,
+    dwell TEXT,
+    ons TEXT,
+    offs TEXT,
+    estimated_load TEXT,
+    maximum_speed TEXT,
+    train_mileage TEXT,
+    lift TEXT,
+
+    PRIMARY KEY (trip_id, tstamp)
+);
+CREATE INDEX IF NOT EXISTS trip_timeline_service_date ON trip_timeline (service_date);
+CREATE INDEX IF NOT EXISTS trip_timeline_route ON trip_timeline (route_id, service_date);
+
+-- Rebuild one service day, or only the given trips of it.
+CREATE OR REPLACE FUNCTION refresh_trip_timeline(day DATE, trip_ids BIGINT[] DEFAULT NULL)
+RETURNS BIGINT AS $$
+DECLARE
+    inserted BIGINT;
+BEGIN
+    DELETE FROM trip_timeline
+    WHERE service_date = day
+      AND (trip_ids IS NULL OR trip_id = ANY(trip_ids));
+
+    INSERT INTO trip_timeline
+    SELECT
+        b.trip_id, day, t.route_id, t.vehicle_id, t.service_key, t.direction,
+        b.tstamp, b.latitude, b.longitude, b.speed,
+        s.location_id, s.stop_time, s.arrive_time, s.leave_time,
+        s.arrive_seconds - b.seconds,
+        s.dwell, s.ons, s.offs, s.estimated_load, s.maximum_speed, s.train_mileage, s.lift
+    FROM (
+        SELECT bc.*, extract(epoch FROM bc.tstamp - day)::integer AS seconds
+        FROM breadcrumb bc
+        WHERE bc.tstamp >= day AND bc.tstamp < day + 1
+          AND (trip_ids IS NULL OR bc.trip_id = ANY(trip_ids))
+    ) b
+    LEFT JOIN trip t ON t.trip_id = b.trip_id
+    -- as-of join: the last stop at or before the breadcrumb and the first
+    -- one after it, each a single index probe; keep the closer of the two
+    LEFT JOIN LATERAL (
+        SELECT * FROM (
+            (SELECT se.*, stop_seconds(se.arrive_time) AS arrive_seconds
+             FROM stop_events se
+             WHERE se.trip_id = b.trip_id AND stop_seconds(se.arrive_time) <= b.seconds
+             ORDER BY stop_seconds(se.arrive_time) DESC LIMIT 1)
+            UNION ALL
+            (SELECT se.*, stop_seconds(se.arrive_time) AS arrive_seconds
+             FROM stop_events se
+             WHERE se.trip_id = b.trip_id AND stop_seconds(se.arrive_time) > b.seconds
+             ORDER BY stop_seconds(se.arrive_time) LIMIT 1)
+        ) candidates
+        ORDER BY abs(arrive_seconds - b.seconds), arrive_seconds
+        LIMIT 1
+    ) s ON true
+    ON CONFLICT (trip_id, tstamp) DO NOTHING;
+
+    GET DIAGNOSTICS inserted = ROW_COUNT;
+    RETURN inserted;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Refresh the given trips on every service day they have breadcrumbs for.
+CREATE OR REPLACE FUNCTION refresh_trip_timeline_trips(trip_ids BIGINT[])
+RETURNS BIGINT AS $$
+    SELECT coalesce(sum(refresh_trip_timeline(day, trip_ids)), 0)::bigint
+    FROM (
+        SELECT DISTINCT tstamp::date AS day
+        FROM breadcrumb
+        WHERE trip_id = ANY(trip_ids) AND tstamp IS NOT NULL
+    ) days
+$$ LANGUAGE sql;
+
+-- same name and columns as before, now one row per breadcrumb
+CREATE OR REPLACE VIEW trip_full_view AS
+SELECT
+    trip_id, vehicle_id, route_id, service_key, direction,
+    tstamp, latitude, longitude, speed,
+    stop_time, leave_time, arrive_time, location_id, dwell, ons, offs,
+    estimated_load, maximum_speed, train_mileage, lift
+FROM trip_timeline;
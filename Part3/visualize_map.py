@@ -1,57 +1,94 @@
-import psycopg2
-import pandas as pd
-import folium
-from folium.plugins import MarkerCluster
-
-conn = psycopg2.connect(
-    host="localhost",
-    database="trimet_data",
-    user="srilakshmi",
-    password="####"
-)
-
-query = """
-SELECT 
-    t.trip_id,
-    t.vehicle_id,
-    t.route_id,
-    t.service_key,
-    b.tstamp,
-    b.latitude,
-    b.longitude,
-    b.speed
-FROM trip t
-JOIN breadcrumb b ON t.trip_id = b.trip_id
-WHERE b.latitude IS NOT NULL AND b.longitude IS NOT NULL
-ORDER BY t.trip_id, b.tstamp;
+"""Every trip in a date range as a line, with its start and end.
+
+The range and routes are filtered in SQL, so only the breadcrumbs wanted
+leave Postgres, already in trip order. Each trip's line is simplified to
+within --tolerance meters of its breadcrumbs (pipeline/maps.py), so a
+full week stays a map a browser can open.
+
+    python visualize_map.py --start 2023-01-15 --end 2023-01-22
+    python visualize_map.py --date 2023-01-26 --routes 20,35 --tolerance 5
 """
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import psycopg2
+
+# shared pipeline modules live at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import maps
+from pipeline.querycache import CACHE_FOLDER, QueryCache, dates_between
+
+DB_CONFIG = {
+    "host": "localhost",
+    "database": "trimet_data",
+    "user": "srilakshmi",
+    "password": "####",
+}
+OUTPUT_FILE = "breadcrumb_visualization.html"
+
+
+def trips_query(start=None, end=None, routes=None):
+    """SQL and parameters for the trips' breadcrumbs in trip order; open ends are unbounded."""
+    where, params = ["b.latitude IS NOT NULL", "b.longitude IS NOT NULL"], {}
+    if start is not None:
+        where.append("b.tstamp >= %(start)s")
+        params["start"] = start
+    if end is not None:
+        where.append("b.tstamp < %(end)s")
+        params["end"] = end
+    if routes:
+        where.append("t.route_id = ANY(%(routes)s)")
+        params["routes"] = list(routes)
+    query = f"""
+    SELECT t.trip_id, t.route_id, b.latitude, b.longitude
+    FROM trip t
+    JOIN breadcrumb b ON t.trip_id = b.trip_id
+    WHERE {' AND '.join(where)}
+    ORDER BY t.trip_id, b.tstamp
+    """
+    return query, params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--date", help="one service day (YYYY-MM-DD)")
+    parser.add_argument("--start", help="first day or timestamp, default the oldest breadcrumb")
+    parser.add_argument("--end", help="end (exclusive), default the newest breadcrumb")
+    parser.add_argument("--routes", type=lambda s: [int(r) for r in s.split(",")], help="comma-separated route ids")
+    parser.add_argument("--tolerance", type=float, default=maps.TOLERANCE_METERS,
+                        help="meters a simplified line may stray from the breadcrumbs (0 keeps every point)")
+    parser.add_argument("--no-markers", action="store_true", help="leave out the start / end markers")
+    parser.add_argument("--out", default=OUTPUT_FILE)
+    parser.add_argument("--dsn", help="libpq connection string instead of DB_CONFIG")
+    parser.add_argument("--cache", default=CACHE_FOLDER, help="query cache folder")
+    parser.add_argument("--no-cache", action="store_true", help="always query Postgres")
+    args = parser.parse_args()
+
+    start = datetime.fromisoformat(args.start) if args.start else None
+    end = datetime.fromisoformat(args.end) if args.end else None
+    if args.date:
+        start = datetime.fromisoformat(args.date)
+        end = start + timedelta(days=1)
+
+    query, params = trips_query(start, end, args.routes)
+    cache = QueryCache(args.cache, enabled=not args.no_cache)
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    try:
+        df = cache.read(conn, query, params, dates_between(start, end))
+    finally:
+        conn.close()
+
+    simplified = maps.simplify_tracks(df, args.tolerance)
+    m = maps.tracks_map(simplified, 0, markers=not args.no_markers)
+    if m is None:
+        print("No breadcrumb data found.")
+        return
+    m.save(args.out)
+    print(f"Map of {df['trip_id'].nunique()} trips saved as {args.out} "
+          f"({len(simplified)} of {len(df)} points at {args.tolerance:g} m)")
+
 
-df = pd.read_sql_query(query, conn)
-conn.close()
-
-if df.empty:
-    print("No breadcrumb data found.")
-    exit()
-
-center_lat = df['latitude'].astype(float).mean()
-center_lon = df['longitude'].astype(float).mean()
-m = folium.Map(location=[center_lat, center_lon], zoom_start=12)
-
-for trip_id, trip_data in df.groupby("trip_id"):
-    trip_data = trip_data.sort_values("tstamp")
-    coordinates = trip_data[['latitude', 'longitude']].astype(float).values.tolist()
-    
-    folium.PolyLine(
-        locations=coordinates,
-        color="blue",
-        weight=3,
-        opacity=0.7,
-        tooltip=f"Trip: {trip_id}"
-    ).add_to(m)
-
-    if len(coordinates) > 1:
-        folium.Marker(coordinates[0], popup="Start", icon=folium.Icon(color="green")).add_to(m)
-        folium.Marker(coordinates[-1], popup="End", icon=folium.Icon(color="red")).add_to(m)
-
-m.save("breadcrumb_visualization.html")
-print(" Map saved as breadcrumb_visualization.html")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Daily archive as zipped per-vehicle JSON vs partitioned Parquet.
+
+Writes --days service dates of synthetic breadcrumbs (--vehicles vehicles,
+--records each) once as data_gather.py's zip archives (one
+bus_data_<date>.zip of raw JSON per day) and once through
+ParquetArchiveWriter, then reports:
+
+* bytes on disk and write time
+* a full read of every day back into a breadcrumb frame
+* selective reads: one vehicle on one day, and one trip (a row filter)
+* reloading the whole range the way a backfill does: day by day through
+  ``transform_breadcrumbs``
+
+and checks both formats give the same frame. With --dsn the Parquet range
+is also backfilled into a scratch schema with Part2/backfill_archive.py
+(transform, validation, merge and timeline refresh).
+
+    python benchmarks/bench_archive.py --days 30 --vehicles 100 --records 2000 \\
+        --dsn "host=/tmp/pgdata dbname=bench user=postgres"
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+from pipeline.archive import BreadcrumbArchive, ParquetArchiveWriter
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.transform import transform_breadcrumbs
+from synthetic import breadcrumb_records
+
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", "stop.sql"), os.path.join(ROOT, "Part3", "trip_timeline.sql")]
+SCHEMA = "bench_archive"
+FIRST_DAY = date(2023, 1, 1)
+
+
+def opd_date(day):
+    return day.strftime("%d%b%Y").upper() + ":00:00:00"
+
+
+def days_of(n):
+    return [FIRST_DAY + timedelta(days=i) for i in range(n)]
+
+
+def payloads(day, vehicles, records):
+    offset = (day - FIRST_DAY).days * 1000000
+    for vid in vehicles:
+        # a different seed per day, so days don't compress against each other
+        recs = breadcrumb_records(vid, records, opd_date=opd_date(day), seed=vid * 1000 + day.toordinal())
+        for r in recs:
+            # and new trip numbers every day, as the real feed has
+            r["EVENT_NO_TRIP"] += offset
+        yield vid, recs
+
+
+def folder_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def write_zip(folder, days, vehicles, records):
+    for day in days:
+        with zipfile.ZipFile(os.path.join(folder, f"bus_data_{day}.zip"), "w",
+                             compression=zipfile.ZIP_DEFLATED) as zf:
+            for vid, recs in payloads(day, vehicles, records):
+                zf.writestr(f"bus_{vid}_{day}.json", json.dumps(recs))
+
+
+def write_parquet(folder, days, vehicles, records):
+    with ParquetArchiveWriter(folder, "bench") as writer:
+        for day in days:
+            for vid, recs in payloads(day, vehicles, records):
+                writer.add(vid, recs)
+
+
+def read_zip_day(folder, day, vehicles=None):
+    # everything in the day's zip is inflated and parsed, whatever is wanted
+    buffer = breadcrumb_buffer()
+    with zipfile.ZipFile(os.path.join(folder, f"bus_data_{day}.zip")) as zf:
+        for name in zf.namelist():
+            records = json.loads(zf.read(name))
+            if vehicles is not None:
+                records = [r for r in records if r.get("VEHICLE_ID") in vehicles]
+            buffer.extend(records)
+    return buffer.take_frame()
+
+
+def read_zip(folder, days, vehicles=None, trip=None):
+    df = pd.concat([read_zip_day(folder, day, vehicles) for day in days], ignore_index=True)
+    if trip is not None:
+        df = df[df["EVENT_NO_TRIP"] == trip].reset_index(drop=True)
+    return df
+
+
+def reload_zip(folder, days):
+    return sum(len(transform_breadcrumbs(read_zip_day(folder, day))) for day in days)
+
+
+def reload_parquet(archive):
+    return sum(len(transform_breadcrumbs(df)) for _, df in archive.iter_days())
+
+
+def same(a, b):
+    key = ["EVENT_NO_TRIP", "ACT_TIME", "VEHICLE_ID"]
+    a = a.sort_values(key).reset_index(drop=True)
+    b = b.sort_values(key).reset_index(drop=True)[list(a.columns)]
+    pd.testing.assert_frame_equal(a, b, check_dtype=False)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def backfill(dsn, archive_root):
+    import psycopg2
+    sys.path.append(os.path.join(ROOT, "Part2"))
+    import updated_subscriber
+    from backfill_archive import backfill as run_backfill
+    updated_subscriber.REJECTED_FOLDER = None
+
+    conn = psycopg2.connect(dsn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        for path in SCHEMA_FILES:
+            with open(path) as f:
+                cursor.execute(f.read())
+        conn.commit()
+        seconds, (rows, trips, breadcrumbs) = timed(run_backfill, conn, BreadcrumbArchive(archive_root))
+        print(f"\nbackfill: {rows} rows -> {trips} trips, {breadcrumbs} breadcrumbs in {seconds:.1f}s "
+              f"({rows / seconds:,.0f} rows/s)")
+        seconds, again = timed(run_backfill, conn, BreadcrumbArchive(archive_root))
+        print(f"backfill again: {again[1]} new trips, {again[2]} new breadcrumbs in {seconds:.1f}s")
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--records", type=int, default=2000, help="breadcrumbs per vehicle and day")
+    parser.add_argument("--dsn", help="also backfill the Parquet archive into a scratch schema")
+    args = parser.parse_args()
+
+    days = days_of(args.days)
+    vehicles = list(range(2900, 2900 + args.vehicles))
+    work = tempfile.mkdtemp(prefix="bench_archive_")
+    zip_folder = os.path.join(work, "zip")
+    parquet_folder = os.path.join(work, "parquet")
+    os.makedirs(zip_folder)
+    try:
+        rows = args.days * args.vehicles * args.records
+        print(f"{args.days} days x {args.vehicles} vehicles x {args.records} breadcrumbs = {rows} rows")
+        zip_write, _ = timed(write_zip, zip_folder, days, vehicles, args.records)
+        parquet_write, _ = timed(write_parquet, parquet_folder, days, vehicles, args.records)
+        archive = BreadcrumbArchive(parquet_folder)
+
+        vid, day = vehicles[len(vehicles) // 2], days[len(days) // 2]
+        trip = 228000000 + vid * 100 + 1 + (day - FIRST_DAY).days * 1000000
+        zip_full, zip_df = timed(read_zip, zip_folder, days)
+        parquet_full, parquet_df = timed(archive.read)
+        same(zip_df, parquet_df)
+        zip_vehicle, zip_one = timed(read_zip, zip_folder, [day], {vid})
+        parquet_vehicle, parquet_one = timed(archive.read, None, day, day, [vid])
+        same(zip_one, parquet_one)
+        zip_trip, zip_t = timed(read_zip, zip_folder, days, None, trip)
+        parquet_trip, parquet_t = timed(archive.read, None, None, None, None, ds.field("EVENT_NO_TRIP") == trip)
+        same(zip_t, parquet_t)
+        zip_reload, zip_rows = timed(reload_zip, zip_folder, days)
+        parquet_reload, parquet_rows = timed(reload_parquet, archive)
+        assert zip_rows == parquet_rows == rows, (zip_rows, parquet_rows, rows)
+
+        print(f"\n{'':28s} {'zip json':>10s} {'parquet':>10s}")
+        print(f"{'MB on disk':28s} {folder_bytes(zip_folder) / 1e6:10.1f} {folder_bytes(parquet_folder) / 1e6:10.1f}")
+        for label, old, new in (
+            ("write s", zip_write, parquet_write),
+            ("full read s", zip_full, parquet_full),
+            ("one vehicle, one day s", zip_vehicle, parquet_vehicle),
+            (f"one trip ({len(parquet_t)} rows) s", zip_trip, parquet_trip),
+            ("reload + transform s", zip_reload, parquet_reload),
+        ):
+            print(f"{label:28s} {old:10.3f} {new:10.3f}   {old / max(new, 1e-9):5.1f}x")
+        print("frames identical")
+
+        if args.dsn:
+            backfill(args.dsn, parquet_folder)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
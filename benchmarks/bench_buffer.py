@@ -0,0 +1,92 @@
+"""List of dicts + pd.DataFrame vs the typed ColumnBuffer, for subscriber buffering.
+
+Decodes the same Pub/Sub payloads the way a subscriber callback does, once
+appending the records to a list and building the frame with
+``pd.DataFrame(json_list)``, once extending a ``breadcrumb_buffer()`` and
+calling ``take_frame()``. Reports the time, the memory held by the buffer
+once every message is in (what a subscriber carries while it listens) and
+the peak through the DataFrame conversion (tracemalloc), and checks both
+frames are equal.
+
+    python benchmarks/bench_buffer.py --records 1000000 --batch-size 0
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.envelope import decode_records, encode_batch
+from synthetic import breadcrumb_records
+
+
+def make_messages(n_records, batch_size):
+    records = []
+    vid = 2900
+    while len(records) < n_records:
+        records.extend(breadcrumb_records(vid, min(5000, n_records - len(records))))
+        vid += 1
+    if not batch_size:
+        # the legacy format: one JSON record per message, no attributes
+        return [json.dumps(r).encode("utf-8") for r in records], {}
+    messages = [encode_batch(records[i:i + batch_size])[0] for i in range(0, len(records), batch_size)]
+    return messages, {"envelope": "batch-v1"}
+
+
+def list_of_dicts(messages, attributes):
+    json_list = []
+    for data in messages:
+        json_list.extend(decode_records(data, attributes))
+    held = tracemalloc.get_traced_memory()[0]
+    return pd.DataFrame(json_list), held
+
+
+def column_buffer(messages, attributes):
+    buffer = breadcrumb_buffer()
+    for data in messages:
+        buffer.extend(decode_records(data, attributes))
+    held = tracemalloc.get_traced_memory()[0]
+    return buffer.take_frame(), held
+
+
+def measure(label, collect, messages, attributes):
+    gc.collect()
+    start = time.perf_counter()
+    collect(messages, attributes)
+    seconds = time.perf_counter() - start
+
+    # second pass under tracemalloc, which slows allocation-heavy code down
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    df, held = collect(messages, attributes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:16s} {len(df):>9} rows {seconds:7.2f}s {len(df) / seconds:>10,.0f} rows/s  "
+          f"buffer {(held - base) / 1e6:7.1f} MB  peak {(peak - base) / 1e6:7.1f} MB  "
+          f"({(held - base) / max(1, len(df)):.0f} bytes/row held)")
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=0, help="records per envelope (0 = one per message)")
+    args = parser.parse_args()
+
+    messages, attributes = make_messages(args.records, args.batch_size)
+    print(f"{len(messages)} messages, {sum(len(m) for m in messages) / 1e6:.1f} MB of payload")
+    old = measure("list of dicts", list_of_dicts, messages, attributes)
+    new = measure("column buffer", column_buffer, messages, attributes)
+    pd.testing.assert_frame_equal(old, new)
+    print("frames identical")
+
+
+if __name__ == "__main__":
+    main()
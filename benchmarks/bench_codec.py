@@ -0,0 +1,123 @@
+"""Message encode/decode per codec: stdlib json vs orjson vs msgspec structs.
+
+For every installed codec, times (best of --repeat) encoding the records
+into messages (as the publishers do), decoding them to dicts, and the subscriber path:
+decoding with the breadcrumb / stop-event schema into a ColumnBuffer and
+taking the frame. Payloads are synthetic records shaped like the API
+output, one per message and in batch envelopes.
+
+Before timing, the validation fixtures (which hold missing fields, strings
+in numeric fields and other junk) go through every codec's subscriber path
+and must produce the same frame as stdlib json.
+
+    python benchmarks/bench_codec.py --records 200000 --batch-size 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import codec as codecs
+from pipeline.columnar import BREADCRUMB_SCHEMA, STOP_EVENT_SCHEMA, ColumnBuffer
+from pipeline.envelope import ENVELOPE_VERSION, decode_records
+from synthetic import breadcrumb_records, stop_event_rows
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BATCH = {"envelope": ENVELOPE_VERSION}
+
+
+def encode(records, batch_size):
+    codec = codecs.default_codec()
+    if not batch_size:
+        return [codec.encode(r) for r in records]
+    return [codec.encode(records[i:i + batch_size]) for i in range(0, len(records), batch_size)]
+
+
+def subscribe(messages, attributes, schema):
+    buffer = ColumnBuffer(schema)
+    for data in messages:
+        buffer.extend(decode_records(data, attributes, schema))
+    return buffer.take_frame()
+
+
+def check_fixtures(names):
+    for fixture, schema in (("breadcrumbs_validation.json", BREADCRUMB_SCHEMA),
+                            ("stop_events_validation.json", STOP_EVENT_SCHEMA)):
+        with open(os.path.join(FIXTURES, fixture)) as f:
+            records = json.load(f)
+        frames = {}
+        for name in names:
+            codecs.set_default_codec(name)
+            single = subscribe(encode(records, 0), {}, schema)
+            batched = subscribe(encode(records, 7), BATCH, schema)
+            pd.testing.assert_frame_equal(single, batched)
+            frames[name] = single
+        for name, frame in frames.items():
+            pd.testing.assert_frame_equal(frames["json"], frame, obj=f"{fixture} via {name}")
+        print(f"fixture {fixture}: {len(records)} records, identical frames from {', '.join(names)}")
+
+
+def timed(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(label, records, schema, batch_size, names, repeat):
+    attributes = BATCH if batch_size else {}
+    print(f"\n{label}: {len(records)} records, "
+          + (f"{batch_size} per envelope" if batch_size else "one per message"))
+    print(f"{'codec':8s} {'encode':>9} {'decode':>9} {'subscribe':>10} {'records/s':>11} {'MB':>6}")
+    frames = {}
+    for name in names:
+        codecs.set_default_codec(name)
+        encode_s, messages = timed(repeat, encode, records, batch_size)
+        decode_s, _ = timed(repeat, lambda: [decode_records(m, attributes) for m in messages])
+        subscribe_s, frames[name] = timed(repeat, subscribe, messages, attributes, schema)
+        size = sum(len(m) for m in messages) / 1e6
+        print(f"{name:8s} {encode_s:8.2f}s {decode_s:8.2f}s {subscribe_s:9.2f}s "
+              f"{len(records) / subscribe_s:>11,.0f} {size:6.1f}")
+    for name, frame in frames.items():
+        pd.testing.assert_frame_equal(frames["json"], frame)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000, help="breadcrumbs")
+    parser.add_argument("--batch-size", type=int, default=500, help="records per envelope for the batched runs")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument("--codecs", default=",".join(codecs.available()), help="comma-separated codecs")
+    args = parser.parse_args()
+    names = args.codecs.split(",")
+    if "json" not in names:
+        names.insert(0, "json")
+
+    check_fixtures(names)
+
+    breadcrumbs = []
+    vid = 2900
+    while len(breadcrumbs) < args.records:
+        breadcrumbs.extend(breadcrumb_records(vid, min(5000, args.records - len(breadcrumbs))))
+        vid += 1
+    stop_events = []
+    vid = 2900
+    while len(stop_events) < args.records // 4:
+        stop_events.extend(r for _, rows in stop_event_rows(vid) for r in rows)
+        vid += 1
+
+    run("breadcrumbs", breadcrumbs, BREADCRUMB_SCHEMA, 0, names, args.repeat)
+    run("breadcrumbs", breadcrumbs, BREADCRUMB_SCHEMA, args.batch_size, names, args.repeat)
+    run("stop events", stop_events, STOP_EVENT_SCHEMA, 0, names, args.repeat)
+    run("stop events", stop_events, STOP_EVENT_SCHEMA, args.batch_size, names, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""StringIO + copy_from vs streaming copy_frame (csv and binary).
+
+Loads the same breadcrumb frame into a scratch table three ways and reports
+time, throughput and peak Python memory (tracemalloc) for each.
+
+    python benchmarks/bench_copy.py --dsn "dbname=trimet_data" --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+import psycopg2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.bulkload import BREADCRUMB_COLUMNS, copy_frame
+from pipeline.transform import transform_breadcrumbs
+from bench_transform import synthetic_day
+
+TABLE = "bench_breadcrumb"
+
+
+def legacy_copy(cursor, df):
+    # what every copy_from_df did: the whole frame as one CSV string
+    buffer = StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    cursor.copy_from(buffer, TABLE, sep=",", null='\\N')
+
+
+def run(conn, load):
+    cursor = conn.cursor()
+    cursor.execute(f"TRUNCATE {TABLE}")
+    conn.commit()
+    start = time.perf_counter()
+    load(cursor)
+    conn.commit()
+    seconds = time.perf_counter() - start
+    cursor.execute(f"SELECT count(*) FROM {TABLE}")
+    rows = cursor.fetchone()[0]
+    cursor.close()
+    return rows, seconds
+
+
+def measure(conn, label, load):
+    rows, seconds = run(conn, load)
+    # second pass under tracemalloc, which slows allocation-heavy code down
+    tracemalloc.start()
+    run(conn, load)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:8s} {rows:>9} rows {seconds:7.2f}s {rows / seconds:>10,.0f} rows/s  peak {peak / 1e6:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="dbname=trimet_data")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    df = transform_breadcrumbs(synthetic_day(args.rows))
+    df = df[['EVENT_NO_TRIP', 'TIMESTAMP', 'GPS_LATITUDE', 'GPS_LONGITUDE', 'SPEED']].rename(columns={
+        'EVENT_NO_TRIP': 'trip_id', 'TIMESTAMP': 'tstamp', 'GPS_LATITUDE': 'latitude',
+        'GPS_LONGITUDE': 'longitude', 'SPEED': 'speed'
+    })
+    print(f"frame: {len(df)} rows, {df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+
+    conn = psycopg2.connect(args.dsn)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cursor.execute(f"CREATE UNLOGGED TABLE {TABLE} (trip_id BIGINT, tstamp TIMESTAMP, "
+                   "latitude FLOAT, longitude FLOAT, speed FLOAT)")
+    conn.commit()
+    try:
+        measure(conn, "stringio", lambda cur: legacy_copy(cur, df))
+        measure(conn, "csv", lambda cur: copy_frame(cur, df, TABLE, BREADCRUMB_COLUMNS, report=False))
+        measure(conn, "binary", lambda cur: copy_frame(cur, df, TABLE, BREADCRUMB_COLUMNS, fmt="binary", report=False))
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Publish/subscribe throughput: one message per record vs batched envelopes.
+
+Runs against the in-process fake by default; with ``--emulator`` it uses the
+real client against the Pub/Sub emulator named by PUBSUB_EMULATOR_HOST.
+
+    python benchmarks/bench_envelope.py --records 200000 --batch-sizes 0,100,500
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.envelope import RecordBatcher, decode_message
+from synthetic import breadcrumb_records
+
+import fake_pubsub
+
+PROJECT = "bench-project"
+
+
+def clients(use_emulator, run_id):
+    if use_emulator:
+        from google.cloud import pubsub_v1
+        publisher = pubsub_v1.PublisherClient()
+        subscriber = pubsub_v1.SubscriberClient()
+        topic = publisher.topic_path(PROJECT, f"bench-{run_id}")
+        sub = subscriber.subscription_path(PROJECT, f"bench-{run_id}-sub")
+        publisher.create_topic(name=topic)
+        subscriber.create_subscription(name=sub, topic=topic)
+        return publisher, subscriber, topic, sub
+
+    broker = fake_pubsub.FakeBroker()
+    publisher = fake_pubsub.PublisherClient(broker)
+    subscriber = fake_pubsub.SubscriberClient(broker)
+    topic = publisher.topic_path(PROJECT, f"bench-{run_id}")
+    sub = subscriber.subscription_path(PROJECT, f"bench-{run_id}-sub")
+    broker.create_subscription(sub, topic)
+    return publisher, subscriber, topic, sub
+
+
+def run(vehicles, batch_size, compression, use_emulator, run_id):
+    publisher, subscriber, topic, sub = clients(use_emulator, run_id)
+    expected = sum(len(records) for records in vehicles.values())
+    received = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def callback(message):
+        records = decode_message(message)
+        message.ack()
+        with lock:
+            received.extend(records)
+            if len(received) >= expected:
+                done.set()
+
+    pull = subscriber.subscribe(sub, callback=callback)
+    start = time.perf_counter()
+    futures = []
+    sent_bytes = [0]
+
+    def publish(data, **attrs):
+        sent_bytes[0] += len(data)
+        futures.append(publisher.publish(topic, data, **attrs))
+
+    if batch_size:
+        with RecordBatcher(publish, batch_size=batch_size, compression=compression) as batcher:
+            for vid, records in vehicles.items():
+                batcher.add_many(records, key=vid)
+                batcher.flush(vid)
+    else:
+        for records in vehicles.values():
+            for record in records:
+                publish(json.dumps(record).encode("utf-8"))
+
+    for f in futures:
+        f.result()
+    publish_time = time.perf_counter() - start
+    done.wait(timeout=600)
+    total_time = time.perf_counter() - start
+    pull.cancel()
+    subscriber.close()
+    assert len(received) == expected, f"received {len(received)} of {expected}"
+    return len(futures), sent_bytes[0], publish_time, total_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--records", type=int, default=200000, help="total breadcrumbs")
+    parser.add_argument("--batch-sizes", default="0,100,500,2000")
+    parser.add_argument("--compression", default="none,gzip")
+    parser.add_argument("--emulator", action="store_true")
+    args = parser.parse_args()
+
+    per_vehicle = args.records // args.vehicles
+    vehicles = {str(3000 + i): breadcrumb_records(3000 + i, per_vehicle) for i in range(args.vehicles)}
+    total = per_vehicle * args.vehicles
+
+    print(f"{'batch':>6} {'compress':>8} {'messages':>9} {'MB sent':>8} {'publish s':>9} {'e2e s':>7} {'rec/s':>10}")
+    run_id = int(time.time())
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        for compression in args.compression.split(","):
+            compression = None if compression == "none" else compression
+            if not batch_size and compression:
+                continue
+            run_id += 1
+            messages, sent, pub_s, e2e_s = run(vehicles, batch_size, compression, args.emulator, run_id)
+            print(f"{batch_size:>6} {str(compression):>8} {messages:>9} {sent / 1e6:>8.1f} "
+                  f"{pub_s:>9.2f} {e2e_s:>7.2f} {total / e2e_s:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Wall-clock comparison of the serial breadcrumb download against VehicleFetcher.
+
+    python benchmarks/bench_fetch.py --vehicles 200 --latency 0.05 --workers 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.fetcher import VehicleFetcher
+from stub_server import StubServer
+
+
+def serial_fetch(url_template, vehicle_ids):
+    # the original gather_bus_data loop: a bare requests.get per vehicle
+    total = 0
+    for vid in vehicle_ids:
+        response = requests.get(url_template.format(vid))
+        if response.status_code == 200:
+            total += len(response.json())
+    return total
+
+
+def pooled_fetch(url_template, vehicle_ids, workers):
+    total = 0
+    with VehicleFetcher(url_template, max_workers=workers) as fetcher:
+        for result in fetcher.iter_results(vehicle_ids):
+            if result.status_code == 200:
+                total += len(json.loads(result.text))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--records", type=int, default=500, help="breadcrumbs per vehicle")
+    parser.add_argument("--latency", type=float, default=0.05, help="server delay per request (s)")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, records_per_vehicle=args.records).start()
+    url_template = server.base_url + "/api/getBreadCrumbs?vehicle_id={}"
+    vehicle_ids = [str(2900 + i) for i in range(args.vehicles)]
+
+    try:
+        results = {}
+        for name, run in (
+            ("serial", lambda: serial_fetch(url_template, vehicle_ids)),
+            (f"pooled x{args.workers}", lambda: pooled_fetch(url_template, vehicle_ids, args.workers)),
+        ):
+            server.reset_counters()
+            start = time.perf_counter()
+            total = run()
+            elapsed = time.perf_counter() - start
+            results[name] = (total, elapsed, server.connections)
+            print(f"{name:>12}: {elapsed:7.2f}s  records={total}  connections={server.connections}")
+
+        (serial_total, serial_time, _), (pooled_total, pooled_time, _) = results.values()
+        assert serial_total == pooled_total, "record totals differ"
+        print(f"speedup: {serial_time / pooled_time:.1f}x")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
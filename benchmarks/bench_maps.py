@@ -0,0 +1,135 @@
+"""Breadcrumb maps: one CircleMarker per row vs the single-layer modes in pipeline/maps.py.
+
+Builds synthetic breadcrumbs for a day (--trips trips of --points points
+wandering around Portland) and renders them the way the q*.py scripts
+did (``iterrows()`` + ``folium.CircleMarker`` with a popup) and with each
+``maps`` mode, reporting the render time (map built and HTML produced)
+and the HTML size. The per-row loop is run on at most --legacy-rows rows
+and scaled up linearly above that, since a full day takes minutes.
+
+With --dsn the points are also loaded into a scratch table and the
+database side is timed: pulling every point with ``read_sql_query``
+against ``maps.load_cells`` aggregating them in Postgres.
+
+    python benchmarks/bench_maps.py --trips 1000 --points 500 \\
+        --dsn "host=/tmp/pgdata dbname=bench user=postgres"
+"""
+import argparse
+import os
+import sys
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import maps
+
+SCHEMA = "bench_maps"
+
+
+def make_points(trips, points, seed=0):
+    rng = np.random.default_rng(seed)
+    start_lat = 45.52 + rng.uniform(-0.08, 0.08, size=(trips, 1))
+    start_lon = -122.68 + rng.uniform(-0.12, 0.12, size=(trips, 1))
+    # ~50 m steps with a heading that drifts, like a bus on a street grid
+    heading = np.cumsum(rng.normal(0, 0.3, size=(trips, points)), axis=1)
+    lat = start_lat + np.cumsum(np.sin(heading) * 0.00045, axis=1)
+    lon = start_lon + np.cumsum(np.cos(heading) * 0.00064, axis=1)
+    speed = np.clip(rng.normal(9, 5, size=(trips, points)), 0, None)
+    return pd.DataFrame({"latitude": lat.ravel().round(6), "longitude": lon.ravel().round(6),
+                         "speed": speed.ravel().round(2)})
+
+
+def legacy(df):
+    # as q1-q5_3 did before pipeline/maps.py
+    m = folium.Map(location=[df.latitude.mean(), df.longitude.mean()], zoom_start=13)
+    for _, row in df.iterrows():
+        folium.CircleMarker(
+            location=[row['latitude'], row['longitude']],
+            radius=2,
+            popup=f"Speed: {row['speed']}",
+            color='blue',
+            fill=True,
+            fill_opacity=0.6
+        ).add_to(m)
+    return m
+
+
+def render(build, *args):
+    start = time.perf_counter()
+    html = build(*args).get_root().render()
+    return time.perf_counter() - start, len(html.encode("utf-8"))
+
+
+def report(label, seconds, size, note=""):
+    print(f"{label:28s} {seconds:9.2f} {size / 1e6:10.2f}  {note}")
+
+
+def database(dsn, df):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.execute("CREATE TABLE breadcrumb (latitude FLOAT, longitude FLOAT, speed FLOAT)")
+        cursor.execute("INSERT INTO breadcrumb SELECT * FROM unnest(%s::float[], %s::float[], %s::float[])",
+                       (df.latitude.tolist(), df.longitude.tolist(), df.speed.tolist()))
+        conn.commit()
+        query = "SELECT latitude, longitude, speed FROM breadcrumb WHERE latitude IS NOT NULL"
+
+        print(f"\n{'database side':28s} {'seconds':>9s} {'rows':>10s}")
+        start = time.perf_counter()
+        points = pd.read_sql_query(query, conn)
+        print(f"{'read every point':28s} {time.perf_counter() - start:9.2f} {len(points):10d}")
+        start = time.perf_counter()
+        cells = maps.load_cells(conn, query)
+        print(f"{'load_cells (SQL grid)':28s} {time.perf_counter() - start:9.2f} {len(cells):10d}")
+        pd.testing.assert_frame_equal(
+            cells.sort_values(["gx", "gy"]).reset_index(drop=True),
+            maps.grid_cells(points).sort_values(["gx", "gy"]).reset_index(drop=True),
+            check_exact=False)
+        print("SQL and NumPy grids identical")
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trips", type=int, default=400)
+    parser.add_argument("--points", type=int, default=500, help="breadcrumbs per trip")
+    parser.add_argument("--legacy-rows", type=int, default=20000, help="rows rendered by the per-row loop")
+    parser.add_argument("--dsn", help="also time the SQL aggregation in a scratch schema")
+    args = parser.parse_args()
+
+    df = make_points(args.trips, args.points)
+    print(f"{len(df)} breadcrumbs\n")
+    print(f"{'mode':28s} {'seconds':>9s} {'HTML MB':>10s}")
+
+    sample = df.iloc[:args.legacy_rows]
+    seconds, size = render(legacy, sample)
+    scale = len(df) / len(sample)
+    report("CircleMarker per row", seconds * scale, size * scale,
+           f"(measured on {len(sample)} rows)" if scale > 1 else "")
+
+    seconds, size = render(maps.points_map, df)
+    report(f"points (<= {maps.MAX_POINTS})", seconds, size)
+    seconds, size = render(maps.points_map, df, None, 13, True, len(df))
+    report("points, not thinned", seconds, size)
+    for mode in ("grid", "heat"):
+        seconds, size = render(lambda: maps.cells_map(maps.grid_cells(df), mode=mode))
+        cells, cell_m = maps.coarsen(maps.grid_cells(df))
+        report(mode, seconds, size, f"({len(cells)} cells of {cell_m:g} m)")
+
+    if args.dsn:
+        database(args.dsn, df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""End-to-end replay of the whole pipeline on one machine.
+
+Nothing here touches busdata.cs.pdx.edu, GCP or the production database:
+
+* busdata API   -> stub_server.StubServer (synthetic, or --recorded payloads)
+* Pub/Sub       -> the in-process fake_pubsub broker; every publish is logged
+                   so a topic can be replayed into a second subscriber
+* PostgreSQL    -> --dsn, with stop.sql + trip_timeline.sql + speed_stats.sql
+                   + trip_routes.sql created in a scratch schema that every connection is
+                   pointed at
+
+and the real entry points run unchanged, in this order:
+
+    gather            Part2/data_gather.main
+    subscriber        Part2/subscriber.py (module-level script)
+    updated_sub       Part2/updated_subscriber.main (same messages, replayed)
+    stop_publish      StopEventPublisher.run
+    stop_subscribe    StopEventSubscriber.run
+    load_breadcrumb   Part3/load_breadcrumb.main
+    backfill          Part2/backfill_archive.backfill, from the Parquet
+                      archive the gather stage wrote
+
+Each stage reports records, wall time (less the idle timeout the fake
+streaming pull waits before it ends), records/s, the peak RSS of this
+process while it ran (parse worker processes are not included) and, for
+subscribers, publish-to-callback delivery latency. --json writes the
+results; --baseline compares against an earlier --json file and exits
+non-zero when a stage's records/s dropped by more than --tolerance.
+--metrics writes the shared metrics registry (pipeline/metrics.py) the
+stages recorded into, in Prometheus text format.
+
+    python benchmarks/bench_pipeline.py --dsn "host=/tmp/pgdata dbname=bench user=postgres" \\
+        --vehicles 50 --records 1000 --json results.json
+"""
+import argparse
+import collections
+import importlib.util
+import json
+import os
+import resource
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import psycopg2
+from google.cloud import pubsub_v1
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCH_DIR, "..")
+sys.path.append(ROOT)
+from pipeline import metrics
+from pipeline.archive import BreadcrumbArchive
+from pipeline.publishing import percentile
+from stub_server import StubServer
+
+import fake_pubsub
+
+SCHEMA = "bench_pipeline"
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", name)
+                for name in ("stop.sql", "trip_timeline.sql", "speed_stats.sql", "trip_routes.sql")]
+PROJECT = "dataengineeringproject-456307"
+BREADCRUMB_TOPIC = f"projects/{PROJECT}/topics/MyTopic1"
+BREADCRUMB_SUB = f"projects/{PROJECT}/subscriptions/MyTopic1-sub"
+STOP_TOPIC = f"projects/{PROJECT}/topics/stop-events-topic"
+STOP_SUB = f"projects/{PROJECT}/subscriptions/stop-events-topic-sub"
+IDLE_TIMEOUT = 1.0  # seconds without messages before a fake streaming pull ends
+RSS_INTERVAL = 0.05
+
+StageResult = namedtuple("StageResult", ["name", "records", "seconds", "rate", "peak_rss_mb",
+                                         "latency_p50_ms", "latency_p95_ms"])
+
+
+# === fakes ===
+class ReplayBroker(fake_pubsub.FakeBroker):
+    def __init__(self):
+        super().__init__()
+        self.log = collections.defaultdict(list)
+
+    def publish(self, topic_path, data, attributes):
+        with self.lock:
+            self.log[topic_path].append((data, attributes))
+        return super().publish(topic_path, data, attributes)
+
+    def replay(self, topic_path, subscription_path):
+        """Queue every message ever published on the topic again."""
+        q = self.create_subscription(subscription_path, topic_path)
+        for data, attributes in self.log[topic_path]:
+            q.put((str(next(self._ids)), data, attributes, time.time()))
+        return len(self.log[topic_path])
+
+
+class Harness:
+    def __init__(self, dsn, broker):
+        self.dsn = dsn
+        self.broker = broker
+        self.latencies = []
+        self.idle_seconds = 0.0  # idle tail of the stage's streaming pulls
+        self._real_connect = psycopg2.connect
+
+    def install(self):
+        """Point pubsub_v1 clients at the fake broker and psycopg2 at the scratch schema."""
+        harness = self
+
+        class PublisherClient(fake_pubsub.PublisherClient):
+            def __init__(self, *args, **kwargs):
+                super().__init__(harness.broker)
+
+        class SubscriberClient(fake_pubsub.SubscriberClient):
+            def __init__(self, *args, **kwargs):
+                super().__init__(harness.broker)
+
+            def subscribe(self, subscription, callback, flow_control=None, idle_timeout=None):
+                def timed(message):
+                    harness.latencies.append(time.time() - message.publish_time)
+                    callback(message)
+                # the pull only notices the topic is drained after this long
+                harness.idle_seconds += idle_timeout or IDLE_TIMEOUT
+                return super().subscribe(subscription, timed, flow_control, idle_timeout or IDLE_TIMEOUT)
+
+        def connect(*args, **kwargs):
+            # every script's hard-coded DB settings land on the local scratch schema
+            return self._real_connect(self.dsn, options=f"-c search_path={SCHEMA}")
+
+        pubsub_v1.PublisherClient = PublisherClient
+        pubsub_v1.SubscriberClient = SubscriberClient
+        psycopg2.connect = connect
+
+    def connect(self):
+        return psycopg2.connect()
+
+    def create_schema(self):
+        conn = self._real_connect(self.dsn)
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        for path in SCHEMA_FILES:
+            with open(path) as f:
+                cursor.execute(f.read())
+        conn.commit()
+        conn.close()
+
+    def drop_schema(self):
+        conn = self._real_connect(self.dsn)
+        conn.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+    def reset_tables(self, *tables):
+        conn = self.connect()
+        conn.cursor().execute(f"TRUNCATE {', '.join(tables)}")
+        conn.commit()
+        conn.close()
+
+    def count(self, table):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT count(*) FROM {table}")
+        rows = cursor.fetchone()[0]
+        conn.close()
+        return rows
+
+
+# === measurement ===
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # no procfs: fall back to the lifetime peak (KB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RssSampler:
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def run_stage(harness, name, body, count):
+    """Run ``body()``; ``count()`` gives the records the stage produced."""
+    harness.latencies = []
+    harness.idle_seconds = 0.0
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        body()
+        seconds = time.perf_counter() - start - harness.idle_seconds
+    records = count()
+    latencies = sorted(harness.latencies)
+    result = StageResult(name, records, seconds, records / max(seconds, 1e-9), rss.peak,
+                         percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000)
+    latency = (f"{result.latency_p50_ms:>8.0f} {result.latency_p95_ms:>8.0f}" if latencies
+               else f"{'-':>8} {'-':>8}")
+    print(f"{name:16s} {records:>9} {seconds:>8.2f} {result.rate:>11,.0f} {rss.peak:>8.0f} {latency}")
+    return result
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# === stages ===
+def stages(harness, server, vehicle_ids):
+    broker = harness.broker
+    breadcrumb_url = server.base_url + "/api/getBreadCrumbs?vehicle_id={}"
+    stop_url = server.base_url + "/api/getStopEvents?vehicle_num={}"
+    with open("vehicle_ids.csv", "w") as f:
+        f.write("\n".join(vehicle_ids) + "\n")
+    published = {}
+
+    def gather():
+        module = load_module("bench_data_gather", os.path.join(ROOT, "Part2", "data_gather.py"))
+        module.BREADCRUMB_URL = breadcrumb_url
+        module.WATERMARK_PATH = None
+        module.read_vehicle_ids = lambda: list(vehicle_ids)
+        before = broker.published_messages
+        module.main()
+        published["gather"] = broker.published_messages - before
+
+    def subscriber():
+        harness.reset_tables("trip", "breadcrumb", "trip_timeline")
+        runpy.run_path(os.path.join(ROOT, "Part2", "subscriber.py"), run_name="__main__")
+
+    def updated_subscriber():
+        harness.reset_tables("trip", "breadcrumb", "trip_timeline")
+        broker.replay(BREADCRUMB_TOPIC, BREADCRUMB_SUB)
+        module = load_module("bench_updated_subscriber", os.path.join(ROOT, "Part2", "updated_subscriber.py"))
+        module.main()
+
+    def stop_publish():
+        module = load_module("bench_stop_event_publisher", os.path.join(ROOT, "Part3", "stop_event_publisher.py"))
+        module.STOP_EVENT_URL = stop_url
+        before = broker.published_messages
+        module.StopEventPublisher(PROJECT, "stop-events-topic", "bench-key.json", "vehicle_ids.csv",
+                                  watermark_path=None, stats_interval=0).run()
+        published["stop_publish"] = broker.published_messages - before
+
+    def stop_subscribe():
+        harness.reset_tables("stop_events")
+        module = load_module("bench_stop_event_subscriber", os.path.join(ROOT, "Part3", "stop_event_subscriber.py"))
+        module.StopEventSubscriber(PROJECT, "stop-events-topic-sub", db_config={}).run()
+
+    def load_breadcrumb():
+        harness.reset_tables("breadcrumb", "trip_timeline")
+        module = load_module("bench_load_breadcrumb", os.path.join(ROOT, "Part3", "load_breadcrumb.py"))
+        module.URL_TEMPLATE = breadcrumb_url
+        module.WATERMARK_PATH = None
+        module.main()
+
+    def backfill():
+        # reloads what the gather stage archived, through updated_subscriber's transform and merge
+        harness.reset_tables("trip", "breadcrumb", "trip_timeline")
+        sys.path.append(os.path.join(ROOT, "Part2"))
+        module = load_module("bench_backfill_archive", os.path.join(ROOT, "Part2", "backfill_archive.py"))
+        module.backfill(harness.connect(), BreadcrumbArchive(module.ARCHIVE_ROOT))
+
+    return [
+        ("gather", gather, lambda: published["gather"]),
+        ("subscriber", subscriber, lambda: harness.count("breadcrumb")),
+        ("updated_sub", updated_subscriber, lambda: harness.count("breadcrumb")),
+        ("stop_publish", stop_publish, lambda: published["stop_publish"]),
+        ("stop_subscribe", stop_subscribe, lambda: harness.count("stop_events")),
+        ("load_breadcrumb", load_breadcrumb, lambda: harness.count("breadcrumb")),
+        ("backfill", backfill, lambda: harness.count("breadcrumb")),
+    ]
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {r["name"]: r for r in json.load(f)}
+    regressions = []
+    for result in results:
+        old = baseline.get(result.name)
+        if old is None or not old["rate"]:
+            continue
+        change = result.rate / old["rate"] - 1
+        flag = "  REGRESSION" if change < -tolerance else ""
+        print(f"{result.name:16s} {old['rate']:>11,.0f} -> {result.rate:>11,.0f} records/s ({change:+.0%}){flag}")
+        if flag:
+            regressions.append(result.name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="dbname=scratch")
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--records", type=int, default=1000, help="breadcrumbs per vehicle")
+    parser.add_argument("--trips", type=int, default=8, help="stop-event tables per page")
+    parser.add_argument("--stops", type=int, default=40, help="stop events per trip")
+    parser.add_argument("--latency", type=float, default=0.0, help="stub delay per request (s)")
+    parser.add_argument("--recorded", help="folder or zip of recorded bus_*.json / stop_*.html payloads")
+    parser.add_argument("--stages", help="comma-separated subset of stages to run")
+    parser.add_argument("--json", help="write the results here")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed records/s drop vs baseline")
+    parser.add_argument("--keep", action="store_true", help="leave the scratch schema in place")
+    parser.add_argument("--metrics", help="write the recorded pipeline metrics here (Prometheus text)")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, records_per_vehicle=args.records, stop_trips=args.trips,
+                        stops_per_trip=args.stops, recorded=args.recorded).start()
+    vehicle_ids = server.vehicle_ids() or [str(2900 + i) for i in range(args.vehicles)]
+
+    broker = ReplayBroker()
+    broker.create_subscription(BREADCRUMB_SUB, BREADCRUMB_TOPIC)
+    broker.create_subscription(STOP_SUB, STOP_TOPIC)
+    harness = Harness(args.dsn, broker)
+    harness.create_schema()
+    harness.install()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    results = []
+    try:
+        selected = set(args.stages.split(",")) if args.stages else None
+        print(f"{len(vehicle_ids)} vehicles, work dir {workdir}")
+        print(f"{'stage':16s} {'records':>9} {'seconds':>8} {'records/s':>11} {'RSS MB':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8}")
+        for name, body, count in stages(harness, server, vehicle_ids):
+            if selected is None or name in selected:
+                results.append(run_stage(harness, name, body, count))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.stop()
+        if not args.keep:
+            harness.drop_schema()
+
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.REGISTRY.prometheus_text())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r._asdict() for r in results], f, indent=1)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            sys.exit(f"records/s regressed in: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""EXPLAIN ANALYZE of the q1-q5 visualization queries, before and after.
+
+"before" is an unpartitioned, unindexed breadcrumb heap queried with the
+original DATE()/EXTRACT()/BETWEEN filters; "after" is Part3/stop.sql
+(monthly partitions, BRIN, (trip_id, tstamp) b-tree, GiST on the position)
+queried with the rewritten, sargable filters. Both schemas get the same
+synthetic month of breadcrumbs. Types match in both (BIGINT trip ids,
+INTEGER route ids) so only layout, indexes and predicates differ.
+
+Creates and drops the schemas bench_before and bench_after; point it at a
+scratch database.
+
+    python benchmarks/bench_queries.py --dsn "dbname=scratch" --trips-per-day 400
+"""
+import argparse
+import json
+import os
+
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCHEMA_SQL = os.path.join(ROOT, "Part3", "stop.sql")
+
+BEFORE_SQL = """
+CREATE TABLE trip (
+    trip_id BIGINT PRIMARY KEY,
+    route_id INTEGER,
+    vehicle_id TEXT,
+    service_key TEXT,
+    direction TEXT
+);
+CREATE TABLE breadcrumb (
+    trip_id BIGINT,
+    tstamp TIMESTAMP,
+    latitude FLOAT,
+    longitude FLOAT,
+    speed FLOAT
+);
+"""
+
+# (name, original query, rewritten query)
+QUERIES = [
+    ("q1", """
+SELECT longitude, latitude, speed FROM breadcrumb WHERE trip_id = (
+    SELECT b.trip_id FROM breadcrumb b INNER JOIN trip t ON t.trip_id = b.trip_id
+    WHERE b.latitude BETWEEN 45.506022 AND 45.516636
+      AND b.longitude BETWEEN -122.711662 AND -122.700316
+      AND t.route_id > 0
+    ORDER BY DATE(b.tstamp) DESC LIMIT 1)
+AND latitude IS NOT NULL AND longitude IS NOT NULL""", """
+SELECT longitude, latitude, speed FROM breadcrumb WHERE trip_id = (
+    SELECT b.trip_id FROM breadcrumb b INNER JOIN trip t ON t.trip_id = b.trip_id
+    WHERE point(b.longitude, b.latitude) <@ box(point(-122.711662, 45.506022), point(-122.700316, 45.516636))
+      AND t.route_id > 0
+    ORDER BY b.tstamp DESC LIMIT 1)
+AND latitude IS NOT NULL AND longitude IS NOT NULL"""),
+    ("q2", """
+SELECT longitude, latitude, speed FROM breadcrumb WHERE trip_id = (
+  SELECT DISTINCT b.trip_id FROM breadcrumb b JOIN trip t ON b.trip_id = t.trip_id
+  WHERE t.route_id = 20
+    AND EXTRACT(HOUR FROM b.tstamp) BETWEEN 16 AND 18
+    AND DATE(b.tstamp) = '2023-01-26'
+  LIMIT 1)""", """
+SELECT longitude, latitude, speed FROM breadcrumb WHERE trip_id = (
+  SELECT DISTINCT b.trip_id FROM breadcrumb b JOIN trip t ON b.trip_id = t.trip_id
+  WHERE t.route_id = 20
+    AND b.tstamp >= TIMESTAMP '2023-01-26 16:00' AND b.tstamp < TIMESTAMP '2023-01-26 19:00'
+  LIMIT 1)"""),
+    ("q3", """
+SELECT b.latitude, b.longitude, b.speed FROM breadcrumb b JOIN trip t ON t.trip_id = b.trip_id
+WHERE b.trip_id IN (238302615, 238302716)
+  AND EXTRACT(DOW FROM b.tstamp) = 0
+  AND EXTRACT(HOUR FROM b.tstamp) BETWEEN 9 AND 11
+  AND DATE(b.tstamp) = '2023-01-15'
+  AND b.latitude IS NOT NULL AND b.longitude IS NOT NULL""", """
+SELECT b.latitude, b.longitude, b.speed FROM breadcrumb b JOIN trip t ON t.trip_id = b.trip_id
+WHERE b.trip_id IN (238302615, 238302716)
+  AND b.tstamp >= TIMESTAMP '2023-01-15 09:00' AND b.tstamp < TIMESTAMP '2023-01-15 12:00'
+  AND b.latitude IS NOT NULL AND b.longitude IS NOT NULL"""),
+    ("q4", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE DATE(tstamp) = '2023-01-15' AND EXTRACT(HOUR FROM tstamp) < 11
+  AND latitude BETWEEN 45.503 AND 45.514 AND longitude BETWEEN -122.655 AND -122.643
+  AND latitude IS NOT NULL AND longitude IS NOT NULL""", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE tstamp >= TIMESTAMP '2023-01-15' AND tstamp < TIMESTAMP '2023-01-15 11:00'
+  AND point(longitude, latitude) <@ box(point(-122.655, 45.503), point(-122.643, 45.514))
+  AND latitude IS NOT NULL AND longitude IS NOT NULL"""),
+    ("q5_1", """
+SELECT b.latitude, b.longitude, b.speed FROM breadcrumb b JOIN trip t ON b.trip_id = t.trip_id
+WHERE t.route_id = 35 AND DATE(b.tstamp) = '2023-01-15'
+  AND b.latitude IS NOT NULL AND b.longitude IS NOT NULL""", """
+SELECT b.latitude, b.longitude, b.speed FROM breadcrumb b JOIN trip t ON b.trip_id = t.trip_id
+WHERE t.route_id = 35 AND b.tstamp >= '2023-01-15'::date AND b.tstamp < '2023-01-15'::date + 1
+  AND b.latitude IS NOT NULL AND b.longitude IS NOT NULL"""),
+    ("q5_2", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE EXTRACT(HOUR FROM tstamp) BETWEEN 22 AND 23 AND DATE(tstamp) = '2023-01-15'
+  AND latitude IS NOT NULL AND longitude IS NOT NULL""", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE tstamp >= TIMESTAMP '2023-01-15 22:00' AND tstamp < TIMESTAMP '2023-01-16'
+  AND latitude IS NOT NULL AND longitude IS NOT NULL"""),
+    ("q5_3", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE speed > 25 AND DATE(tstamp) = '2023-01-16'
+  AND latitude IS NOT NULL AND longitude IS NOT NULL""", """
+SELECT latitude, longitude, speed FROM breadcrumb
+WHERE speed > 25 AND tstamp >= TIMESTAMP '2023-01-16' AND tstamp < TIMESTAMP '2023-01-17'
+  AND latitude IS NOT NULL AND longitude IS NOT NULL"""),
+]
+
+
+def load_data(cursor, days, trips_per_day, points):
+    """One trip every few minutes per route, a breadcrumb every 5 s, in time order."""
+    cursor.execute("""
+        INSERT INTO trip
+        SELECT 238300000 + g, g %% 100, (3000 + g %% 700)::text, 'Weekday', 'Out'
+        FROM generate_series(0, %(trips)s - 1) g
+    """, {"trips": days * trips_per_day})
+    cursor.execute("""
+        INSERT INTO breadcrumb (trip_id, tstamp, latitude, longitude, speed)
+        SELECT 238300000 + g,
+               TIMESTAMP '2023-01-01' + (g / %(per_day)s) * INTERVAL '1 day'
+                   + ((g * 997) %% 72000 + 18000 + i * 5) * INTERVAL '1 second',
+               45.40 + ((g * 7919 + i * 13) %% 2000) / 10000.0,
+               -122.80 + ((g * 104729 + i * 17) %% 2500) / 10000.0,
+               ((g + i) %% 300) / 10.0
+        FROM generate_series(0, %(trips)s - 1) g, generate_series(0, %(points)s - 1) i
+        ORDER BY 2
+    """, {"trips": days * trips_per_day, "per_day": trips_per_day, "points": points})
+
+
+def create_schema(conn, schema, ddl, days, trips_per_day, points):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(f"SET search_path TO {schema}")
+    cursor.execute(ddl)
+    if "create_breadcrumb_partition" in ddl:
+        cursor.execute("SELECT create_breadcrumb_partition(DATE '2023-01-01')")
+        cursor.execute("SELECT create_breadcrumb_partition(DATE '2023-02-01')")
+    load_data(cursor, days, trips_per_day, points)
+    conn.commit()
+    # summarizes the BRIN ranges as autovacuum would after a load
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE trip")
+    cursor.execute("VACUUM ANALYZE breadcrumb")
+    conn.autocommit = False
+    cursor.execute("SELECT count(*) FROM breadcrumb")
+    rows = cursor.fetchone()[0]
+    cursor.execute("SELECT pg_size_pretty(sum(pg_total_relation_size(c.oid))) FROM pg_class c "
+                   "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s AND c.relkind = 'r'",
+                   (schema,))
+    print(f"{schema}: {rows} breadcrumbs, {cursor.fetchone()[0]} on disk")
+    cursor.close()
+
+
+def scan_nodes(plan):
+    """Scan node types in a JSON plan (Index Scan on x, Seq Scan on y, ...)."""
+    nodes = []
+    if "Scan" in plan["Node Type"] and "Relation Name" in plan:
+        nodes.append(f"{plan['Node Type']}")
+    for child in plan.get("Plans", []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+def explain(conn, schema, sql, repeat):
+    cursor = conn.cursor()
+    cursor.execute(f"SET search_path TO {schema}")
+    best = None
+    for _ in range(repeat):
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+        result = cursor.fetchone()[0]
+        result = result[0] if isinstance(result, list) else json.loads(result)[0]
+        if best is None or result["Execution Time"] < best["Execution Time"]:
+            best = result
+    cursor.close()
+    plan = best["Plan"]
+    blocks = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    nodes = sorted(set(scan_nodes(plan)))
+    return best["Execution Time"], blocks, plan.get("Actual Rows", 0), nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="dbname=scratch")
+    parser.add_argument("--days", type=int, default=31)
+    parser.add_argument("--trips-per-day", type=int, default=400)
+    parser.add_argument("--points", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="leave the bench schemas in place")
+    args = parser.parse_args()
+
+    with open(SCHEMA_SQL) as f:
+        after_sql = f.read()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        create_schema(conn, "bench_before", BEFORE_SQL, args.days, args.trips_per_day, args.points)
+        create_schema(conn, "bench_after", after_sql, args.days, args.trips_per_day, args.points)
+
+        print(f"\n{'query':6s} {'before ms':>10s} {'after ms':>10s} {'speedup':>8s} "
+              f"{'before blks':>12s} {'after blks':>11s}  plan after")
+        for name, before, after in QUERIES:
+            b_ms, b_blocks, b_rows, _ = explain(conn, "bench_before", before, args.repeat)
+            a_ms, a_blocks, a_rows, nodes = explain(conn, "bench_after", after, args.repeat)
+            assert b_rows == a_rows, f"{name}: {b_rows} rows before, {a_rows} after"
+            print(f"{name:6s} {b_ms:10.1f} {a_ms:10.1f} {b_ms / max(a_ms, 0.001):7.0f}x "
+                  f"{b_blocks:12d} {a_blocks:11d}  {', '.join(nodes)}")
+    finally:
+        if not args.keep:
+            cursor = conn.cursor()
+            cursor.execute("DROP SCHEMA IF EXISTS bench_before CASCADE")
+            cursor.execute("DROP SCHEMA IF EXISTS bench_after CASCADE")
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
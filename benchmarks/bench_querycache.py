@@ -0,0 +1,152 @@
+"""Map queries straight from Postgres vs through the Parquet query cache.
+
+Loads --days service dates of synthetic breadcrumbs (--vehicles vehicles,
+--records each) into a scratch schema through updated_subscriber's
+``load_batch``, so ``load_log`` is filled the way the subscribers fill it.
+Then renders the q5_2 and q5_3 views of Part3/Visualizations/visualize.py
+for one day:
+
+* without the cache
+* through an empty cache (query + Parquet write)
+* through a warm cache
+
+and loads one more vehicle for that day, checking the cached result for
+the day is refreshed while another day's is still served from disk.
+
+    python benchmarks/bench_querycache.py --days 3 --vehicles 200 --records 2000 \\
+        --dsn "host=/tmp/pgdata dbname=bench user=postgres"
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "Part2"))
+sys.path.append(os.path.join(ROOT, "Part3", "Visualizations"))
+import updated_subscriber
+from pipeline import maps
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.querycache import QueryCache
+from pipeline.transform import transform_breadcrumbs
+from synthetic import breadcrumb_records
+from visualize import VIEWS, covered_dates
+
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", "stop.sql"), os.path.join(ROOT, "Part3", "trip_timeline.sql")]
+SCHEMA = "bench_querycache"
+FIRST_DAY = date(2023, 1, 15)
+
+
+def load_day(conn, day, vehicles, records):
+    buffer = breadcrumb_buffer()
+    for vid in vehicles:
+        recs = breadcrumb_records(vid, records, opd_date=day.strftime("%d%b%Y").upper() + ":00:00:00",
+                                  seed=vid * 1000 + day.toordinal())
+        for r in recs:
+            r["EVENT_NO_TRIP"] += (day - FIRST_DAY).days * 1000000
+        buffer.extend(recs)
+    df = updated_subscriber.validate(transform_breadcrumbs(buffer.take_frame()))
+    return updated_subscriber.load_batch(conn, *updated_subscriber.build_tables(df))[1]
+
+
+def view_params(name, day):
+    params = dict(VIEWS[name].defaults)
+    if "min_speed" in params:
+        # synthetic buses are slower than the real ones
+        params["min_speed"] = 12
+    params["start"], params["end"] = datetime.combine(day, datetime.min.time()), \
+        datetime.combine(day + timedelta(days=1), datetime.min.time())
+    return params
+
+
+def timed_render(conn, name, params, cache):
+    """(seconds getting the data, seconds in total) for one map."""
+    reading = [0.0]
+
+    def read(*args):
+        start = time.perf_counter()
+        df = cache.read(*args, dates=covered_dates(params))
+        reading[0] += time.perf_counter() - start
+        return df
+
+    start = time.perf_counter()
+    maps.render(conn, VIEWS[name].query, params, read=read).get_root().render()
+    return reading[0], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--records", type=int, default=2000, help="breadcrumbs per vehicle and day")
+    parser.add_argument("--dsn", required=True, help="database for the scratch schema")
+    args = parser.parse_args()
+
+    updated_subscriber.REJECTED_FOLDER = None
+    warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy")
+    days = [FIRST_DAY + timedelta(days=i) for i in range(args.days)]
+    vehicles = list(range(2900, 2900 + args.vehicles))
+    folder = tempfile.mkdtemp(prefix="bench_querycache_")
+    conn = psycopg2.connect(args.dsn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        for path in SCHEMA_FILES:
+            with open(path) as f:
+                cursor.execute(f.read())
+        conn.commit()
+        loaded = sum(load_day(conn, day, vehicles, args.records) for day in days)
+        cursor.execute("SELECT count(*), count(DISTINCT service_date) FROM load_log")
+        entries, dates = cursor.fetchone()
+        print(f"{loaded} breadcrumbs over {args.days} days; load_log: {entries} entries for {dates} dates")
+
+        day, other = days[-1], days[0]
+        print(f"\n{'view ' + str(day) + ', seconds':28s} {'no cache':>10s} {'cold':>10s} {'warm':>10s}")
+        for name in ("q5_2", "q5_3"):
+            params = view_params(name, day)
+            uncached = timed_render(conn, name, params, QueryCache(folder, enabled=False))
+            cache = QueryCache(folder)
+            cold = timed_render(conn, name, params, cache)
+            warm = timed_render(conn, name, params, cache)
+            assert cache.hits == cache.misses, (cache.misses, cache.hits)
+            for i, label in enumerate(("data", "total")):
+                print(f"{name + ' ' + label:28s} {uncached[i]:10.3f} {cold[i]:10.3f} {warm[i]:10.3f}"
+                      f"   {uncached[i] / max(warm[i], 1e-9):5.1f}x")
+
+        # invalidation is per date: a load into ``day`` leaves ``other`` cached
+        query = VIEWS["q5_2"].query
+        cache = QueryCache(folder)
+        for d in (day, other):
+            params = view_params("q5_2", d)
+            cache.read(conn, query, params, covered_dates(params))
+        added = load_day(conn, day, [vehicles[-1] + 1], args.records)
+        before = cache.misses
+        for d, expect in ((day, "refreshed"), (other, "cached")):
+            params = view_params("q5_2", d)
+            df = cache.read(conn, query, params, covered_dates(params))
+            fresh = pd.read_sql_query(query, conn, params=params)
+            assert len(df) == len(fresh), (d, len(df), len(fresh))
+            state = "refreshed" if cache.misses > before else "cached"
+            before = cache.misses
+            assert state == expect, (d, state)
+            print(f"after loading {added} rows into {day}: {d} {state} ({len(df)} rows)")
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
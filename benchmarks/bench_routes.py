@@ -0,0 +1,140 @@
+"""Trip routes from stop events (Part3/trip_routes.sql, pipeline/routes.py).
+
+Builds stop.sql + trip_timeline.sql + trip_routes.sql in a scratch schema
+and loads --vehicles vehicles' synthetic breadcrumbs (through
+updated_subscriber's ``load_batch``) and stop events (merged and indexed
+as stop_event_subscriber does) in both orders:
+
+* breadcrumbs first: trips load with no route, and the stop-event load
+  fills them in (the deferred backfill)
+* stop events first: trips get their route as they load
+
+Either way every trip must end up with the route and direction of its
+stop events, redelivered batches must change nothing, and each routed
+trip's service date must be in load_log so cached route queries refresh.
+
+    python benchmarks/bench_routes.py --vehicles 200 \\
+        --dsn "host=/tmp/pgdata dbname=bench user=postgres"
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "Part2"))
+import updated_subscriber
+from pipeline.bulkload import merge_frame
+from pipeline.routes import index_routes
+from pipeline.transform import transform_breadcrumbs
+from pipeline.validation import STOP_EVENT_COLUMNS, STOP_EVENT_RULES, cast_stop_events, validate
+from synthetic import breadcrumb_records, stop_event_rows
+
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", name) for name in ("stop.sql", "trip_timeline.sql", "trip_routes.sql")]
+SCHEMA = "bench_routes"
+DIRECTIONS = {"0": "Out", "1": "Back"}
+
+
+def frames(vehicles, records, batch):
+    breadcrumbs, stops, expected = [], [], {}
+    for i in range(0, len(vehicles), batch):
+        recs, rows = [], []
+        for vid in vehicles[i:i + batch]:
+            recs += breadcrumb_records(vid, records)
+            for trip, trip_rows in stop_event_rows(vid, trips=4):
+                rows += trip_rows
+                expected[trip] = (int(trip_rows[0]["route_number"]), DIRECTIONS[trip_rows[0]["direction"]], "Weekday")
+        df = transform_breadcrumbs(pd.DataFrame(recs))
+        breadcrumbs.append(updated_subscriber.build_tables(updated_subscriber.validate(df)))
+        df = pd.DataFrame(rows)[STOP_EVENT_COLUMNS]
+        stops.append(validate(df, STOP_EVENT_RULES, typed=cast_stop_events(df)).valid)
+    return breadcrumbs, stops, expected
+
+
+def create_schema(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+    for path in SCHEMA_FILES:
+        with open(path) as f:
+            cursor.execute(f.read())
+    conn.commit()
+    cursor.close()
+
+
+def load_breadcrumbs(conn, breadcrumbs):
+    start = time.perf_counter()
+    for trips, crumbs in breadcrumbs:
+        updated_subscriber.load_batch(conn, trips, crumbs)
+    return time.perf_counter() - start
+
+
+def load_stops(conn, stops):
+    """Merge and index each batch as stop_event_subscriber does; returns (seconds in index_routes, trips routed)."""
+    indexing, routed = 0.0, 0
+    cursor = conn.cursor()
+    for df in stops:
+        merge_frame(cursor, df, "stop_events")
+        start = time.perf_counter()
+        routed += index_routes(cursor, df["trip_number"])[1]
+        indexing += time.perf_counter() - start
+        conn.commit()
+    cursor.close()
+    return indexing, routed
+
+
+def check(conn, expected):
+    cursor = conn.cursor()
+    cursor.execute("SELECT trip_id, route_id, direction, service_key FROM trip")
+    routes = {trip: tuple(rest) for trip, *rest in cursor.fetchall()}
+    cursor.execute("SELECT count(*) FROM load_log WHERE table_name = 'trip'")
+    logged = cursor.fetchone()[0]
+    cursor.close()
+    assert routes == {trip: expected[trip] for trip in routes}, "trips differ from their stop events"
+    assert len(routes) == len(expected), (len(routes), len(expected))
+    return logged
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--records", type=int, default=400, help="breadcrumbs per vehicle (4 trips)")
+    parser.add_argument("--batch", type=int, default=10, help="vehicles per load")
+    parser.add_argument("--dsn", required=True, help="database for the scratch schema")
+    args = parser.parse_args()
+
+    updated_subscriber.REJECTED_FOLDER = None
+    breadcrumbs, stops, expected = frames(list(range(2900, 2900 + args.vehicles)), args.records, args.batch)
+    conn = psycopg2.connect(args.dsn)
+    try:
+        create_schema(conn)
+        load_breadcrumbs(conn, breadcrumbs)
+        indexing, routed = load_stops(conn, stops)
+        logged = check(conn, expected)
+        print(f"breadcrumbs first: {routed} of {len(expected)} trips routed by the stop-event loads "
+              f"({indexing * 1000:.0f} ms in index_routes), load_log rows {logged}")
+        load_breadcrumbs(conn, breadcrumbs[:2])
+        assert load_stops(conn, stops[:2])[1] == 0
+        assert check(conn, expected) == logged, "redelivered batches changed routed trips"
+        print("redelivered batches change nothing")
+
+        create_schema(conn)
+        load_stops(conn, stops)
+        loading = load_breadcrumbs(conn, breadcrumbs)
+        check(conn, expected)
+        print(f"stop events first: every trip routed as it loaded ({loading:.2f}s of breadcrumb loads)")
+    finally:
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
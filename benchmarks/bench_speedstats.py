@@ -0,0 +1,214 @@
+"""Speed questions: scanning breadcrumb vs the speed_stats summary.
+
+Builds stop.sql + trip_timeline.sql + speed_stats.sql in a scratch schema
+and loads --days service dates of synthetic breadcrumbs through
+updated_subscriber's ``load_batch`` (one merge per --batch vehicles), timing
+the loads with the speed_stats trigger and again without it. Then answers
+the visualization questions both ways, checking they agree:
+
+* every speed in a 1 km box (q1 / q4)
+* weekday 16:00-19:00 (q2's rush hour)
+* 22:00-24:00 every day (q5_2)
+* share of breadcrumbs at or above a speed (q5_3)
+
+Counts, means, maxima and shares must match exactly, percentiles to
+within a histogram bin. A redelivered batch must leave speed_stats as it
+was, and rebuild_speed_stats() must give the same table as the trigger.
+
+    python benchmarks/bench_speedstats.py --days 7 --vehicles 200 \\
+        --dsn "host=/tmp/pgdata dbname=bench user=postgres"
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "Part2"))
+import updated_subscriber
+from pipeline import speedstats
+from pipeline.columnar import breadcrumb_buffer
+from pipeline.transform import transform_breadcrumbs
+from synthetic import breadcrumb_records
+
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", name) for name in ("stop.sql", "trip_timeline.sql", "speed_stats.sql")]
+SCHEMA = "bench_speedstats"
+FIRST_DAY = date(2023, 1, 16)  # a Monday
+BOX = (-122.70, 45.51, -122.686, 45.52)
+ROUTES = 20
+SPEEDING = 12  # m/s; q5_3 uses 25, but synthetic buses rarely pass 14
+
+
+def route_path(route, points):
+    """A bus line: ``points`` positions 50 m apart on a street grid, the same for every trip of ``route``."""
+    rng = np.random.default_rng(route)
+    heading = (np.cumsum(rng.random(points) < 0.04) + rng.integers(0, 4)) % 4 * (np.pi / 2)
+    lat_step, lon_step = 50 / 111320.0, 50 / 111320.0 / np.cos(np.radians(45.52))
+    lat = 45.52 + rng.uniform(-0.05, 0.05) + np.cumsum(np.sin(heading)) * lat_step
+    lon = -122.68 + rng.uniform(-0.08, 0.08) + np.cumsum(np.cos(heading)) * lon_step
+    return lat.round(6), lon.round(6)
+
+
+def batches(days, vehicles, records, batch, routes=ROUTES):
+    paths = [route_path(r, records) for r in range(routes)]
+    for day in days:
+        for i in range(0, len(vehicles), batch):
+            buffer = breadcrumb_buffer()
+            for vid in vehicles[i:i + batch]:
+                recs = breadcrumb_records(vid, records, opd_date=day.strftime("%d%b%Y").upper() + ":00:00:00",
+                                          seed=vid * 1000 + day.toordinal())
+                # vehicles share routes and start through the day, so cells and
+                # hours fill up as they would with real buses
+                lat, lon = paths[vid % routes]
+                for j, r in enumerate(recs):
+                    r["EVENT_NO_TRIP"] += (day - FIRST_DAY).days * 1000000
+                    r["ACT_TIME"] += (vid % 12) * 3600
+                    r["GPS_LATITUDE"], r["GPS_LONGITUDE"] = float(lat[j]), float(lon[j])
+                buffer.extend(recs)
+            yield updated_subscriber.build_tables(updated_subscriber.validate(transform_breadcrumbs(buffer.take_frame())))
+
+
+def create_schema(conn, files):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+    for path in files:
+        with open(path) as f:
+            cursor.execute(f.read())
+    conn.commit()
+    cursor.close()
+
+
+def load(conn, frames):
+    start = time.perf_counter()
+    rows = sum(updated_subscriber.load_batch(conn, trips, breadcrumbs)[1] for trips, breadcrumbs in frames)
+    return rows, time.perf_counter() - start
+
+
+def scan(conn, bbox=None, hours=None, min_speed=SPEEDING):
+    """The same statistics straight from breadcrumb, over the same whole cells."""
+    clauses, params = ["speed >= 0", "latitude IS NOT NULL", "longitude IS NOT NULL"], {"min_speed": min_speed}
+    lon_step, lat_step = speedstats.maps.cell_steps(speedstats.CELL_METERS)
+    if bbox is not None:
+        gx_min, gx_max, gy_min, gy_max = speedstats.cell_range(*bbox)
+        params.update(west=gx_min * lon_step, east=(gx_max + 1) * lon_step,
+                      south=gy_min * lat_step, north=(gy_max + 1) * lat_step)
+        clauses.append("point(longitude, latitude) <@ box(point(%(west)s, %(south)s), point(%(east)s, %(north)s))")
+    if hours is not None:
+        params["hours"] = hours
+        clauses.append("(extract(isodow FROM tstamp)::int - 1) * 24 + extract(hour FROM tstamp)::int = ANY(%(hours)s)")
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT count(*), avg(speed), max(speed),
+               percentile_cont(ARRAY[0.5, 0.85, 0.95]) WITHIN GROUP (ORDER BY speed),
+               avg((speed >= %(min_speed)s)::int)
+        FROM breadcrumb WHERE {' AND '.join(clauses)}
+    """, params)
+    n, mean, top, quantiles, share = cursor.fetchone()
+    p50, p85, p95 = quantiles or (None, None, None)
+    cursor.close()
+    return {"n": n, "mean": mean, "max": top, "p50": p50, "p85": p85, "p95": p95, "share_above": share}
+
+
+def timed(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def agree(raw, stats):
+    assert raw["n"] == stats["n"], (raw, stats)
+    if not raw["n"]:
+        return
+    for name in ("mean", "max", "share_above"):
+        assert abs(float(raw[name]) - stats[name]) < 1e-6, (name, raw, stats)
+    for q in speedstats.PERCENTILES:
+        assert abs(raw[f"p{q}"] - stats[f"p{q}"]) <= speedstats.BIN_WIDTH, (q, raw, stats)
+
+
+def table(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT gx, gy, hour_of_week, n, round(sum_speed::numeric, 3), max_speed, hist "
+                   "FROM speed_stats ORDER BY 1, 2, 3")
+    rows = cursor.fetchall()
+    cursor.execute("SELECT hour_of_week, n, round(sum_speed::numeric, 3), max_speed, hist "
+                   "FROM speed_stats_hourly ORDER BY 1")
+    rows += cursor.fetchall()
+    cursor.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--records", type=int, default=2000, help="breadcrumbs per vehicle and day")
+    parser.add_argument("--batch", type=int, default=10, help="vehicles per load")
+    parser.add_argument("--dsn", required=True, help="database for the scratch schema")
+    args = parser.parse_args()
+
+    updated_subscriber.REJECTED_FOLDER = None
+    days = [FIRST_DAY + timedelta(days=i) for i in range(args.days)]
+    vehicles = list(range(2900, 2900 + args.vehicles))
+    frames = list(batches(days, vehicles, args.records, args.batch))
+    conn = psycopg2.connect(args.dsn)
+    try:
+        create_schema(conn, SCHEMA_FILES[:2])
+        rows, plain = load(conn, frames)
+        create_schema(conn, SCHEMA_FILES)
+        _, with_stats = load(conn, frames)
+        print(f"{rows} breadcrumbs in {len(frames)} loads: {plain:.1f}s without speed_stats, "
+              f"{with_stats:.1f}s with it (+{(with_stats - plain) / plain:.0%})")
+
+        before = table(conn)
+        print(f"speed_stats + speed_stats_hourly: {len(before)} rows")
+        load(conn, frames[:3])
+        assert table(conn) == before, "redelivered batches were counted again"
+        print("redelivered batches not counted again")
+
+        cursor = conn.cursor()
+        cursor.execute("ANALYZE breadcrumb")
+        conn.commit()
+        cursor.close()
+        questions = (
+            ("1 km box, any time", BOX, None),
+            ("weekdays 16-19", None, speedstats.hours("weekdays", 16, 19)),
+            ("every day 22-24", None, speedstats.hours("all", 22, 24)),
+            ("box, weekdays 16-19", BOX, speedstats.hours("weekdays", 16, 19)),
+            ("everything", None, None),
+        )
+        print(f"\n{'':24s} {'breadcrumbs':>12s} {'scan ms':>10s} {'summary ms':>11s}")
+        for label, bbox, hours in questions:
+            scan_s, raw = timed(scan, conn, bbox, hours, repeat=2)
+            stats_s, stats = timed(speedstats.summary, conn, bbox, hours, SPEEDING)
+            agree(raw, stats)
+            line = f"{label:24s} {raw['n']:12d} {scan_s * 1000:10.1f} {stats_s * 1000:11.2f}   {scan_s / stats_s:6.0f}x"
+            if stats["n"]:
+                line += f"   p85 {stats['p85']:.1f}, {SPEEDING}+ m/s {stats['share_above']:.2%}"
+            print(line)
+        print("summary and scan agree")
+
+        started = time.perf_counter()
+        speedstats.rebuild(conn)
+        assert table(conn) == before, "rebuild differs from the incremental table"
+        print(f"\nrebuild_speed_stats(): {time.perf_counter() - started:.1f}s, same table as the trigger built")
+    finally:
+        conn.rollback()
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Serial stop-event gather vs the pipelined fetch -> parse -> publish gather.
+
+The serial run is the old gather_data loop: one requests.get per vehicle,
+then the parse, then the next vehicle. The pipelined runs use
+PipelinedGather with the given parse-process counts and publish into the
+in-process fake Pub/Sub. Each run prints the per-stage breakdown.
+
+    python benchmarks/bench_stop_gather.py --vehicles 100 --latency 0.1 --parse-workers 0,2,4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.fetcher import VehicleFetcher
+from pipeline.gather import PipelinedGather
+from pipeline.publishing import FlowControlledPublisher
+from pipeline.stop_pages import parse_stop_events
+from stub_server import StubServer
+
+import fake_pubsub
+
+
+def make_flow():
+    client = fake_pubsub.PublisherClient(fake_pubsub.FakeBroker())
+    return FlowControlledPublisher(client, client.topic_path("bench", "stops"), report_interval=0)
+
+
+def publish(flow, records):
+    for record in records:
+        flow.publish(json.dumps(record).encode("utf-8"))
+
+
+def serial_gather(url_template, vehicle_ids):
+    flow = make_flow()
+    fetch_s = parse_s = publish_s = 0.0
+    total = 0
+    for vid in vehicle_ids:
+        start = time.perf_counter()
+        response = requests.get(url_template.format(vid), timeout=10)
+        fetched = time.perf_counter()
+        records = parse_stop_events(response.text)
+        parsed = time.perf_counter()
+        publish(flow, records)
+        fetch_s += fetched - start
+        parse_s += parsed - fetched
+        publish_s += time.perf_counter() - parsed
+        total += len(records)
+    flow.close()
+    print(f"  fetch {fetch_s:.2f}s, parse {parse_s:.2f}s, publish {publish_s:.2f}s")
+    return total
+
+
+def pipelined_gather(url_template, vehicle_ids, fetch_workers, parse_workers):
+    flow = make_flow()
+    total = 0
+    with VehicleFetcher(url_template, max_workers=fetch_workers) as fetcher:
+        gather = PipelinedGather(fetcher, parse_stop_events, parse_workers=parse_workers)
+        for vid, result, records in gather.run(vehicle_ids):
+            publish(flow, records)
+            total += len(records)
+    flow.close()
+    print(f"  {gather.stats.format()}")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.1, help="server delay per request (s)")
+    parser.add_argument("--trips", type=int, default=8, help="trip tables per page")
+    parser.add_argument("--stops", type=int, default=40, help="stop events per trip")
+    parser.add_argument("--fetch-workers", type=int, default=16)
+    parser.add_argument("--parse-workers", default="0,2", help="comma-separated process counts")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, stop_trips=args.trips, stops_per_trip=args.stops).start()
+    url_template = server.base_url + "/api/getStopEvents?vehicle_num={}"
+    vehicle_ids = [str(2900 + i) for i in range(args.vehicles)]
+    print(f"{args.vehicles} vehicles, {args.latency * 1000:.0f} ms latency, "
+          f"{args.trips * args.stops} stop events per page, {os.cpu_count()} CPUs")
+
+    try:
+        runs = [("serial", lambda: serial_gather(url_template, vehicle_ids))]
+        for workers in (int(w) for w in args.parse_workers.split(",")):
+            runs.append((f"pipelined, {args.fetch_workers} fetch / {workers} parse",
+                         lambda w=workers: pipelined_gather(url_template, vehicle_ids, args.fetch_workers, w)))
+        totals = set()
+        for label, run in runs:
+            print(label)
+            start = time.perf_counter()
+            total = run()
+            elapsed = time.perf_counter() - start
+            totals.add(total)
+            print(f"  {total} records in {elapsed:.2f}s ({total / elapsed:,.0f} records/s)")
+        assert len(totals) == 1, "record totals differ"
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""BeautifulSoup parse_html vs the streaming stop-event table extractor.
+
+Checks the saved pages in fixtures/stop_pages/ first: the streaming parser
+must return exactly what the BeautifulSoup logic returns when applied to
+every table of the page, and its first-table records must equal the old
+parse_html output. Then times both on synthetic full-day pages.
+
+    python benchmarks/bench_stop_parse.py --pages 50 --trips 12 --stops 60
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.stop_pages import StopEventTableParser, parse_stop_events
+from synthetic import stop_event_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "stop_pages")
+
+
+def table_records(table):
+    # the body of StopEventPublisher.parse_html for one table
+    rows = table.find_all("tr")
+    header = [th.text.strip() for th in rows[0].find_all("th")]
+    records = []
+    for row in rows[1:]:
+        cells = row.find_all("td")
+        if len(cells) != len(header):
+            continue
+        records.append({header[i]: cells[i].text.strip() for i in range(len(cells))})
+    return records
+
+
+def legacy_parse(html):
+    table = BeautifulSoup(html, 'html.parser').find("table")
+    return table_records(table) if table else []
+
+
+def legacy_parse_all(html):
+    records = []
+    for table in BeautifulSoup(html, 'html.parser').find_all("table"):
+        records.extend(table_records(table))
+    return records
+
+
+def first_table(html):
+    parser = StopEventTableParser()
+    parser.feed(html[:html.find("</table>") + len("</table>")] if "</table>" in html else html)
+    parser.close()
+    return parser.pop_records()
+
+
+def check_fixtures():
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "*.html"))):
+        with open(path) as f:
+            html = f.read()
+        records = parse_stop_events(html)
+        assert records == legacy_parse_all(html), f"{path}: records differ"
+        assert first_table(html) == legacy_parse(html), f"{path}: first table differs"
+        print(f"fixture {os.path.basename(path)}: {len(records)} records "
+              f"(parse_html saw {len(legacy_parse(html))}), identical")
+
+
+def timed(parse, pages, repeat):
+    best, total = None, 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = sum(len(parse(page)) for page in pages)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--trips", type=int, default=12, help="trip tables per page")
+    parser.add_argument("--stops", type=int, default=60, help="stop events per trip")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    check_fixtures()
+
+    pages = [stop_event_page(2900 + i, args.trips, args.stops) for i in range(args.pages)]
+    size = sum(len(page) for page in pages) / 1e6
+    print(f"\n{args.pages} pages, {size:.1f} MB, {args.trips} tables x {args.stops} rows each")
+    results = {}
+    for label, parse in (("bs4 first table", legacy_parse), ("bs4 all tables", legacy_parse_all),
+                         ("streaming", parse_stop_events)):
+        seconds, records = timed(parse, pages, args.repeat)
+        results[label] = (seconds, records)
+        print(f"{label:16s} {records:>8} records {seconds:7.2f}s {size / seconds:7.2f} MB/s "
+              f"{records / seconds:>10,.0f} records/s")
+    assert results["streaming"][1] == results["bs4 all tables"][1]
+    print(f"speedup vs bs4 (all tables): {results['bs4 all tables'][0] / results['streaming'][0]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
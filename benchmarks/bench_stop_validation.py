@@ -0,0 +1,119 @@
+"""Per-row validate_* methods vs the columnar stop-event rules.
+
+First checks that both accept exactly the same rows of
+fixtures/stop_events_validation.json, then times them on synthetic stop events.
+
+    python benchmarks/bench_stop_validation.py --rows 500000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.validation import STOP_EVENT_COLUMNS, STOP_EVENT_RULES, cast_stop_events, validate
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "stop_events_validation.json")
+
+
+def legacy_validate(df):
+    # the checks StopEventSubscriber ran per row before pipeline/validation.py
+    def check(row):
+        assert row["vehicle_number"].isdigit()
+        assert row["stop_time"] not in (None, "", " ")
+        speed = float(row.get("maximum_speed", 0))
+        assert 0 <= speed <= 70
+        assert row["direction"] in ["0", "1"]
+        assert row["trip_number"].isdigit()
+        assert row["service_key"] in ["W", "S", "U"]
+        assert row["arrive_time"] <= row["leave_time"]
+        assert row["estimated_load"] in ["", "low", "medium", "high"]
+        assert int(row["dwell"]) >= 0
+        assert row["location_id"].isdigit()
+
+    accepted = []
+    for i, row in df.iterrows():
+        try:
+            check(row.to_dict())
+            accepted.append(i)
+        except Exception:
+            pass
+    return accepted
+
+
+def columnar_validate(df):
+    return validate(df, STOP_EVENT_RULES, typed=cast_stop_events(df))
+
+
+def compare(df):
+    old = legacy_validate(df)
+    result = columnar_validate(df)
+    assert old == list(result.valid.index), "accepted rows differ"
+    assert len(result.valid) + len(result.rejected) == len(df)
+    return result
+
+
+def synthetic_stop_events(rows, seed=0):
+    """Stop events as parse_html emits them: every field a string."""
+    rng = np.random.default_rng(seed)
+
+    def text(values):
+        return pd.Series(values).astype(str).astype(object)
+
+    arrive = rng.integers(16000, 90000, rows)
+    dwell = rng.integers(0, 120, rows)
+    df = pd.DataFrame({c: text(rng.integers(0, 10, rows)) for c in STOP_EVENT_COLUMNS})
+    df['vehicle_number'] = text(rng.integers(2900, 4300, rows))
+    df['trip_number'] = text(rng.integers(1000, 9000, rows))
+    df['location_id'] = text(rng.integers(1, 14000, rows))
+    df['arrive_time'] = text(arrive)
+    df['leave_time'] = text(arrive + dwell)
+    df['stop_time'] = text(arrive - 10)
+    df['dwell'] = text(dwell)
+    df['direction'] = text(rng.integers(0, 2, rows))
+    df['service_key'] = text(rng.choice(["W", "S", "U"], rows))
+    df['estimated_load'] = text(rng.choice(["", "low", "medium", "high"], rows))
+    df['maximum_speed'] = text(rng.integers(0, 72, rows))
+    for c in ['train_mileage', 'pattern_distance', 'location_distance', 'x_coordinate', 'y_coordinate']:
+        df[c] = text(np.round(rng.random(rows) * 10000, 1))
+
+    # sprinkle in the faults the rules are there for
+    for column, bad in [('vehicle_number', ""), ('stop_time', " "), ('dwell', "-1"),
+                        ('direction', "2"), ('location_id', "n/a"), ('maximum_speed', "fast")]:
+        hit = rng.random(rows) < 0.002
+        df.loc[hit, column] = bad
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    args = parser.parse_args()
+
+    with open(FIXTURE) as f:
+        fixture = pd.DataFrame(json.load(f))[STOP_EVENT_COLUMNS]
+    result = compare(fixture)
+    print(f"fixture: {len(result.valid)} accepted, {len(result.rejected)} rejected, identical to validate_row")
+    print("  " + ", ".join(f"{k}={v}" for k, v in result.failures.items() if v))
+
+    df = synthetic_stop_events(args.rows)
+    start = time.perf_counter()
+    old = legacy_validate(df)
+    legacy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    result = columnar_validate(df)
+    columnar_s = time.perf_counter() - start
+    assert old == list(result.valid.index), "accepted rows differ"
+
+    print(f"rows:      {args.rows} ({len(result.valid)} accepted)")
+    print(f"iterrows:  {legacy_s:8.2f}s")
+    print(f"columnar:  {columnar_s:8.3f}s")
+    print(f"speedup:   {legacy_s / columnar_s:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""trip_full_view before (breadcrumb x stop_events per trip) and after (as-of trip_timeline).
+
+Builds Part3/stop.sql + Part3/trip_timeline.sql in a scratch schema, fills
+it with synthetic trips, breadcrumbs and stop events, then reports the
+row counts and query times of the old view definition next to the
+materialized timeline, plus how long full-day and per-trip refreshes take.
+
+    python benchmarks/bench_timeline.py --dsn "dbname=scratch" --trips 400
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCHEMA_FILES = [os.path.join(ROOT, "Part3", "stop.sql"), os.path.join(ROOT, "Part3", "trip_timeline.sql")]
+SCHEMA = "bench_timeline"
+DAY = "2023-01-15"
+
+LEGACY_VIEW = """
+CREATE VIEW trip_full_view_legacy AS
+SELECT t.trip_id, t.vehicle_id, t.route_id, t.service_key, t.direction,
+       b.tstamp, b.latitude, b.longitude, b.speed,
+       s.stop_time, s.leave_time, s.arrive_time, s.location_id, s.dwell, s.ons, s.offs,
+       s.estimated_load, s.maximum_speed, s.train_mileage, s.lift
+FROM trip t
+LEFT JOIN breadcrumb b ON t.trip_id = b.trip_id
+LEFT JOIN stop_events s ON t.trip_id = s.trip_id
+"""
+
+# (label, query with a {view} placeholder)
+QUERIES = [
+    ("rows for the day", "SELECT count(*) FROM {view} WHERE tstamp >= DATE '2023-01-15' AND tstamp < DATE '2023-01-16'"),
+    ("one trip", "SELECT * FROM {view} WHERE trip_id = 238300123"),
+    ("route 35 for the day", "SELECT * FROM {view} WHERE route_id = 35 "
+                             "AND tstamp >= DATE '2023-01-15' AND tstamp < DATE '2023-01-16'"),
+]
+
+
+def load_data(cursor, trips, points, stops):
+    params = {"trips": trips, "points": points, "stops": stops, "day": DAY}
+    cursor.execute("SELECT create_breadcrumb_partition(%(day)s)", params)
+    cursor.execute("""
+        INSERT INTO trip
+        SELECT 238300000 + g, g %% 100, (3000 + g %% 700)::text, 'Weekday', 'Out'
+        FROM generate_series(0, %(trips)s - 1) g
+    """, params)
+    # trips start between 05:00 and 21:40 and report every 5 s
+    cursor.execute("""
+        INSERT INTO breadcrumb (trip_id, tstamp, latitude, longitude, speed)
+        SELECT 238300000 + g,
+               %(day)s::date + (18000 + (g * 997) %% 60000 + i * 5) * INTERVAL '1 second',
+               45.40 + ((g * 7919 + i * 13) %% 2000) / 10000.0,
+               -122.80 + ((g * 104729 + i * 17) %% 2500) / 10000.0,
+               ((g + i) %% 300) / 10.0
+        FROM generate_series(0, %(trips)s - 1) g, generate_series(0, %(points)s - 1) i
+        ORDER BY 2
+    """, params)
+    cursor.execute("""
+        INSERT INTO stop_events (vehicle_number, trip_id, stop_time, leave_time, arrive_time, route_id,
+                                 direction, service_key, dwell, location_id, ons, offs, estimated_load)
+        SELECT (3000 + g %% 700)::text, 238300000 + g,
+               (18000 + (g * 997) %% 60000 + k * %(points)s * 5 / %(stops)s)::text,
+               (18000 + (g * 997) %% 60000 + k * %(points)s * 5 / %(stops)s + 12)::text,
+               (18000 + (g * 997) %% 60000 + k * %(points)s * 5 / %(stops)s)::text,
+               (g %% 100)::text, '0', 'W', '12', ((g * 31 + k) %% 14000)::text, '1', '0', 'low'
+        FROM generate_series(0, %(trips)s - 1) g, generate_series(0, %(stops)s - 1) k
+    """, params)
+
+
+def timed(cursor, sql, params=None, repeat=1):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        result = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="dbname=scratch")
+    parser.add_argument("--trips", type=int, default=400)
+    parser.add_argument("--points", type=int, default=150, help="breadcrumbs per trip")
+    parser.add_argument("--stops", type=int, default=40, help="stop events per trip")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="leave the bench schema in place")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        for path in SCHEMA_FILES:
+            with open(path) as f:
+                cursor.execute(f.read())
+        cursor.execute(LEGACY_VIEW)
+        load_data(cursor, args.trips, args.points, args.stops)
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("VACUUM ANALYZE")
+        conn.autocommit = False
+
+        seconds, rows = timed(cursor, "SELECT refresh_trip_timeline(%s)", (DAY,))
+        conn.commit()
+        print(f"full refresh of {DAY}: {rows[0][0]} rows in {seconds:.2f}s")
+        sample = [238300000 + g for g in range(0, args.trips, max(1, args.trips // 20))]
+        seconds, rows = timed(cursor, "SELECT refresh_trip_timeline_trips(%s::bigint[])", (sample,))
+        conn.commit()
+        print(f"incremental refresh of {len(sample)} trips: {rows[0][0]} rows in {seconds:.3f}s")
+        cursor.execute("ANALYZE trip_timeline")
+
+        print(f"\n{'query':22s} {'legacy rows':>12s} {'legacy s':>9s} {'timeline rows':>14s} {'timeline s':>11s}")
+        for label, sql in QUERIES:
+            old_s, old = timed(cursor, sql.format(view="trip_full_view_legacy"), repeat=args.repeat)
+            new_s, new = timed(cursor, sql.format(view="trip_full_view"), repeat=args.repeat)
+            old_rows = old[0][0] if label.startswith("rows") else len(old)
+            new_rows = new[0][0] if label.startswith("rows") else len(new)
+            print(f"{label:22s} {old_rows:12d} {old_s:9.3f} {new_rows:14d} {new_s:11.3f}")
+    finally:
+        conn.rollback()
+        if not args.keep:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Trip lines: one PolyLine + two Markers per trip vs maps.tracks_map.
+
+Builds a synthetic week of trips (--trips per day of --points breadcrumbs
+driving a street grid, with a few meters of GPS noise) and renders them
+the way Part3/visualize_map.py did (groupby trip, sort again, a
+``folium.PolyLine`` of every breadcrumb and a start and end ``Marker``)
+and with ``maps.tracks_map`` at a few Douglas-Peucker tolerances,
+reporting the time to build the HTML, its size and the vertices kept.
+The old loop is run on at most --legacy-trips trips and scaled up.
+
+    python benchmarks/bench_tracks.py --days 7 --trips 800 --points 600
+"""
+import argparse
+import os
+import sys
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline import maps
+
+METERS_PER_DEGREE = 111320.0
+
+
+def make_tracks(trips, points, seed=0):
+    rng = np.random.default_rng(seed)
+    # 50 m steps along one of four headings, turning every ~25 breadcrumbs
+    turns = rng.random((trips, points)) < 0.04
+    heading = (np.cumsum(turns * rng.choice([-1, 1], size=(trips, points)), axis=1)
+               + rng.integers(0, 4, size=(trips, 1))) % 4 * (np.pi / 2)
+    step = rng.normal(50, 5, size=(trips, points))
+    north = np.cumsum(np.sin(heading) * step, axis=1) + rng.normal(0, 3, size=(trips, points))
+    east = np.cumsum(np.cos(heading) * step, axis=1) + rng.normal(0, 3, size=(trips, points))
+    lat = 45.52 + rng.uniform(-0.06, 0.06, size=(trips, 1)) + north / METERS_PER_DEGREE
+    lon = -122.68 + rng.uniform(-0.1, 0.1, size=(trips, 1)) + east / (METERS_PER_DEGREE * np.cos(np.radians(45.52)))
+    return pd.DataFrame({
+        "trip_id": np.repeat(np.arange(230000000, 230000000 + trips), points),
+        "route_id": np.repeat(rng.integers(1, 100, size=trips), points),
+        "latitude": lat.ravel().round(6),
+        "longitude": lon.ravel().round(6),
+    })
+
+
+def legacy(df):
+    # as Part3/visualize_map.py did
+    m = folium.Map(location=[df['latitude'].mean(), df['longitude'].mean()], zoom_start=12)
+    for trip_id, trip_data in df.groupby("trip_id"):
+        coordinates = trip_data[['latitude', 'longitude']].astype(float).values.tolist()
+        folium.PolyLine(locations=coordinates, color="blue", weight=3, opacity=0.7,
+                        tooltip=f"Trip: {trip_id}").add_to(m)
+        if len(coordinates) > 1:
+            folium.Marker(coordinates[0], popup="Start", icon=folium.Icon(color="green")).add_to(m)
+            folium.Marker(coordinates[-1], popup="End", icon=folium.Icon(color="red")).add_to(m)
+    return m
+
+
+def render(build, *args):
+    start = time.perf_counter()
+    html = build(*args).get_root().render()
+    return time.perf_counter() - start, len(html.encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--trips", type=int, default=800, help="trips per day")
+    parser.add_argument("--points", type=int, default=600, help="breadcrumbs per trip")
+    parser.add_argument("--legacy-trips", type=int, default=200, help="trips rendered by the old loop")
+    args = parser.parse_args()
+
+    df = make_tracks(args.days * args.trips, args.points)
+    print(f"{df['trip_id'].nunique()} trips, {len(df)} breadcrumbs\n")
+    print(f"{'':28s} {'seconds':>9s} {'HTML MB':>10s} {'vertices':>10s}")
+
+    sample = df[df["trip_id"] < df["trip_id"].iloc[0] + args.legacy_trips]
+    seconds, size = render(legacy, sample)
+    scale = len(df) / len(sample)
+    print(f"{'PolyLine + Markers per trip':28s} {seconds * scale:9.2f} {size * scale / 1e6:10.1f} {len(df):10d}"
+          f"  (measured on {len(sample)} rows)")
+
+    for tolerance in (0, 2, 5, 10, 25):
+        start = time.perf_counter()
+        kept = len(maps.simplify_tracks(df, tolerance))
+        simplify = time.perf_counter() - start
+        seconds, size = render(maps.tracks_map, df, tolerance)
+        print(f"{f'tracks_map, {tolerance:g} m':28s} {seconds:9.2f} {size / 1e6:10.1f} {kept:10d}"
+              f"  (simplify {simplify:.2f}s)")
+    seconds, size = render(maps.tracks_map, df, maps.TOLERANCE_METERS, False)
+    print(f"{'... without markers':28s} {seconds:9.2f} {size / 1e6:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
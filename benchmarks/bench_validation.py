@@ -0,0 +1,83 @@
+"""Per-row iterrows assertions vs the columnar rule engine.
+
+First checks that both accept exactly the same rows of
+fixtures/breadcrumbs_validation.json, then times them on a synthetic day.
+
+    python benchmarks/bench_validation.py --rows 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.transform import transform_breadcrumbs
+from pipeline.validation import BREADCRUMB_RULES, validate
+from bench_transform import synthetic_day
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "breadcrumbs_validation.json")
+
+
+def legacy_validate(df):
+    # the checks updated_subscriber.py ran per row before pipeline/validation.py
+    def check(row):
+        assert isinstance(row['OPD_DATE'], str) and len(row['OPD_DATE']) > 0
+        assert row['VEHICLE_ID'] > 0
+        assert 0 <= row.get('ACT_TIME', -1) <= 86399
+        assert -90.0 <= row['GPS_LATITUDE'] <= 90.0
+        assert -180.0 <= row['GPS_LONGITUDE'] <= 180.0
+        assert row['EVENT_NO_TRIP'] > 0
+        assert row['METERS'] >= 0
+        assert row['SPEED'] >= 0
+        assert not pd.isna(row['TIMESTAMP'])
+        assert row['DAY_OF_WEEK'] in range(7)
+
+    valid_rows = []
+    for i, row in df.iterrows():
+        try:
+            check(row)
+            valid_rows.append(row)
+        except Exception:
+            pass
+    return pd.DataFrame(valid_rows)
+
+
+def compare(df):
+    old = legacy_validate(df)
+    result = validate(df, BREADCRUMB_RULES)
+    assert list(old.index) == list(result.valid.index), "accepted rows differ"
+    assert len(result.valid) + len(result.rejected) == len(df)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    with open(FIXTURE) as f:
+        fixture = transform_breadcrumbs(pd.DataFrame(json.load(f)))
+    result = compare(fixture)
+    print(f"fixture: {len(result.valid)} accepted, {len(result.rejected)} rejected, identical to iterrows")
+    print("  " + ", ".join(f"{k}={v}" for k, v in result.failures.items() if v))
+
+    df = transform_breadcrumbs(synthetic_day(args.rows))
+    start = time.perf_counter()
+    legacy_validate(df)
+    legacy_s = time.perf_counter() - start
+    start = time.perf_counter()
+    validate(df, BREADCRUMB_RULES)
+    columnar_s = time.perf_counter() - start
+    compare(df)
+
+    print(f"rows:      {args.rows}")
+    print(f"iterrows:  {legacy_s:8.2f}s")
+    print(f"columnar:  {columnar_s:8.3f}s")
+    print(f"speedup:   {legacy_s / columnar_s:8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
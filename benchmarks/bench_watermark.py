@@ -0,0 +1,103 @@
+"""Repeated breadcrumb gathers with and without the per-vehicle watermark store.
+
+Runs the data_gather fetch loop against the stub server several times:
+
+* cold      empty state, everything is new
+* rerun     nothing changed; the server answers 304 to If-None-Match
+* no-etag   nothing changed, server ignores conditional requests (hash skip)
+* append    --changed vehicles gained --append records (watermark filter)
+* restart   the append run crashed before commit() and is run again
+
+and reports requests, bytes received, records passed on and time per run.
+
+    python benchmarks/bench_watermark.py --vehicles 200 --records 500
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pipeline.fetcher import VehicleFetcher
+from pipeline.watermark import WatermarkStore, breadcrumb_key
+from stub_server import StubServer
+
+
+def gather(url_template, vehicle_ids, watermarks, workers):
+    # the iter_vehicle_payloads loop of data_gather.py, minus the publishing
+    published = 0
+    headers_for = watermarks.request_headers if watermarks is not None else None
+    with VehicleFetcher(url_template, max_workers=workers) as fetcher:
+        for result in fetcher.iter_results(vehicle_ids, headers_for):
+            vid = result.vehicle_id
+            if result.error is not None:
+                continue
+            if watermarks is not None and watermarks.unchanged(vid, result.status_code, result.text):
+                continue
+            if result.status_code != 200:
+                continue
+            records = json.loads(result.text)
+            if watermarks is not None:
+                records, high = watermarks.filter_new(vid, records, breadcrumb_key)
+                watermarks.stage(vid, result.text, result.headers, high)
+            published += len(records)
+    return published
+
+
+def run(server, label, url_template, vehicle_ids, state_path, workers, commit=True):
+    server.reset_counters()
+    watermarks = WatermarkStore("breadcrumb", state_path) if state_path else None
+    start = time.perf_counter()
+    published = gather(url_template, vehicle_ids, watermarks, workers)
+    if watermarks is not None:
+        if commit:
+            watermarks.commit()
+        watermarks.close()
+    elapsed = time.perf_counter() - start
+    print(f"{label:18s} {server.requests:>8} {server.bytes_sent / 1e6:>9.1f} {published:>10} {elapsed:>8.2f}")
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vehicles", type=int, default=200)
+    parser.add_argument("--records", type=int, default=500, help="breadcrumbs per vehicle")
+    parser.add_argument("--latency", type=float, default=0.01, help="server delay per request (s)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--changed", type=int, default=10, help="vehicles that get new records")
+    parser.add_argument("--append", type=int, default=50, help="records added to each changed vehicle")
+    args = parser.parse_args()
+
+    server = StubServer(latency=args.latency, records_per_vehicle=args.records, conditional=True).start()
+    url_template = server.base_url + "/api/getBreadCrumbs?vehicle_id={}"
+    vehicle_ids = [str(2900 + i) for i in range(args.vehicles)]
+    changed = vehicle_ids[:args.changed]
+    state_path = os.path.join(tempfile.mkdtemp(), "gather_state.sqlite")
+
+    try:
+        print(f"{'run':18s} {'requests':>8} {'MB recv':>9} {'published':>10} {'seconds':>8}")
+        run(server, "no state", url_template, vehicle_ids, None, args.workers)
+        cold = run(server, "cold", url_template, vehicle_ids, state_path, args.workers)
+        assert cold == args.vehicles * args.records
+        assert run(server, "rerun (304)", url_template, vehicle_ids, state_path, args.workers) == 0
+
+        server.conditional = False
+        assert run(server, "rerun (hash)", url_template, vehicle_ids, state_path, args.workers) == 0
+        server.conditional = True
+
+        for vid in changed:
+            server.append(vid, args.append)
+        expected = len(changed) * args.append
+        assert run(server, "append, crashed", url_template, vehicle_ids, state_path, args.workers,
+                   commit=False) == expected
+        assert run(server, "restart", url_template, vehicle_ids, state_path, args.workers) == expected
+        assert run(server, "rerun after", url_template, vehicle_ids, state_path, args.workers) == 0
+    finally:
+        server.stop()
+        os.remove(state_path)
+
+
+if __name__ == "__main__":
+    main()
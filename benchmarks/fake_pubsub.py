@@ -0,0 +1,173 @@
+"""In-process stand-in for ``google.cloud.pubsub_v1`` used by the benchmarks.
+
+It keeps the parts of the client API this repo touches (``topic_path``,
+``publish`` returning a future, ``subscribe`` with a callback receiving
+messages that are acked or nacked) and a per-message cost model close to the
+real client: every publish gets its own future, and every delivery is a
+separate callback invocation on a worker pool.
+"""
+import itertools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class FakeBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.topics = {}  # topic_path -> [subscription queues]
+        self.subscriptions = {}  # subscription_path -> queue
+        self.published_messages = 0
+        self.published_bytes = 0
+        self._ids = itertools.count(1)
+
+    def create_subscription(self, subscription_path, topic_path):
+        with self.lock:
+            q = self.subscriptions.setdefault(subscription_path, queue.Queue())
+            self.topics.setdefault(topic_path, []).append(q)
+            return q
+
+    def publish(self, topic_path, data, attributes):
+        message_id = str(next(self._ids))
+        with self.lock:
+            self.published_messages += 1
+            self.published_bytes += len(data)
+            targets = list(self.topics.get(topic_path, []))
+        for q in targets:
+            q.put((message_id, data, attributes, time.time()))
+        return message_id
+
+
+BROKER = FakeBroker()
+
+
+class FakeMessage:
+    def __init__(self, q, message_id, data, attributes, publish_time, release=None):
+        self._queue = q
+        self._release = release
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.publish_time = publish_time
+        self.acked = False
+        self._settled = False
+
+    def _settle(self):
+        # like the real client, flow control counts a message until ack/nack
+        if not self._settled:
+            self._settled = True
+            if self._release is not None:
+                self._release()
+
+    def ack(self):
+        self.acked = True
+        self._settle()
+
+    def nack(self):
+        # redeliver, like Pub/Sub does once the ack deadline is dropped
+        self._queue.put((self.message_id, self.data, self.attributes, self.publish_time))
+        self._settle()
+
+
+class PublisherClient:
+    def __init__(self, broker=None, publish_latency=0.0, fail_rate=0.0, **kwargs):
+        self.broker = broker or BROKER
+        self.publish_latency = publish_latency
+        self.fail_rate = fail_rate
+        self._executor = ThreadPoolExecutor(max_workers=4)
+
+    @staticmethod
+    def topic_path(project, topic):
+        return f"projects/{project}/topics/{topic}"
+
+    def publish(self, topic, data, **attributes):
+        if not isinstance(data, bytes):
+            raise TypeError("data must be bytes")
+        future = Future()
+
+        def _deliver():
+            if self.publish_latency:
+                time.sleep(self.publish_latency)
+            if self.fail_rate and random.random() < self.fail_rate:
+                future.set_exception(RuntimeError("injected publish failure"))
+                return
+            future.set_result(self.broker.publish(topic, data, attributes))
+
+        self._executor.submit(_deliver)
+        return future
+
+
+class StreamingPullFuture(Future):
+    def __init__(self, stop_event):
+        super().__init__()
+        self._stop_event = stop_event
+
+    def cancel(self):
+        self._stop_event.set()
+        return super().cancel()
+
+
+class SubscriberClient:
+    def __init__(self, broker=None, **kwargs):
+        self.broker = broker or BROKER
+        self._stops = []
+
+    @staticmethod
+    def subscription_path(project, subscription):
+        return f"projects/{project}/subscriptions/{subscription}"
+
+    def subscribe(self, subscription, callback, flow_control=None, idle_timeout=None):
+        """Deliver messages to ``callback`` until cancelled.
+
+        With ``idle_timeout`` the pull finishes by itself once no message has
+        arrived for that many seconds, which lets a benchmark drain a topic.
+        """
+        with self.broker.lock:
+            q = self.broker.subscriptions.setdefault(subscription, queue.Queue())
+        stop = threading.Event()
+        future = StreamingPullFuture(stop)
+        self._stops.append(stop)
+        max_messages = getattr(flow_control, "max_messages", None) or 1000
+        in_flight = threading.BoundedSemaphore(max_messages)
+        executor = ThreadPoolExecutor(max_workers=10)
+
+        def _dispatch(message):
+            try:
+                callback(message)
+            except Exception:
+                message.nack()
+
+        def _pull():
+            idle_since = time.monotonic()
+            while not stop.is_set():
+                try:
+                    item = q.get(timeout=0.05)
+                except queue.Empty:
+                    if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                        break
+                    continue
+                idle_since = time.monotonic()
+                while not in_flight.acquire(timeout=0.05):
+                    if stop.is_set():
+                        q.put(item)
+                        break
+                else:
+                    executor.submit(_dispatch, FakeMessage(q, *item, release=in_flight.release))
+            executor.shutdown(wait=True)
+            if not future.done():
+                future.set_result(None)
+
+        threading.Thread(target=_pull, name="fake-streaming-pull", daemon=True).start()
+        return future
+
+    def close(self):
+        for stop in self._stops:
+            stop.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,167 @@
+"""Local stand-in for busdata.cs.pdx.edu used by the benchmarks.
+
+Serves synthetic ``/api/getBreadCrumbs`` payloads and ``/api/getStopEvents``
+pages, or recorded ones (``recorded=`` a folder or zip of the
+``bus_<vehicle>_<date>.json`` / ``stop_<vehicle>_<date>.html`` files the
+gatherers write), with a configurable per-request latency, and counts how many TCP connections were opened so the
+effect of keep-alive is visible. With ``conditional=True`` it sends ETag /
+Last-Modified headers and answers matching conditional requests with 304;
+``append()`` adds records to a vehicle's payload as a live feed would.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from synthetic import breadcrumb_records, stop_event_page
+
+RECORDED_NAME = re.compile(r"^(bus|stop)_(\w+?)_.*\.(json|html)$")
+
+
+def load_recorded(path):
+    """{("bus"|"stop", vehicle_id): body bytes} from a folder or a zip archive."""
+    payloads = {}
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                match = RECORDED_NAME.match(os.path.basename(name))
+                if match:
+                    payloads[match.group(1), match.group(2)] = zf.read(name)
+        return payloads
+    for name in os.listdir(path):
+        match = RECORDED_NAME.match(name)
+        if match:
+            with open(os.path.join(path, name), "rb") as f:
+                payloads[match.group(1), match.group(2)] = f.read()
+    return payloads
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with self.server.lock:
+            self.server.requests += 1
+        time.sleep(self.server.latency)
+
+        if url.path == "/api/getBreadCrumbs":
+            vid = query.get("vehicle_id", ["0"])[0]
+            body = self.server.breadcrumb_body(vid)
+            headers = {}
+            if self.server.conditional:
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                headers = {"ETag": etag, "Last-Modified": self.server.modified[vid]}
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", "application/json", headers)
+                    return
+            self._send(200, body, "application/json", headers)
+        elif url.path == "/api/getStopEvents":
+            vid = query.get("vehicle_num", ["0"])[0]
+            self._send(200, self.server.stop_event_body(vid), "text/html")
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, records_per_vehicle=500, port=0, conditional=False,
+                 stop_trips=8, stops_per_trip=40, recorded=None):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.records_per_vehicle = records_per_vehicle
+        self.conditional = conditional
+        self.stop_trips = stop_trips
+        self.stops_per_trip = stops_per_trip
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.modified = {}
+        self._records = {}
+        self._bodies = {}
+        self.recorded = load_recorded(recorded) if recorded else {}
+
+    def vehicle_ids(self):
+        """Vehicles with a recorded payload (empty when serving synthetic data)."""
+        return sorted({vid for _, vid in self.recorded})
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def breadcrumb_body(self, vid):
+        with self.lock:
+            if self.recorded:
+                self.modified.setdefault(vid, "Sun, 15 Jan 2023 12:00:00 GMT")
+                return self.recorded.get(("bus", vid), b"[]")
+            if vid not in self._bodies:
+                if vid not in self._records:
+                    self._records[vid] = breadcrumb_records(vid, self.records_per_vehicle)
+                self._bodies[vid] = json.dumps(self._records[vid]).encode("utf-8")
+                self.modified[vid] = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+            return self._bodies[vid]
+
+    def stop_event_body(self, vid):
+        key = "stop-" + vid
+        with self.lock:
+            if self.recorded:
+                return self.recorded.get(("stop", vid), b"<html><body></body></html>")
+            if key not in self._bodies:
+                page = stop_event_page(vid, self.stop_trips, self.stops_per_trip)
+                self._bodies[key] = page.encode("utf-8")
+            return self._bodies[key]
+
+    def append(self, vid, n_records):
+        """Extend a vehicle's payload with records later than its last one."""
+        self.breadcrumb_body(vid)
+        with self.lock:
+            records = self._records[vid]
+            last = records[-1]
+            for i in range(1, n_records + 1):
+                extra = dict(last)
+                extra["ACT_TIME"] = last["ACT_TIME"] + i * 5
+                extra["METERS"] = last["METERS"] + i * 55
+                records.append(extra)
+            del self._bodies[vid]
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.requests = 0
+            self.bytes_sent = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
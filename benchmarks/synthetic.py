@@ -0,0 +1,89 @@
+"""Synthetic breadcrumb payloads shaped like the getBreadCrumbs API output."""
+import random
+
+OPD_DATE = "15JAN2023:00:00:00"
+
+
+def breadcrumb_records(vehicle_id, n_records, trips=4, opd_date=OPD_DATE, seed=None):
+    rng = random.Random(seed if seed is not None else int(vehicle_id))
+    records = []
+    per_trip = max(1, n_records // trips)
+    base_trip = 228000000 + int(vehicle_id) * 100
+    for i in range(n_records):
+        trip = base_trip + i // per_trip
+        step = i % per_trip
+        records.append({
+            "EVENT_NO_TRIP": trip,
+            "EVENT_NO_STOP": trip + 2,
+            "OPD_DATE": opd_date,
+            "VEHICLE_ID": int(vehicle_id),
+            "METERS": step * 55 + rng.randint(0, 20),
+            "ACT_TIME": 18000 + (i // per_trip) * 7200 + step * 5,
+            "GPS_LONGITUDE": round(-122.68 + rng.uniform(-0.1, 0.1), 6),
+            "GPS_LATITUDE": round(45.52 + rng.uniform(-0.1, 0.1), 6),
+            "GPS_SATELLITES": 12.0,
+            "GPS_HDOP": 0.8,
+        })
+    return records
+
+
+STOP_EVENT_FIELDS = [
+    "vehicle_number", "leave_time", "train", "route_number", "direction",
+    "service_key", "trip_number", "stop_time", "arrive_time", "dwell",
+    "location_id", "door", "lift", "ons", "offs", "estimated_load",
+    "maximum_speed", "train_mileage", "pattern_distance", "location_distance",
+    "x_coordinate", "y_coordinate", "data_source", "schedule_status",
+]
+
+
+def stop_event_rows(vehicle_id, trips=8, stops_per_trip=40, seed=None):
+    """Per-trip lists of stop-event rows (field values as strings)."""
+    rng = random.Random(seed if seed is not None else int(vehicle_id))
+    # same trip numbers as breadcrumb_records, so the two feeds join
+    base_trip = 228000000 + int(vehicle_id) * 100
+    clock = 18000
+    tables = []
+    for t in range(trips):
+        trip = base_trip + t
+        route = str(rng.choice([2, 4, 9, 14, 15, 20, 33, 72, 75]))
+        rows = []
+        for s in range(stops_per_trip):
+            dwell = rng.randint(0, 40)
+            arrive = clock + rng.randint(30, 120)
+            clock = arrive + dwell
+            rows.append({
+                "vehicle_number": str(vehicle_id), "leave_time": str(arrive + dwell),
+                "train": str(rng.randint(1, 999)), "route_number": route,
+                "direction": str(t % 2), "service_key": "W", "trip_number": str(trip),
+                "stop_time": str(arrive - rng.randint(0, 60)), "arrive_time": str(arrive),
+                "dwell": str(dwell), "location_id": str(rng.randint(1, 14000)),
+                "door": str(rng.randint(0, 2)), "lift": "0",
+                "ons": str(rng.randint(0, 9)), "offs": str(rng.randint(0, 9)),
+                "estimated_load": rng.choice(["", "low", "medium", "high"]),
+                "maximum_speed": str(rng.randint(0, 45)),
+                "train_mileage": f"{s * 0.4:.2f}",
+                "pattern_distance": f"{s * 650.0:.1f}",
+                "location_distance": f"{rng.uniform(0, 40):.1f}",
+                "x_coordinate": f"{7640000 + rng.uniform(0, 20000):.1f}",
+                "y_coordinate": f"{680000 + rng.uniform(0, 20000):.1f}",
+                "data_source": "0", "schedule_status": str(rng.randint(0, 6)),
+            })
+        tables.append((trip, rows))
+        clock += 600
+    return tables
+
+
+def stop_event_page(vehicle_id, trips=8, stops_per_trip=40, service_date="2023-01-15", seed=None):
+    """HTML shaped like the getStopEvents page: one headed table per trip."""
+    tables = stop_event_rows(vehicle_id, trips, stops_per_trip, seed)
+    out = ["<html>\n<head><title>TriMet Stop Event Data</title></head>\n<body>\n",
+           f"<h1>Trimet CAD/AVL stop data for {service_date}</h1>\n",
+           f"<p>{sum(len(rows) for _, rows in tables)} stop events found for vehicle {vehicle_id}</p>\n"]
+    header = "".join(f"<th>{f}</th>" for f in STOP_EVENT_FIELDS)
+    for trip, rows in tables:
+        out.append(f"<h2>Stop events for PDX_TRIP {trip}</h2>\n<table>\n<tr>{header}</tr>\n")
+        for row in rows:
+            out.append("<tr>" + "".join(f"<td>{row[f]}</td>" for f in STOP_EVENT_FIELDS) + "</tr>\n")
+        out.append("</table>\n")
+    out.append("</body>\n</html>\n")
+    return "".join(out)
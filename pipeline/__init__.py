@@ -0,0 +1,6 @@
+"""Shared building blocks for the TriMet breadcrumb and stop-event pipeline.
+
+The scripts under Part1/, Part2/ and Part3/ add the repository root to
+``sys.path`` and import from here, so every stage uses the same fetch,
+publish, transform and load code.
+"""
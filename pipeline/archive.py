@@ -0,0 +1,399 @@
+"""Side-output archive of the raw per-vehicle payloads.
+
+The archive is written on its own thread from an in-memory queue, so the
+publish path never waits on (or reads back from) the disk. Two formats:
+
+``ZipArchiveWriter``      the day's raw JSON responses, one file per vehicle,
+                          in a single zip
+``ParquetArchiveWriter``  the breadcrumbs typed (``ARCHIVE_SCHEMA``) and
+                          zstd-compressed, partitioned by service date and
+                          vehicle in hive layout::
+
+    <root>/service_date=2023-01-15/vehicle=2901/part-<tag>.parquet
+
+A zip has to be opened and every JSON file parsed again to get at any of
+it. ``BreadcrumbArchive`` reads the Parquet layout through
+``pyarrow.dataset``: a date range or vehicle list prunes whole directories
+before anything is opened, other filters are checked against the row-group
+statistics (rows are sorted by trip and time), and only the requested
+columns are decoded. Frames come back with the raw breadcrumb columns, so
+they go straight into ``transform.transform_breadcrumbs``.
+
+Records whose fields can't be stored in the typed schema (strings in a
+numeric field, an unparseable OPD_DATE) are not dropped: they are written
+as JSON under ``<root>/_rejects/<tag>/``, which the reader skips.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import zipfile
+from datetime import date, datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from pipeline.columnar import BREADCRUMB_SCHEMA, ColumnBuffer
+from pipeline.transform import OPD_DATE_FORMAT
+from pipeline.validation import numeric
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+COMPRESSION = "zstd"
+COMPRESSION_LEVEL = 3
+ROW_GROUP_ROWS = 128 * 1024
+# rows are sorted by trip and time, so the integer columns barely change
+# from row to row (delta encoding) and coordinates move a little (byte
+# stream split lets zstd find the unchanged high bytes); the rest repeat a
+# handful of values per file and stay dictionary-encoded
+COLUMN_ENCODING = {
+    "EVENT_NO_TRIP": "DELTA_BINARY_PACKED",
+    "EVENT_NO_STOP": "DELTA_BINARY_PACKED",
+    "VEHICLE_ID": "DELTA_BINARY_PACKED",
+    "METERS": "DELTA_BINARY_PACKED",
+    "ACT_TIME": "DELTA_BINARY_PACKED",
+    "GPS_LONGITUDE": "BYTE_STREAM_SPLIT",
+    "GPS_LATITUDE": "BYTE_STREAM_SPLIT",
+}
+DICTIONARY_COLUMNS = ["OPD_DATE", "GPS_SATELLITES", "GPS_HDOP"]
+
+_STOP = object()
+
+_ARROW_TYPES = {"int": "int64", "float": "float64", "text": "string"}
+# partition columns, typed when the directory names are read back
+PARTITIONING = [("service_date", "date32"), ("vehicle", "int64")]
+
+
+class ZipArchiveWriter:
+    def __init__(self, zip_path, max_pending=64):
+        self.zip_path = zip_path
+        self.tmp_path = zip_path + ".part"
+        self.files_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+
+        os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="zip-archive", daemon=True)
+        self._thread.start()
+
+    def add(self, name, text):
+        """Queue one file for the archive; blocks only if the writer falls far behind."""
+        if self._error is None:
+            self._queue.put((name, text))
+
+    def _run(self):
+        try:
+            with zipfile.ZipFile(self.tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                while True:
+                    item = self._queue.get()
+                    if item is _STOP:
+                        break
+                    name, text = item
+                    zf.writestr(name, text)
+                    self.files_written += 1
+        except Exception as e:
+            self._error = e
+            logger.error(f"Error writing archive {self.zip_path}: {e}")
+            # keep draining so producers never block on a dead writer
+            while self._queue.get() is not _STOP:
+                pass
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._error is None:
+            os.replace(self.tmp_path, self.zip_path)
+        return self._error is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@lru_cache(maxsize=256)
+def _service_date(opd_date):
+    """The date of an OPD_DATE string ("15JAN2023:00:00:00"), None if it doesn't parse."""
+    try:
+        return datetime.strptime(opd_date, OPD_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("the Parquet archive needs the pyarrow package")
+
+
+def archive_schema():
+    """The typed breadcrumb schema the Parquet archive is written with."""
+    _require_pyarrow()
+    return pa.schema([(name, getattr(pa, _ARROW_TYPES[kind])()) for name, kind in BREADCRUMB_SCHEMA])
+
+
+def type_breadcrumbs(df):
+    """Split a raw breadcrumb frame into (typed arrow columns, rejected row mask).
+
+    A row is rejected when any field holds something its column can't: a
+    non-number in a numeric field, a fraction in an integer field, an
+    OPD_DATE that doesn't parse. Missing values are fine and become nulls.
+    """
+    rejected = np.zeros(len(df), dtype=bool)
+    columns = {}
+    for name, kind in BREADCRUMB_SCHEMA:
+        if name not in df.columns:
+            columns[name] = None
+            continue
+        s = df[name]
+        present = s.notna().to_numpy()
+        if kind == "text":
+            values = s.to_numpy(dtype=object)
+            rejected |= present & ~np.array([isinstance(v, str) for v in values], dtype=bool)
+            columns[name] = values
+            continue
+        values = numeric(df, name).to_numpy()
+        missing = np.isnan(values)
+        rejected |= present & missing
+        if kind == "int":
+            rejected |= ~missing & (values != np.trunc(values))
+        columns[name] = (values, missing)
+    return columns, rejected
+
+
+def _to_arrow(columns, keep, schema):
+    arrays = []
+    for field in schema:
+        column = columns[field.name]
+        rows = int(keep.sum())
+        if column is None:
+            arrays.append(pa.nulls(rows, field.type))
+        elif pa.types.is_string(field.type):
+            arrays.append(pa.array(column[keep], type=field.type, from_pandas=True))
+        else:
+            values, missing = column[0][keep], column[1][keep]
+            if pa.types.is_integer(field.type):
+                values = np.where(missing, 0, values).astype(np.int64)
+            arrays.append(pa.array(values, type=field.type, mask=missing))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class ParquetArchiveWriter:
+    """Write each vehicle's breadcrumbs as typed Parquet under ``root``.
+
+    ``tag`` names the part files: a run writing the same tag again replaces
+    its earlier files, a different tag (e.g. a rerun that only carries new
+    records) adds parts next to them.
+    """
+
+    def __init__(self, root, tag, max_pending=64, compression=COMPRESSION,
+                 compression_level=COMPRESSION_LEVEL):
+        _require_pyarrow()
+        self.root = root
+        self.tag = tag
+        self.compression = compression
+        self.compression_level = compression_level
+        self.schema = archive_schema()
+        self.files_written = 0
+        self.rows_written = 0
+        self.rows_rejected = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+
+        os.makedirs(root, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="parquet-archive", daemon=True)
+        self._thread.start()
+
+    def add(self, vehicle_id, records):
+        """Queue one vehicle's decoded records; blocks only if the writer falls far behind."""
+        if self._error is None and records:
+            self._queue.put((vehicle_id, records))
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                self._write_vehicle(*item)
+        except Exception as e:
+            self._error = e
+            logger.error(f"Error writing archive under {self.root}: {e}")
+            # keep draining so producers never block on a dead writer
+            while self._queue.get() is not _STOP:
+                pass
+
+    def _typed(self, records):
+        """(arrow table, record index of each row) for the records that fit the schema."""
+        try:
+            # clean payloads convert in one call
+            table = pa.Table.from_pylist(records, schema=self.schema)
+            return table, np.arange(len(records))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError, TypeError):
+            pass
+        buffer = ColumnBuffer(BREADCRUMB_SCHEMA)
+        buffer.extend(records)
+        columns, rejected = type_breadcrumbs(buffer.take_frame())
+        return _to_arrow(columns, ~rejected, self.schema), np.flatnonzero(~rejected)
+
+    def _write_vehicle(self, vehicle_id, records):
+        table, rows = self._typed(records)
+
+        # OPD_DATE takes a value or two per vehicle: parse those, then split on them
+        opd_date = table.column("OPD_DATE")
+        by_day = {}
+        for value in pc.unique(opd_date).drop_null().to_pylist():
+            day = _service_date(value)
+            if day is not None:
+                by_day.setdefault(day, []).append(value)
+
+        written = np.zeros(len(records), dtype=bool)
+        for day, day_values in sorted(by_day.items()):
+            mask = pc.is_in(opd_date, value_set=pa.array(day_values, pa.string()))
+            part = table.filter(mask)
+            # sorted rows give tight row-group statistics for trip / time filters
+            part = part.sort_by([("EVENT_NO_TRIP", "ascending"), ("ACT_TIME", "ascending")])
+            self._write_part(day, vehicle_id, part)
+            written[rows[mask.to_numpy(zero_copy_only=False)]] = True
+
+        if not written.all():
+            rejected = np.flatnonzero(~written)
+            self.rows_rejected += len(rejected)
+            self._write_rejects(vehicle_id, [records[i] for i in rejected])
+
+    def _write_part(self, day, vehicle_id, table):
+        folder = os.path.join(self.root, f"service_date={day.isoformat()}", f"vehicle={int(vehicle_id)}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{self.tag}.parquet")
+        # dot-prefixed so a reader listing the partition skips it until it is complete
+        tmp_path = os.path.join(folder, f".part-{self.tag}.parquet.tmp")
+        pq.write_table(table, tmp_path, compression=self.compression,
+                       compression_level=self.compression_level, row_group_size=ROW_GROUP_ROWS,
+                       use_dictionary=DICTIONARY_COLUMNS, column_encoding=COLUMN_ENCODING)
+        os.replace(tmp_path, path)
+        self.files_written += 1
+        self.rows_written += table.num_rows
+
+    def _write_rejects(self, vehicle_id, records):
+        folder = os.path.join(self.root, "_rejects", self.tag)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"vehicle_{vehicle_id}.json"), "w") as f:
+            json.dump(records, f, default=str)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.rows_rejected:
+            logger.warning(f"[archive] {self.rows_rejected} records did not fit the schema, "
+                           f"kept under {os.path.join(self.root, '_rejects', self.tag)}")
+        return self._error is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+class BreadcrumbArchive:
+    """Read the Parquet archive under ``root`` back as breadcrumb frames.
+
+    ``start`` / ``end`` (inclusive service dates, ``date`` or ISO strings)
+    and ``vehicles`` prune partitions; ``filter`` is any extra
+    ``pyarrow.dataset`` expression, e.g. ``ds.field("EVENT_NO_TRIP") == 228290100``;
+    ``columns`` limits what is decoded (default: every breadcrumb column).
+    """
+
+    def __init__(self, root):
+        _require_pyarrow()
+        self.root = root
+        self.partitioning = ds.partitioning(
+            pa.schema([(name, getattr(pa, kind)()) for name, kind in PARTITIONING]), flavor="hive")
+
+    def dataset(self):
+        return ds.dataset(self.root, format="parquet", schema=self._schema(),
+                          partitioning=self.partitioning, exclude_invalid_files=False,
+                          ignore_prefixes=[".", "_"])
+
+    def _schema(self):
+        schema = archive_schema()
+        for name, kind in PARTITIONING:
+            schema = schema.append(pa.field(name, getattr(pa, kind)()))
+        return schema
+
+    def dates(self):
+        """Service dates present in the archive, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        days = []
+        for name in os.listdir(self.root):
+            key, _, value = name.partition("=")
+            if key == "service_date":
+                try:
+                    days.append(date.fromisoformat(value))
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def _expression(self, start=None, end=None, vehicles=None, filter=None):
+        expression = filter
+        clauses = []
+        start, end = _as_date(start), _as_date(end)
+        if start is not None:
+            clauses.append(ds.field("service_date") >= pa.scalar(start, pa.date32()))
+        if end is not None:
+            clauses.append(ds.field("service_date") <= pa.scalar(end, pa.date32()))
+        if vehicles is not None:
+            clauses.append(ds.field("vehicle").isin([int(v) for v in vehicles]))
+        for clause in clauses:
+            expression = clause if expression is None else expression & clause
+        return expression
+
+    def scanner(self, columns=None, start=None, end=None, vehicles=None, filter=None, dataset=None):
+        if columns is None:
+            columns = [name for name, _ in BREADCRUMB_SCHEMA]
+        if dataset is None:
+            dataset = self.dataset()
+        return dataset.scanner(columns=list(columns), filter=self._expression(start, end, vehicles, filter))
+
+    def read(self, columns=None, start=None, end=None, vehicles=None, filter=None, dataset=None):
+        """Every matching row as one DataFrame."""
+        if not os.path.isdir(self.root):
+            return pd.DataFrame(columns=columns or [name for name, _ in BREADCRUMB_SCHEMA])
+        table = self.scanner(columns, start, end, vehicles, filter, dataset).to_table()
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def iter_days(self, columns=None, start=None, end=None, vehicles=None, filter=None):
+        """Yield (service_date, DataFrame) one service date at a time.
+
+        A trip never spans service dates, so each frame can be transformed
+        (per-trip speeds) and loaded on its own while memory stays at one day.
+        """
+        start, end = _as_date(start), _as_date(end)
+        days = [day for day in self.dates()
+                if (start is None or day >= start) and (end is None or day <= end)]
+        if not days:
+            return
+        # the files are listed once; each day then only opens its own partition
+        dataset = self.dataset()
+        for day in days:
+            df = self.read(columns, day, day, vehicles, filter, dataset)
+            if not df.empty:
+                yield day, df
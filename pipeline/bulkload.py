@@ -0,0 +1,400 @@
+"""Streaming COPY of DataFrames into Postgres with explicit column mapping.
+
+Every table is described by a list of ``Column(name, source, pg_type)``:
+the table column, the frame column it is filled from and its Postgres type.
+``COPY`` always names its columns, so the frame's column order no longer
+has to match the table's.
+
+The frame is serialized ``chunk_rows`` rows at a time while Postgres reads
+from a file-like stream, so only one chunk is ever held as bytes. Two wire
+formats are supported:
+
+``csv``     COPY's text-based CSV format, NULL written as ``\\N``
+``binary``  COPY's binary format, built column-wise with numpy; types must
+            match the table (see ``pg_type``)
+
+``merge_frame`` loads through an unlogged staging table and merges on the
+table's natural key, so reloading the same batch adds nothing. Batches that
+fail anyway can be spilled to disk and replayed later. A merge that adds
+rows is recorded per service date in ``load_log`` (``log_load``).
+"""
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics
+
+Column = namedtuple("Column", ["name", "source", "pg_type"])
+LoadStats = namedtuple("LoadStats", ["table", "rows", "bytes", "seconds"])
+
+CHUNK_ROWS = 50000  # rows serialized per chunk
+READ_SIZE = 1024 * 1024  # bytes psycopg2 asks for per read
+FORMATS = ("csv", "binary")
+NULL = "\\N"
+
+COPY_SECONDS = metrics.histogram("trimet_copy_seconds", "Time to COPY one frame, by table")
+COPY_ROWS = metrics.counter("trimet_copy_rows_total", "Rows streamed through COPY, by table")
+MERGE_SECONDS = metrics.histogram("trimet_merge_seconds", "Time to stage and merge one frame, by table")
+MERGE_ROWS = metrics.counter("trimet_merge_rows_total", "Staged rows merged or skipped, by table")
+
+# === table layouts (Part3/stop.sql) ===
+TRIP_COLUMNS = [
+    Column("trip_id", "trip_id", "int8"),
+    Column("route_id", "route_id", "int4"),
+    Column("vehicle_id", "vehicle_id", "text"),
+    Column("service_key", "service_key", "text"),
+    Column("direction", "direction", "text"),
+]
+BREADCRUMB_COLUMNS = [
+    Column("trip_id", "trip_id", "int8"),
+    Column("tstamp", "tstamp", "timestamp"),
+    Column("latitude", "latitude", "float8"),
+    Column("longitude", "longitude", "float8"),
+    Column("speed", "speed", "float8"),
+]
+# stop events arrive with the 24 field names of the TriMet stop-event page
+STOP_EVENT_COLUMNS = [
+    Column("vehicle_number", "vehicle_number", "text"),
+    Column("trip_id", "trip_number", "int8"),
+    Column("stop_time", "stop_time", "text"),
+    Column("leave_time", "leave_time", "text"),
+    Column("arrive_time", "arrive_time", "text"),
+    Column("route_id", "route_number", "text"),
+    Column("direction", "direction", "text"),
+    Column("service_key", "service_key", "text"),
+    Column("maximum_speed", "maximum_speed", "text"),
+    Column("train_mileage", "train_mileage", "text"),
+    Column("dwell", "dwell", "text"),
+    Column("location_id", "location_id", "text"),
+    Column("lift", "lift", "text"),
+    Column("ons", "ons", "text"),
+    Column("offs", "offs", "text"),
+    Column("estimated_load", "estimated_load", "text"),
+]
+TABLE_COLUMNS = {
+    "trip": TRIP_COLUMNS,
+    "breadcrumb": BREADCRUMB_COLUMNS,
+    "stop_events": STOP_EVENT_COLUMNS,
+}
+# range-partitioned tables: partition column and the SQL function that
+# creates the partition holding a given day
+PARTITIONED = {
+    "breadcrumb": ("tstamp", "create_breadcrumb_partition"),
+}
+# tables whose loads are recorded in load_log, by the column giving the
+# service date of a row; caches of query results are invalidated per date
+LOGGED = {
+    "breadcrumb": "tstamp",
+}
+
+
+# === csv chunks ===
+INTEGER_TYPES = ("int2", "int4", "int8")
+
+
+def _csv_chunk(chunk, columns):
+    # a NaN turns an integer column into floats; write 42, not 42.0
+    floats = [c.source for c in columns
+              if c.pg_type in INTEGER_TYPES and pd.api.types.is_float_dtype(chunk[c.source])]
+    if floats:
+        chunk = chunk.astype({source: "Int64" for source in floats})
+    return chunk.to_csv(header=False, index=False, na_rep=NULL).encode("utf-8")
+
+
+# === binary chunks ===
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + np.array([0, 0], dtype=">i4").tobytes()
+PGCOPY_TRAILER = np.array([-1], dtype=">i2").tobytes()
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+FIXED_TYPES = {
+    "int2": ">i2", "int4": ">i4", "int8": ">i8",
+    "float4": ">f4", "float8": ">f8", "bool": "?",
+}
+
+
+def _fixed_field(s, pg_type):
+    """(null mask, (n, width) uint8 matrix) for a fixed-width type."""
+    if pg_type == "timestamp":
+        values = pd.to_datetime(s, errors="coerce")
+        null = values.isna().to_numpy()
+        micros = (values.to_numpy(dtype="datetime64[us]") - PG_EPOCH).astype(np.int64)
+        data = np.where(null, 0, micros).astype(">i8")
+    elif pg_type == "bool":
+        null = s.isna().to_numpy()
+        data = s.fillna(False).to_numpy(dtype=bool)
+    else:
+        values = pd.to_numeric(s, errors="coerce")
+        null = values.isna().to_numpy()
+        data = values.fillna(0).to_numpy().astype(FIXED_TYPES[pg_type])
+    return null, data.view(np.uint8).reshape(len(s), -1)
+
+
+def _text_field(s):
+    """(null mask, per-row byte lengths, utf-8 bytes of non-null rows)."""
+    null = s.isna().to_numpy()
+    encoded = [v.encode("utf-8") if isinstance(v, str) else str(v).encode("utf-8")
+               for v in s.to_numpy(dtype=object)[~null]]
+    lengths = np.zeros(len(s), dtype=np.int64)
+    lengths[~null] = [len(b) for b in encoded]
+    return null, lengths, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _binary_chunk(chunk, columns):
+    """Encode a chunk as binary COPY tuples without a per-row Python loop.
+
+    Each field is a 4-byte length (-1 for NULL) followed by its bytes. Field
+    lengths are computed per column, turned into offsets with a cumsum and
+    the bytes scattered into one buffer.
+    """
+    n = len(chunk)
+    fields = []
+    for column in columns:
+        s = chunk[column.source]
+        if column.pg_type == "text":
+            null, lengths, flat = _text_field(s)
+            fields.append((null, lengths, flat, None))
+        else:
+            null, matrix = _fixed_field(s, column.pg_type)
+            lengths = np.where(null, 0, matrix.shape[1])
+            fields.append((null, lengths, None, matrix))
+
+    row_lengths = 2 + sum(4 + lengths for _, lengths, _, _ in fields)
+    row_starts = np.cumsum(row_lengths) - row_lengths
+    out = np.empty(int(row_lengths.sum()), dtype=np.uint8)
+
+    count = np.frombuffer(np.array([len(columns)], dtype=">i2").tobytes(), dtype=np.uint8)
+    out[row_starts[:, None] + np.arange(2)] = count
+    pos = row_starts + 2
+    for null, lengths, flat, matrix in fields:
+        header = np.where(null, -1, lengths).astype(">i4").view(np.uint8).reshape(n, 4)
+        out[pos[:, None] + np.arange(4)] = header
+        present = ~null
+        if matrix is not None:
+            width = matrix.shape[1]
+            out[(pos[present] + 4)[:, None] + np.arange(width)] = matrix[present]
+        elif len(flat):
+            sizes = lengths[present]
+            starts = np.repeat(pos[present] + 4, sizes)
+            within = np.arange(len(flat)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            out[starts + within] = flat
+        pos = pos + 4 + lengths
+    return out.tobytes()
+
+
+# === streaming ===
+class FrameStream:
+    """File-like reader that serializes a frame chunk by chunk as COPY pulls it."""
+
+    def __init__(self, df, columns, fmt="csv", chunk_rows=CHUNK_ROWS):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown COPY format {fmt!r}, expected one of {FORMATS}")
+        missing = [c.source for c in columns if c.source not in df.columns]
+        if missing:
+            raise KeyError(f"frame is missing columns {missing}")
+        self.df = df[[c.source for c in columns]]
+        self.columns = columns
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        self.bytes = 0
+        self._chunks = self._iter_chunks()
+        self._buffer = b""
+        self._offset = 0
+
+    def _iter_chunks(self):
+        if self.fmt == "binary":
+            yield PGCOPY_HEADER
+        for start in range(0, len(self.df), self.chunk_rows):
+            chunk = self.df.iloc[start:start + self.chunk_rows]
+            if self.fmt == "binary":
+                yield _binary_chunk(chunk, self.columns)
+            else:
+                yield _csv_chunk(chunk, self.columns)
+        if self.fmt == "binary":
+            yield PGCOPY_TRAILER
+
+    def read(self, size=-1):
+        # hand out the current chunk in slices; serialize the next one only
+        # once it is used up
+        if self._offset >= len(self._buffer):
+            self._buffer = next(self._chunks, b"")
+            self._offset = 0
+        end = len(self._buffer) if size < 0 else self._offset + size
+        data = self._buffer[self._offset:end]
+        self._offset += len(data)
+        self.bytes += len(data)
+        return data
+
+
+def ensure_partitions(cursor, df, table, columns):
+    """Create the monthly partitions ``df`` needs before it is written to ``table``."""
+    if table not in PARTITIONED:
+        return
+    column, function = PARTITIONED[table]
+    source = next(c.source for c in columns if c.name == column)
+    months = pd.to_datetime(df[source], errors="coerce").dropna().dt.to_period("M").unique()
+    for month in months:
+        cursor.execute(f"SELECT {function}(%s)", (month.start_time.date(),))
+
+
+def copy_statement(table, columns, fmt="csv"):
+    names = ", ".join(c.name for c in columns)
+    if fmt == "binary":
+        return f"COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)"
+    return f"COPY {table} ({names}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+
+
+def copy_frame(cursor, df, table, columns=None, fmt="csv", chunk_rows=CHUNK_ROWS, report=True):
+    """COPY ``df`` into ``table`` through ``cursor``; returns ``LoadStats``.
+
+    ``columns`` defaults to the layout in ``TABLE_COLUMNS``. Nothing is
+    committed here; the caller owns the transaction.
+    """
+    if columns is None:
+        columns = TABLE_COLUMNS[table]
+    start = time.perf_counter()
+    stream = FrameStream(df, columns, fmt=fmt, chunk_rows=chunk_rows)
+    if len(df):
+        ensure_partitions(cursor, df, table, columns)
+        cursor.copy_expert(copy_statement(table, columns, fmt), stream, size=READ_SIZE)
+    stats = LoadStats(table, len(df), stream.bytes, time.perf_counter() - start)
+    COPY_SECONDS.observe(stats.seconds, table=table)
+    COPY_ROWS.inc(stats.rows, table=table)
+    if report:
+        print(f"[copy] {format_stats(stats)}")
+    return stats
+
+
+def format_stats(stats):
+    rate = stats.rows / stats.seconds if stats.seconds else 0.0
+    return (f"{stats.table}: {stats.rows} rows, {stats.bytes / 1e6:.1f} MB in "
+            f"{stats.seconds:.2f}s ({rate:,.0f} rows/s)")
+
+
+# === idempotent merge ===
+# natural keys the targets are deduplicated on (unique constraints in stop.sql)
+MERGE_KEYS = {
+    "trip": ["trip_id"],
+    "breadcrumb": ["trip_id", "tstamp"],
+    "stop_events": ["trip_id", "location_id", "arrive_time"],
+}
+STAGING_SUFFIX = "_staging"
+FAILED_FOLDER = "failed_batches"  # batches that could not be loaded wait here
+
+MergeStats = namedtuple("MergeStats", ["table", "staged", "merged", "seconds"])
+
+
+def merge_statement(table, staging, columns, key, update=False):
+    names = ", ".join(c.name for c in columns)
+    keys = ", ".join(key)
+    not_null = " AND ".join(f"{k} IS NOT NULL" for k in key)
+    if update:
+        changes = ", ".join(f"{c.name} = EXCLUDED.{c.name}" for c in columns if c.name not in key)
+        action = f"DO UPDATE SET {changes}"
+    else:
+        action = "DO NOTHING"
+    # DISTINCT ON drops duplicates inside the batch, ON CONFLICT those already loaded
+    return (f"INSERT INTO {table} ({names}) "
+            f"SELECT DISTINCT ON ({keys}) {names} FROM {staging} WHERE {not_null} ORDER BY {keys} "
+            f"ON CONFLICT ({keys}) {action}")
+
+
+def merge_frame(cursor, df, table, columns=None, key=None, fmt="csv", chunk_rows=CHUNK_ROWS,
+                update=False, report=True):
+    """COPY ``df`` into an unlogged staging table, then merge it into ``table``.
+
+    Rows whose natural ``key`` (default ``MERGE_KEYS[table]``) is already in
+    the table are skipped, or overwritten with ``update=True``, so a batch
+    can be loaded any number of times. Rows with a NULL key are not merged.
+    Loaders of the same table serialize on the staging table's TRUNCATE
+    until they commit; nothing is committed here.
+    """
+    if columns is None:
+        columns = TABLE_COLUMNS[table]
+    if key is None:
+        key = MERGE_KEYS[table]
+    start = time.perf_counter()
+    staging = table + STAGING_SUFFIX
+    cursor.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {staging} (LIKE {table})")
+    cursor.execute(f"TRUNCATE {staging}")
+    copied = copy_frame(cursor, df, staging, columns, fmt=fmt, chunk_rows=chunk_rows, report=False)
+    ensure_partitions(cursor, df, table, columns)
+    cursor.execute(merge_statement(table, staging, columns, key, update))
+    merged = cursor.rowcount
+    cursor.execute(f"TRUNCATE {staging}")
+    if merged > 0:
+        log_load(cursor, df, table, columns)
+    stats = MergeStats(table, copied.rows, merged, time.perf_counter() - start)
+    MERGE_SECONDS.observe(stats.seconds, table=table)
+    MERGE_ROWS.inc(stats.merged, table=table, outcome="merged")
+    MERGE_ROWS.inc(stats.staged - stats.merged, table=table, outcome="skipped")
+    if report:
+        rate = stats.staged / stats.seconds if stats.seconds else 0.0
+        print(f"[merge] {table}: {stats.staged} rows staged, {stats.merged} merged, "
+              f"{stats.staged - stats.merged} skipped (already loaded, duplicate or NULL key), "
+              f"{stats.seconds:.2f}s ({rate:,.0f} rows/s)")
+    return stats
+
+
+def log_load(cursor, df, table, columns=None):
+    """Record in load_log which service dates a load into ``table`` touched.
+
+    Goes into the caller's transaction, so the log changes exactly when the
+    rows do. A no-op for tables not in ``LOGGED`` and for databases created
+    before load_log existed.
+    """
+    if table not in LOGGED:
+        return
+    if columns is None:
+        columns = TABLE_COLUMNS[table]
+    column = LOGGED[table]
+    source = next(c.source for c in columns if c.name == column)
+    days = pd.to_datetime(df[source], errors="coerce").dt.normalize().value_counts()
+    if days.empty:
+        return
+    cursor.execute("SELECT to_regclass('load_log') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute(
+        "INSERT INTO load_log (table_name, service_date, rows) "
+        "SELECT %s, unnest(%s::date[]), unnest(%s::int[])",
+        (table, [d.date() for d in days.index], [int(n) for n in days.to_numpy()]),
+    )
+
+
+# === failed batches ===
+def spill_frame(df, table, folder=FAILED_FOLDER):
+    """Save a batch that failed to load so ``replay_spilled`` can retry it."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{table}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{len(df)}.csv")
+    df.to_csv(path, index=False, na_rep=NULL)
+    print(f"[spill] {len(df)} {table} rows saved to {path}")
+    return path
+
+
+def replay_spilled(conn, folder=FAILED_FOLDER):
+    """Merge every spilled batch in ``folder``; files are removed once committed."""
+    if not os.path.isdir(folder):
+        return 0
+    replayed = 0
+    for name in sorted(os.listdir(folder)):
+        table = name.split("-", 1)[0]
+        if not name.endswith(".csv") or table not in TABLE_COLUMNS:
+            continue
+        path = os.path.join(folder, name)
+        df = pd.read_csv(path, dtype=object, keep_default_na=False, na_values=[NULL])
+        cursor = conn.cursor()
+        try:
+            merge_frame(cursor, df, table)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"[replay] {path} still failing: {e}")
+            continue
+        finally:
+            cursor.close()
+        os.remove(path)
+        replayed += 1
+    return replayed
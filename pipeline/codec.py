@@ -0,0 +1,164 @@
+"""JSON codecs for Pub/Sub messages: msgspec, orjson or the standard library.
+
+Every publisher used ``json.dumps(record).encode("utf-8")`` and every
+callback ``json.loads(message.data.decode("utf-8"))``, both on threads that
+share the GIL with the rest of the process. A codec works on bytes
+directly (no intermediate ``str``) and is picked once per process:
+
+``msgspec``  fastest; with a schema it decodes straight into a
+             ``msgspec.Struct`` per record instead of a dict
+``orjson``   fast encode and decode to plain dicts
+``json``     the standard library, always available
+
+``get_codec()`` returns the first of ``PREFERRED`` that is installed; the
+wire format is plain JSON whichever encodes it, so publishers and
+subscribers need not agree on a backend.
+
+Typed decoding is only a shortcut: a record the struct can't hold (a list
+where a number belongs, a field that is not an object) makes that message
+fall back to plain dicts, so validation sees the bad values as they were
+sent. Fields outside the schema are discarded, as ColumnBuffer discards
+them from dicts.
+"""
+import json
+import logging
+from typing import Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+PREFERRED = ("msgspec", "orjson", "json")
+
+# stands in for a field the message did not carry; ColumnBuffer leaves it
+# out of the frame just as a missing dict key
+UNSET = msgspec.UNSET if msgspec is not None else object()
+# base class of the typed records, for isinstance checks
+TYPED_RECORD = (msgspec.Struct,) if msgspec is not None else ()
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, obj):
+        return json.dumps(obj).encode("utf-8")
+
+    def decode(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return json.loads(data)
+
+    def decode_one(self, data, schema=None):
+        """Decode one record; ``schema`` is only a hint here."""
+        return self.decode(data)
+
+    def decode_many(self, data, schema=None):
+        """Decode a JSON array of records."""
+        return self.decode(data)
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def encode(self, obj):
+        return orjson.dumps(obj)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+# what a field may hold in a typed record; anything else falls back to dicts
+if msgspec is not None:
+    _FIELD_TYPE = Union[int, float, str, bool, None, msgspec.UnsetType]
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+        self._typed = {}  # schema field names -> (record decoder, list decoder)
+
+    def encode(self, obj):
+        return self._encoder.encode(obj)
+
+    def decode(self, data):
+        return self._decoder.decode(data)
+
+    def _decoders(self, schema):
+        names = tuple(name for name, _ in schema)
+        decoders = self._typed.get(names)
+        if decoders is None:
+            # gc=False: records hold no containers, so the cycle collector can skip them
+            struct = msgspec.defstruct("Record", [(n, _FIELD_TYPE, UNSET) for n in names], gc=False)
+            decoders = self._typed[names] = (msgspec.json.Decoder(struct), msgspec.json.Decoder(list[struct]))
+        return decoders
+
+    def decode_one(self, data, schema=None):
+        """A struct with ``schema``'s fields when given (others dropped), else a dict."""
+        if schema is None:
+            return self.decode(data)
+        try:
+            return self._decoders(schema)[0].decode(data)
+        except msgspec.ValidationError:
+            return self.decode(data)
+
+    def decode_many(self, data, schema=None):
+        if schema is None:
+            return self.decode(data)
+        try:
+            return self._decoders(schema)[1].decode(data)
+        except msgspec.ValidationError:
+            return self.decode(data)
+
+
+_BACKENDS = {
+    "msgspec": (MsgspecCodec, msgspec),
+    "orjson": (OrjsonCodec, orjson),
+    "json": (JsonCodec, json),
+}
+_codecs = {}
+_default = None
+
+
+def available():
+    return [name for name in PREFERRED if _BACKENDS[name][1] is not None]
+
+
+def get_codec(name=None):
+    """The named codec, or the default (fastest installed) one."""
+    if name is None:
+        return default_codec()
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown codec {name!r}, expected one of {', '.join(PREFERRED)}")
+    codec = _codecs.get(name)
+    if codec is None:
+        cls, module = _BACKENDS[name]
+        if module is None:
+            raise ImportError(f"codec {name!r} needs the {name} package")
+        codec = _codecs[name] = cls()
+    return codec
+
+
+def default_codec():
+    global _default
+    if _default is None:
+        _default = get_codec(available()[0])
+        logger.debug(f"[codec] using {_default.name}")
+    return _default
+
+
+def set_default_codec(name):
+    """Use ``name`` (or the fastest installed with None) for every message."""
+    global _default
+    _default = get_codec(name) if name else get_codec(available()[0])
+    return _default
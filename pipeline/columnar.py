@@ -0,0 +1,288 @@
+"""Typed column buffers for decoded records.
+
+Subscribers used to keep every decoded message as a Python dict in a list
+and build the DataFrame at the end; a breadcrumb dict costs several hundred
+bytes and ``pd.DataFrame(list_of_dicts)`` copies all of it once more. A
+``ColumnBuffer`` instead appends each known field straight into a growable
+typed array as records arrive:
+
+``int``    ``array('q')``, 8 bytes a value
+``float``  ``array('d')``, 8 bytes a value, NaN when missing
+``text``   dictionary-encoded: ``array('i')`` codes into one list of the
+           distinct values (OPD_DATE, service_key... repeat all day)
+
+Records may also be the typed structs ``codec.MsgspecCodec`` decodes
+into; their fields are read straight into the same arrays.
+
+``take_frame()`` hands the arrays to pandas as NumPy views, so numeric
+columns become DataFrame columns without a copy, and starts a new set of
+arrays for the next records.
+
+Values keep the meaning they had in the DataFrame built from dicts: a
+missing value in a numeric column is NaN (an int column with any becomes
+float64, as pandas does), and a column holding something that is not a
+number at all comes back as objects with that value in place, so
+transform and validation treat every row exactly as before. A field no
+record carried is left out of the frame. Fields outside the schema are
+dropped.
+"""
+import logging
+import numbers
+import threading
+from array import array
+from itertools import groupby
+from operator import attrgetter
+
+import numpy as np
+import pandas as pd
+
+from pipeline.codec import TYPED_RECORD, UNSET
+from pipeline.validation import ROWS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# === schemas ===
+BREADCRUMB_SCHEMA = [
+    ("EVENT_NO_TRIP", "int"),
+    ("EVENT_NO_STOP", "int"),
+    ("OPD_DATE", "text"),
+    ("VEHICLE_ID", "int"),
+    ("METERS", "int"),
+    ("ACT_TIME", "int"),
+    ("GPS_LONGITUDE", "float"),
+    ("GPS_LATITUDE", "float"),
+    ("GPS_SATELLITES", "float"),
+    ("GPS_HDOP", "float"),
+]
+
+# the stop-event page cells are strings; cast_stop_events types them later
+STOP_EVENT_SCHEMA = [(name, "text") for name in (
+    "vehicle_number", "leave_time", "train", "route_number", "direction",
+    "service_key", "trip_number", "stop_time", "arrive_time", "dwell",
+    "location_id", "door", "lift", "ons", "offs", "estimated_load",
+    "maximum_speed", "train_mileage", "pattern_distance", "location_distance",
+    "x_coordinate", "y_coordinate", "data_source", "schedule_status",
+)]
+
+NAN = float("nan")
+PENDING_ROWS = 1024  # records collected before they are split into the columns
+
+
+def _is_number(value):
+    # numbers only, as validation.numeric(): "5" is not one
+    return isinstance(value, numbers.Number) and not isinstance(value, complex)
+
+
+def _floats(values, start, others):
+    """``values`` as floats: None becomes NaN, anything else that is not a
+    number is NaN too and kept in ``others`` (row -> value)."""
+    out = []
+    for i, v in enumerate(values):
+        if v is None:
+            out.append(NAN)
+        elif _is_number(v):
+            try:
+                out.append(float(v))
+            except OverflowError:
+                out.append(NAN)
+                others[start + i] = v
+        else:
+            out.append(NAN)
+            others[start + i] = v
+    return out
+
+
+def _restore(column, others):
+    # stray strings go back in as objects, so e.g. fill_gps can't turn a
+    # bad coordinate into 0.0 and validation still sees the original value
+    if not others:
+        return column
+    column = column.astype(object)
+    column[list(others)] = list(others.values())
+    return column
+
+
+class _FloatColumn:
+    def __init__(self, name):
+        self.name = name
+        self.values = array("d")
+        self.others = {}
+
+    def extend(self, values):
+        start = len(self.values)
+        try:
+            self.values.extend(values)
+        except (TypeError, OverflowError):
+            del self.values[start:]
+            self.values.extend(_floats(values, start, self.others))
+
+    def to_numpy(self):
+        column = np.frombuffer(self.values, dtype=np.float64) if self.values else np.empty(0, np.float64)
+        return _restore(column, self.others)
+
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+class _IntColumn:
+    """int64 while every value is an int; becomes a float column otherwise."""
+
+    def __init__(self, name):
+        self.name = name
+        self.values = array("q")
+        self.floats = None  # array('d') once a missing or non-int value arrives
+        self.others = {}
+
+    def extend(self, values):
+        if self.floats is None:
+            start = len(self.values)
+            try:
+                self.values.extend(values)
+                return
+            except (TypeError, OverflowError):
+                # None, a float or a string: keep going as floats with NaN
+                del self.values[start:]
+                self.floats = array("d", self.values)
+                self.values = array("q")
+        self._extend_floats(values)
+
+    def _extend_floats(self, values):
+        start = len(self.floats)
+        try:
+            self.floats.extend(values)
+        except (TypeError, OverflowError):
+            del self.floats[start:]
+            self.floats.extend(_floats(values, start, self.others))
+
+    def to_numpy(self):
+        if self.floats is not None:
+            column = np.frombuffer(self.floats, dtype=np.float64) if self.floats else np.empty(0, np.float64)
+            return _restore(column, self.others)
+        return np.frombuffer(self.values, dtype=np.int64) if self.values else np.empty(0, np.int64)
+
+    def nbytes(self):
+        if self.floats is not None:
+            return self.floats.itemsize * len(self.floats)
+        return self.values.itemsize * len(self.values)
+
+
+class _TextColumn:
+    def __init__(self, name):
+        self.name = name
+        self.codes = array("i")
+        self.index = {}  # value -> code, in first-seen order
+
+    def extend(self, values):
+        index = self.index
+        try:
+            self.codes.extend([index.setdefault(v, len(index)) for v in values])
+        except TypeError:
+            # an unhashable value (a list or dict where a string belongs)
+            self.codes.extend([index.setdefault(v if v.__hash__ else None, len(index)) for v in values])
+
+    def to_numpy(self):
+        uniques = np.empty(len(self.index), dtype=object)
+        uniques[:] = list(self.index)
+        return uniques[np.frombuffer(self.codes, dtype=np.int32)] if self.codes else np.empty(0, object)
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes)
+
+
+_COLUMNS = {"int": _IntColumn, "float": _FloatColumn, "text": _TextColumn}
+
+
+class ColumnBuffer:
+    """Accumulates records of a known schema column by column.
+
+    ``extend`` is safe to call from several Pub/Sub callback threads; it
+    can also stand in for the list ``MicroBatcher`` buffers into. Records
+    wait in a short list until ``pending_rows`` have arrived and are then
+    split into the columns together, so one-record messages don't pay the
+    per-column work one record at a time.
+    """
+
+    def __init__(self, schema=BREADCRUMB_SCHEMA, pending_rows=PENDING_ROWS, name="breadcrumb"):
+        self.schema = list(schema)
+        self.name = name  # the dataset label of records dropped as malformed
+        self.pending_rows = pending_rows
+        # reads a typed record's fields (codec.MsgspecCodec) as a tuple in schema order
+        self._fields = attrgetter(*[name for name, _ in self.schema])
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._columns = [_COLUMNS[kind](name) for name, kind in self.schema]
+        self._seen = set()
+        self._rows = 0
+        self._pending = []
+
+    def extend(self, records):
+        with self._lock:
+            self._pending.extend(records)
+            if len(self._pending) >= self.pending_rows:
+                self._flush()
+
+    def append(self, record):
+        self.extend([record])
+
+    def _flush(self):
+        # lock held; consecutive records of one kind are split together
+        pending, self._pending = self._pending, []
+        for typed, run in groupby(pending, key=lambda r: isinstance(r, TYPED_RECORD)):
+            if typed:
+                self._add_typed(list(run))
+            else:
+                run = list(run)
+                records = [r for r in run if type(r) is dict]
+                if len(records) < len(run):
+                    # a list or number where a record belongs can't be split into columns
+                    dropped = len(run) - len(records)
+                    ROWS_REJECTED.inc(dropped, dataset=self.name, rule="not_an_object")
+                    logger.warning(f"[columnar] dropped {dropped} {self.name} records that are not objects")
+                self._add_dicts(records)
+
+    def _add_dicts(self, records):
+        if not records:
+            return
+        for column in self._columns:
+            name = column.name
+            if name not in self._seen and any(name in r for r in records):
+                self._seen.add(name)
+            column.extend([r.get(name) for r in records])
+        self._rows += len(records)
+
+    def _add_typed(self, records):
+        for column, values in zip(self._columns, zip(*map(self._fields, records))):
+            if UNSET in values:
+                values = [None if v is UNSET else v for v in values]
+                if column.name not in self._seen and any(v is not None for v in values):
+                    self._seen.add(column.name)
+            else:
+                self._seen.add(column.name)
+            column.extend(values)
+        self._rows += len(records)
+
+    def __len__(self):
+        return self._rows + len(self._pending)
+
+    def nbytes(self):
+        """Bytes held by the column arrays (text values are shared, not counted)."""
+        return sum(column.nbytes() for column in self._columns)
+
+    def take_frame(self):
+        """Return the buffered rows as a DataFrame and start an empty buffer."""
+        with self._lock:
+            self._flush()
+            columns, seen, rows = self._columns, self._seen, self._rows
+            self._reset()
+        data = {c.name: c.to_numpy() for c in columns if c.name in seen}
+        return pd.DataFrame(data, index=pd.RangeIndex(rows), copy=False)
+
+
+def breadcrumb_buffer():
+    return ColumnBuffer(BREADCRUMB_SCHEMA, name="breadcrumb")
+
+
+def stop_event_buffer():
+    return ColumnBuffer(STOP_EVENT_SCHEMA, name="stop_events")
@@ -0,0 +1,155 @@
+"""Multi-record Pub/Sub envelopes.
+
+A batched message carries a JSON array of records (optionally compressed)
+and is tagged with message attributes, so subscribers can tell it apart from
+the legacy one-record-per-message format and unpack either transparently::
+
+    attributes = {"envelope": "batch-v1", "records": "500", "compression": "gzip"}
+
+JSON goes through ``codec.default_codec()``. Given a ``schema`` (see
+``columnar``) the records may come back as typed structs instead of dicts;
+``ColumnBuffer`` takes either.
+"""
+import gzip
+import logging
+import threading
+import time
+import zlib
+
+from pipeline.codec import default_codec
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_VERSION = "batch-v1"
+
+# Pub/Sub rejects messages over 10 MB; stay well below it
+MAX_MESSAGE_BYTES = 8 * 1024 * 1024
+
+_COMPRESSORS = {
+    None: (lambda b: b, lambda b: b),
+    "gzip": (lambda b: gzip.compress(b, compresslevel=5), gzip.decompress),
+    "zlib": (lambda b: zlib.compress(b, 5), zlib.decompress),
+}
+
+
+def encode_record(record):
+    """One record in the legacy one-record-per-message format."""
+    return default_codec().encode(record)
+
+
+def encode_batch(records, compression=None):
+    """Return (data, attributes) for one envelope holding ``records``."""
+    compress = _COMPRESSORS[compression][0]
+    data = compress(default_codec().encode(records))
+    attributes = {"envelope": ENVELOPE_VERSION, "records": str(len(records))}
+    if compression:
+        attributes["compression"] = compression
+    return data, attributes
+
+
+def decode_records(data, attributes=None, schema=None):
+    """Unpack a message into a list of records, batched or not."""
+    attributes = attributes or {}
+    codec = default_codec()
+    if attributes.get("envelope") != ENVELOPE_VERSION:
+        return [codec.decode_one(data, schema)]
+    decompress = _COMPRESSORS[attributes.get("compression")][1]
+    return codec.decode_many(decompress(data), schema)
+
+
+def decode_message(message, schema=None):
+    return decode_records(message.data, message.attributes, schema)
+
+
+class RecordBatcher:
+    """Packs records into envelopes and hands them to ``publish(data, **attributes)``.
+
+    Records added with the same ``key`` (a vehicle or trip id) share
+    envelopes; a key's buffer is published once it reaches ``batch_size``
+    records or its oldest record has waited ``linger`` seconds. A
+    ``batch_size`` of 0 means no size limit: the buffer is sent when the
+    key is flushed explicitly or the linger time expires.
+    """
+
+    def __init__(self, publish, batch_size=500, linger=0.05, compression=None):
+        if compression not in _COMPRESSORS:
+            raise ValueError(f"Unknown compression {compression!r}")
+        self.publish = publish
+        self.batch_size = batch_size
+        self.linger = linger
+        self.compression = compression
+        self.messages = 0
+        self.records = 0
+
+        self._buffers = {}
+        self._started = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+        if linger and linger > 0:
+            self._thread = threading.Thread(target=self._linger_loop, name="record-batcher", daemon=True)
+            self._thread.start()
+
+    def add(self, record, key=None):
+        ready = None
+        with self._lock:
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = []
+                self._started[key] = time.monotonic()
+            buffer.append(record)
+            if self.batch_size and len(buffer) >= self.batch_size:
+                ready = self._take(key)
+        if ready:
+            self._send(ready)
+
+    def add_many(self, records, key=None):
+        for record in records:
+            self.add(record, key)
+
+    def flush(self, key=None, all_keys=False):
+        with self._lock:
+            keys = list(self._buffers) if all_keys else [key]
+            batches = [self._take(k) for k in keys if k in self._buffers]
+        for batch in batches:
+            self._send(batch)
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush(all_keys=True)
+
+    def _take(self, key):
+        self._started.pop(key, None)
+        return self._buffers.pop(key)
+
+    def _send(self, records):
+        data, attributes = encode_batch(records, self.compression)
+        if len(data) > MAX_MESSAGE_BYTES and len(records) > 1:
+            half = len(records) // 2
+            self._send(records[:half])
+            self._send(records[half:])
+            return
+        with self._lock:
+            self.messages += 1
+            self.records += len(records)
+        try:
+            self.publish(data, **attributes)
+        except Exception as e:
+            logger.error(f"[batcher] error publishing batch of {len(records)}: {e}")
+
+    def _linger_loop(self):
+        while not self._closed.wait(self.linger / 2):
+            now = time.monotonic()
+            with self._lock:
+                expired = [k for k, t in self._started.items() if now - t >= self.linger]
+                batches = [self._take(k) for k in expired]
+            for batch in batches:
+                self._send(batch)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
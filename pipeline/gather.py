@@ -0,0 +1,208 @@
+"""Pipelined fetch -> parse gather for the per-vehicle HTML pages.
+
+Three stages connected by bounded queues:
+
+    fetch threads (VehicleFetcher) -> parse processes -> consumer (publisher)
+
+Downloads are I/O bound and run on the fetcher's thread pool. Parsing is
+CPU bound and would serialize on the GIL, so pages are handed to a process
+pool. The consumer gets ``(vehicle_id, result, records)`` in fetch-completion
+order as soon as each page is parsed and publishes while the next pages are
+still downloading. Each queue holds a few pages per worker, so a slow stage
+holds back the ones before it instead of buffering a whole day in memory.
+
+Every stage's busy and waiting time is collected in ``GatherStats``. The
+stage whose workers are busiest relative to the wall time is the
+bottleneck: network when it is fetch, and more parse workers help when it
+is parse.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline import metrics
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+PARSE_WORKERS = 2  # processes; 0 parses on the fetch thread
+QUEUE_PAGES = 4  # pages queued per parse worker between stages
+
+PARSE_SECONDS = metrics.histogram("trimet_parse_seconds", "CPU time to parse one page")
+QUEUED_PAGES = metrics.gauge("trimet_gather_queued_pages", "Pages fetched and waiting for the consumer")
+
+_DONE = object()
+
+
+def _timed_parse(parse, text):
+    # runs in the worker: report the CPU the parse itself took
+    start = time.process_time()
+    records = parse(text)
+    return records, time.process_time() - start
+
+
+class _InlineResult:
+    """A parse run on the fetch thread, shaped like the pool's futures.
+
+    A failed parse is kept and raised from ``result()``, so the consumer
+    handles it per page as it does a worker's.
+    """
+
+    def __init__(self, parse, text):
+        self._value, self._error = None, None
+        try:
+            self._value = _timed_parse(parse, text)
+        except Exception as e:
+            self._error = e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class GatherStats:
+    def __init__(self, fetch_workers=1, parse_workers=0):
+        self.fetch_workers = fetch_workers
+        self.parse_workers = parse_workers
+        self.pages = 0
+        self.skipped = 0
+        self.errors = 0
+        self.records = 0
+        self.fetch_seconds = 0.0  # summed request time across fetch threads
+        self.parse_seconds = 0.0  # summed CPU time across parse workers
+        self.wait_fetch_seconds = 0.0  # consumer idle, queue empty
+        self.wait_parse_seconds = 0.0  # consumer idle, page still parsing
+        self.consume_seconds = 0.0  # time spent in the consumer (publishing)
+        self.wall_seconds = 0.0
+
+    def utilization(self):
+        """Busy fraction of each stage's workers over the run."""
+        wall = max(self.wall_seconds, 1e-9)
+        return {
+            "fetch": self.fetch_seconds / (wall * self.fetch_workers),
+            # with 0 workers the parse runs serially on the fetch thread
+            "parse": self.parse_seconds / (wall * max(1, self.parse_workers)),
+            "publish": self.consume_seconds / wall,
+        }
+
+    def bottleneck(self):
+        busy = self.utilization()
+        return max(busy, key=busy.get)
+
+    def format(self):
+        return (f"{self.pages} pages ({self.skipped} unchanged, {self.errors} failed), "
+                f"{self.records} records in {self.wall_seconds:.2f}s | "
+                f"fetch {self.fetch_seconds:.2f}s busy, parse {self.parse_seconds:.2f}s cpu, "
+                f"publish {self.consume_seconds:.2f}s | consumer waited "
+                f"{self.wait_fetch_seconds:.2f}s on fetch, {self.wait_parse_seconds:.2f}s on parse | "
+                + ", ".join(f"{k} {v:.0%} busy" for k, v in self.utilization().items())
+                + f" -> bound by {self.bottleneck()}")
+
+
+class PipelinedGather:
+    """Fetch pages on threads and parse them in processes, streaming the records.
+
+    ``parse`` must be a module-level function (it is pickled to the worker
+    processes) taking the page text and returning a list of records.
+    ``accept(result)`` runs on the fetch thread and may return False to drop
+    a page before it is parsed, e.g. when a WatermarkStore has seen it.
+    """
+
+    def __init__(self, fetcher, parse, parse_workers=PARSE_WORKERS, queue_pages=QUEUE_PAGES,
+                 accept=None, name="gather"):
+        self.fetcher = fetcher
+        self.parse = parse
+        self.parse_workers = max(0, int(parse_workers))
+        self.queue_size = max(1, queue_pages * max(1, self.parse_workers))
+        self.accept = accept
+        self.name = name
+        self.stats = GatherStats(fetcher.max_workers, self.parse_workers)
+
+    def run(self, vehicle_ids, headers_for=None):
+        """Yield (vehicle_id, FetchResult, records) for every page that parsed."""
+        stats = self.stats = GatherStats(self.fetcher.max_workers, self.parse_workers)
+        start = time.perf_counter()
+        pages = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        pool = None
+        if self.parse_workers:
+            # spawn: the fetch threads are already running when the pool
+            # starts its workers, and forking a threaded process is unsafe
+            pool = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                       mp_context=multiprocessing.get_context("spawn"))
+
+        def produce():
+            try:
+                # keep the downloads at most one queue ahead of the parsers
+                max_pending = self.fetcher.max_workers + self.queue_size
+                for result in self.fetcher.iter_results(vehicle_ids, headers_for, max_pending):
+                    if stop.is_set():
+                        break
+                    stats.fetch_seconds += result.elapsed
+                    if result.error is None and self.accept is not None and not self.accept(result):
+                        stats.skipped += 1
+                        continue
+                    if result.error is not None or result.status_code != 200:
+                        if result.status_code == 304:
+                            stats.skipped += 1
+                        else:
+                            stats.errors += 1
+                            logger.warning(f"[{self.name}] {result.vehicle_id}: "
+                                           f"{result.error or result.status_code}")
+                        continue
+                    if pool is not None:
+                        future = pool.submit(_timed_parse, self.parse, result.text)
+                    else:
+                        future = _InlineResult(self.parse, result.text)
+                    pages.put((result, future))
+                    QUEUED_PAGES.set(pages.qsize(), gather=self.name)
+            except Exception as e:
+                logger.error(f"[{self.name}] fetch stage failed: {e}")
+            finally:
+                pages.put(_DONE)
+
+        producer = threading.Thread(target=produce, name=f"{self.name}-fetch", daemon=True)
+        producer.start()
+        try:
+            while True:
+                waited = time.perf_counter()
+                item = pages.get()
+                stats.wait_fetch_seconds += time.perf_counter() - waited
+                QUEUED_PAGES.set(pages.qsize(), gather=self.name)
+                if item is _DONE:
+                    break
+                result, future = item
+
+                waited = time.perf_counter()
+                try:
+                    records, cpu = future.result()
+                except Exception as e:
+                    stats.errors += 1
+                    logger.error(f"[{self.name}] parse failed for {result.vehicle_id}: {e}")
+                    continue
+                finally:
+                    stats.wait_parse_seconds += time.perf_counter() - waited
+                stats.parse_seconds += cpu
+                PARSE_SECONDS.observe(cpu, gather=self.name)
+                stats.pages += 1
+                stats.records += len(records)
+
+                consumed = time.perf_counter()
+                yield result.vehicle_id, result, records
+                stats.consume_seconds += time.perf_counter() - consumed
+        finally:
+            stop.set()
+            # unblock the producer if the consumer stopped early
+            while producer.is_alive():
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            stats.wall_seconds = time.perf_counter() - start
+            logger.info(f"[{self.name}] {stats.format()}")
@@ -0,0 +1,378 @@
+"""Compact folium layers for breadcrumb maps.
+
+The visualizations used to add one ``folium.CircleMarker`` per breadcrumb
+from an ``iterrows()`` loop: every marker becomes its own block of
+JavaScript, so a full day of points is hundreds of MB of HTML. Here a map
+is always a single layer whatever the number of points:
+
+``points``  the breadcrumbs themselves as one GeoJSON layer; above
+            ``MAX_POINTS`` they are thinned to one point per grid cell
+``grid``    square cells of ``CELL_METERS`` with the point count and the
+            mean / max speed, aggregated in SQL so only the cells leave
+            Postgres; cells are merged 2x2 until at most ``MAX_CELLS`` remain
+``heat``    the same cells as a ``HeatMap`` weighted by point count
+``auto``    ``points`` when the query returns at most ``MAX_POINTS``
+            rows, otherwise ``grid``
+
+Cells are a fixed lon/lat lattice sized in meters at ``REFERENCE_LATITUDE``
+(Portland), so SQL (``cell_query``) and NumPy (``grid_cells``) agree on
+them and a coarser level is found by integer-halving the cell indexes.
+
+Trips drawn as lines (``tracks_map``) are likewise one GeoJSON layer, each
+line simplified with Douglas-Peucker to within ``TOLERANCE_METERS`` of the
+breadcrumbs (``simplify_tracks``, all trips at once), with their start and
+end points in one clustered layer.
+"""
+import math
+
+import branca.colormap
+import folium
+import numpy as np
+import pandas as pd
+from folium.plugins import FastMarkerCluster, HeatMap
+
+# === CONFIGURATION ===
+MODES = ("auto", "points", "grid", "heat")
+CELL_METERS = 100  # finest grid cell
+MAX_CELLS = 10000  # cells drawn before the grid is coarsened
+MAX_POINTS = 20000  # points drawn before they are thinned (or auto switches to grid)
+REFERENCE_LATITUDE = 45.52  # meters -> degrees conversion for the lattice
+MAX_SPEED = 30.0  # m/s at the top of the color scale
+COLORS = ["#2c7bb6", "#abd9e9", "#ffffbf", "#fdae61", "#d7191c"]
+COORD_DIGITS = 6
+TOLERANCE_METERS = 10  # how far a simplified trip line may stray from its breadcrumbs
+TRACK_COLOR = "blue"
+
+METERS_PER_DEGREE = 111320.0
+CELL_COLUMNS = ["gx", "gy", "n", "n_speed", "sum_speed", "max_speed"]
+FLOAT_CELL_COLUMNS = ("sum_speed", "max_speed")
+
+
+def cell_steps(cell_m=CELL_METERS):
+    """(longitude, latitude) size in degrees of a ``cell_m`` cell."""
+    lat_step = cell_m / METERS_PER_DEGREE
+    return lat_step / math.cos(math.radians(REFERENCE_LATITUDE)), lat_step
+
+
+def _strip(query):
+    return query.strip().rstrip(";")
+
+
+def cell_query(query, cell_m=CELL_METERS):
+    """Wrap a point query (latitude, longitude, speed columns) into a grid aggregate.
+
+    Returns SQL plus the extra parameters it binds; merge them with the
+    query's own.
+    """
+    lon_step, lat_step = cell_steps(cell_m)
+    sql = f"""
+        SELECT floor(longitude / %(_lon_step)s)::bigint AS gx,
+               floor(latitude / %(_lat_step)s)::bigint AS gy,
+               count(*) AS n, count(speed) AS n_speed,
+               sum(speed) AS sum_speed, max(speed) AS max_speed
+        FROM ({_strip(query)}) points
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        GROUP BY 1, 2
+    """
+    return sql, {"_lon_step": lon_step, "_lat_step": lat_step}
+
+
+def _read_sql(conn, query, params=None):
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def load_cells(conn, query, params=None, cell_m=CELL_METERS, read=_read_sql):
+    """Run ``query`` aggregated into ``cell_m`` cells in Postgres.
+
+    ``read(conn, sql, params)`` runs the SQL, e.g. ``QueryCache.read``.
+    """
+    sql, grid_params = cell_query(query, cell_m)
+    cells = read(conn, sql, {**(params or {}), **grid_params})
+    return cells.astype({c: "float64" if c in FLOAT_CELL_COLUMNS else "int64" for c in CELL_COLUMNS})
+
+
+def _cell_index(df, cell_m):
+    lon_step, lat_step = cell_steps(cell_m)
+    gx = np.floor(df["longitude"].to_numpy(dtype=float) / lon_step).astype(np.int64)
+    gy = np.floor(df["latitude"].to_numpy(dtype=float) / lat_step).astype(np.int64)
+    return gx, gy
+
+
+def grid_cells(df, cell_m=CELL_METERS):
+    """The same cells as ``load_cells``, from points already in a frame."""
+    df = df.dropna(subset=["latitude", "longitude"])
+    gx, gy = _cell_index(df, cell_m)
+    speed = df["speed"].to_numpy(dtype=float) if "speed" in df.columns else np.full(len(df), np.nan)
+    return _aggregate(gx, gy, np.ones(len(df), dtype=np.int64), (~np.isnan(speed)).astype(np.int64),
+                      np.nan_to_num(speed), speed)
+
+
+def _aggregate(gx, gy, n, n_speed, sum_speed, max_speed):
+    if not len(gx):
+        return pd.DataFrame({c: np.empty(0, np.float64 if c in FLOAT_CELL_COLUMNS else np.int64)
+                             for c in CELL_COLUMNS})
+    keys, inverse = np.unique(np.stack([gx, gy], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    size = len(keys)
+    top = np.full(size, -np.inf)
+    np.fmax.at(top, inverse, max_speed)
+    return pd.DataFrame({
+        "gx": keys[:, 0],
+        "gy": keys[:, 1],
+        "n": np.bincount(inverse, weights=n, minlength=size).astype(np.int64),
+        "n_speed": np.bincount(inverse, weights=n_speed, minlength=size).astype(np.int64),
+        "sum_speed": np.bincount(inverse, weights=sum_speed, minlength=size),
+        "max_speed": np.where(np.isinf(top), np.nan, top),
+    })
+
+
+def coarsen(cells, cell_m=CELL_METERS, max_cells=MAX_CELLS):
+    """Merge cells 2x2 until at most ``max_cells`` remain; returns (cells, cell_m)."""
+    while len(cells) > max_cells:
+        cells = _aggregate(cells["gx"].to_numpy() // 2, cells["gy"].to_numpy() // 2,
+                           cells["n"].to_numpy(), cells["n_speed"].to_numpy(),
+                           cells["sum_speed"].to_numpy(), cells["max_speed"].to_numpy())
+        cell_m *= 2
+    return cells, cell_m
+
+
+def thin_points(df, max_points=MAX_POINTS, cell_m=CELL_METERS / 10):
+    """At most ``max_points`` rows: the first point in each cell, cells doubling until they fit."""
+    if len(df) <= max_points:
+        return df
+    gx, gy = _cell_index(df, cell_m)
+    while True:
+        _, first = np.unique(np.stack([gx, gy], axis=1), axis=0, return_index=True)
+        if len(first) <= max_points:
+            return df.iloc[np.sort(first)]
+        gx, gy = gx // 2, gy // 2
+
+
+def speed_colormap():
+    colormap = branca.colormap.LinearColormap(COLORS, vmin=0, vmax=MAX_SPEED).to_step(len(COLORS) * 2)
+    colormap.caption = "speed (m/s)"
+    return colormap
+
+
+def _round(values):
+    return np.round(values.astype(float), COORD_DIGITS).tolist()
+
+
+def add_point_layer(m, df, popup=True, radius=2, color="blue"):
+    lats, lons = _round(df["latitude"].to_numpy()), _round(df["longitude"].to_numpy())
+    speeds = df["speed"].round(2).tolist() if "speed" in df.columns else [None] * len(df)
+    speeds = [None if v is None or math.isnan(v) else v for v in speeds]
+    features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                 "properties": {"speed": speed}}
+                for lat, lon, speed in zip(lats, lons, speeds)]
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name="breadcrumbs",
+        marker=folium.CircleMarker(radius=radius, color=color, fill=True, fill_opacity=0.6, weight=1),
+        popup=folium.GeoJsonPopup(fields=["speed"], labels=True) if popup else None,
+    ).add_to(m)
+
+
+def add_grid_layer(m, cells, cell_m=CELL_METERS):
+    lon_step, lat_step = cell_steps(cell_m)
+    colormap = speed_colormap()
+    mean = (cells["sum_speed"] / cells["n_speed"].where(cells["n_speed"] > 0)).to_numpy()
+    west, south = _round(cells["gx"].to_numpy() * lon_step), _round(cells["gy"].to_numpy() * lat_step)
+    east, north = _round((cells["gx"].to_numpy() + 1) * lon_step), _round((cells["gy"].to_numpy() + 1) * lat_step)
+    features = []
+    for w, s, e, n, count, speed, top in zip(west, south, east, north, cells["n"].tolist(),
+                                              mean.tolist(), cells["max_speed"].tolist()):
+        known = not math.isnan(speed)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]]},
+            "properties": {"points": count,
+                           "mean_speed": round(speed, 1) if known else None,
+                           "max_speed": round(top, 1) if not math.isnan(top) else None,
+                           "color": colormap(min(speed, MAX_SPEED)) if known else "#999999"},
+        })
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name=f"{cell_m:g} m grid",
+        style_function=lambda f: {"fillColor": f["properties"]["color"], "color": f["properties"]["color"],
+                                  "weight": 0, "fillOpacity": 0.6},
+        tooltip=folium.GeoJsonTooltip(fields=["points", "mean_speed", "max_speed"]),
+    ).add_to(m)
+    colormap.add_to(m)
+
+
+def add_heat_layer(m, cells, cell_m=CELL_METERS):
+    lon_step, lat_step = cell_steps(cell_m)
+    lats = _round((cells["gy"].to_numpy() + 0.5) * lat_step)
+    lons = _round((cells["gx"].to_numpy() + 0.5) * lon_step)
+    HeatMap(list(zip(lats, lons, cells["n"].tolist())), name="heat", radius=12).add_to(m)
+
+
+def _project(lat, lon):
+    """Meters east / north on the lattice's equirectangular projection."""
+    lon_step, lat_step = cell_steps(1)
+    return np.asarray(lon, dtype=float) / lon_step, np.asarray(lat, dtype=float) / lat_step
+
+
+def simplify_lines(x, y, starts, ends, tolerance):
+    """Douglas-Peucker keep mask for the lines ``x[starts[i]:ends[i] + 1]``, all at once.
+
+    Rather than recursing line by line, every open segment of every line is
+    split in the same NumPy pass: the point furthest from its segment is
+    kept, and the segment split there, while it is more than ``tolerance``
+    away. Distances are to the segment rather than its extension, so a bus
+    doubling back on itself keeps the turn.
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    keep[starts] = keep[ends] = True
+    first, last = np.asarray(starts), np.asarray(ends)
+    while True:
+        inner = last - first - 1
+        open_ = inner > 0
+        first, last, inner = first[open_], last[open_], inner[open_]
+        if not len(first):
+            return keep
+        segment = np.repeat(np.arange(len(first)), inner)
+        offsets = np.cumsum(inner) - inner
+        points = first[segment] + 1 + np.arange(len(segment)) - offsets[segment]
+        ax, ay = x[first][segment], y[first][segment]
+        dx, dy = x[last][segment] - ax, y[last][segment] - ay
+        length2 = dx * dx + dy * dy
+        t = np.clip(((x[points] - ax) * dx + (y[points] - ay) * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+        distance = np.hypot(x[points] - ax - t * dx, y[points] - ay - t * dy)
+        furthest = np.maximum.reduceat(distance, offsets)
+        # the first point of each segment at its maximum distance
+        at_max = np.flatnonzero(distance == furthest[segment])
+        _, first_max = np.unique(segment[at_max], return_index=True)
+        split = furthest > tolerance
+        middle = points[at_max[first_max]][split]
+        keep[middle] = True
+        first, last = np.concatenate([first[split], middle]), np.concatenate([middle, last[split]])
+
+
+def _runs(values):
+    """(starts, ends) of the runs of equal consecutive values."""
+    values = np.asarray(values)
+    if not len(values):
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    breaks = np.flatnonzero(values[1:] != values[:-1]) + 1
+    return np.concatenate([[0], breaks]), np.concatenate([breaks - 1, [len(values) - 1]])
+
+
+def simplify_tracks(df, tolerance_m=TOLERANCE_METERS, by="trip_id"):
+    """The rows of ``df`` still needed to draw each ``by`` track within ``tolerance_m``.
+
+    ``df`` must already be in track order (``ORDER BY trip_id, tstamp``);
+    it is not sorted again.
+    """
+    df = df.dropna(subset=["latitude", "longitude"])
+    if df.empty or not tolerance_m:
+        return df
+    x, y = _project(df["latitude"].to_numpy(), df["longitude"].to_numpy())
+    starts, ends = _runs(df[by].to_numpy())
+    return df[simplify_lines(x, y, starts, ends, tolerance_m)]
+
+
+def add_track_layer(m, df, by="trip_id", fields=("trip_id", "route_id"), color=TRACK_COLOR, weight=3):
+    """One GeoJSON line per ``by`` track in ``df`` (in track order)."""
+    fields = [f for f in fields if f in df.columns]
+    lats, lons = _round(df["latitude"].to_numpy()), _round(df["longitude"].to_numpy())
+    coordinates = list(zip(lons, lats))
+    values = {f: df[f].tolist() for f in fields}
+    features = [{
+        "type": "Feature",
+        "geometry": {"type": "LineString", "coordinates": coordinates[start:end + 1]},
+        "properties": {f: values[f][start] for f in fields},
+    } for start, end in zip(*_runs(df[by].to_numpy())) if end > start]
+    folium.GeoJson(
+        {"type": "FeatureCollection", "features": features},
+        name="trips",
+        style_function=lambda f: {"color": color, "weight": weight, "opacity": 0.7},
+        tooltip=folium.GeoJsonTooltip(fields=fields) if fields else None,
+    ).add_to(m)
+
+
+ENDPOINT_CALLBACK = """function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 5, weight: 1, color: row[2] ? "red" : "green", fillOpacity: 0.8});
+    marker.bindTooltip((row[2] ? "End" : "Start") + " of trip " + row[3]);
+    return marker;
+}"""
+
+
+def add_endpoint_layer(m, df, by="trip_id"):
+    """Start (green) and end (red) of each track with more than one point, clustered."""
+    starts, ends = _runs(df[by].to_numpy())
+    lines = ends > starts
+    starts, ends = starts[lines], ends[lines]
+    lats, lons = _round(df["latitude"].to_numpy()), _round(df["longitude"].to_numpy())
+    tracks = df[by].tolist()
+    data = [[lats[i], lons[i], 0, tracks[i]] for i in starts] + [[lats[i], lons[i], 1, tracks[i]] for i in ends]
+    FastMarkerCluster(data, callback=ENDPOINT_CALLBACK, name="trip start / end").add_to(m)
+
+
+def tracks_map(df, tolerance_m=TOLERANCE_METERS, markers=True, by="trip_id", location=None, zoom_start=12):
+    """Each ``by`` track of ``df`` (in track order) as a simplified line; None if there are none."""
+    df = simplify_tracks(df, tolerance_m, by)
+    if df.empty:
+        return None
+    if location is None:
+        location = _center(df["latitude"].astype(float), df["longitude"].astype(float))
+    m = folium.Map(location=location, zoom_start=zoom_start)
+    add_track_layer(m, df, by)
+    if markers:
+        add_endpoint_layer(m, df, by)
+        folium.LayerControl().add_to(m)
+    return m
+
+
+def _center(lats, lons, weights=None):
+    return [float(np.average(lats, weights=weights)), float(np.average(lons, weights=weights))]
+
+
+def cells_map(cells, cell_m=CELL_METERS, mode="grid", location=None, zoom_start=13, max_cells=MAX_CELLS):
+    """A map of aggregated cells (``load_cells`` / ``grid_cells``), or None if there are none."""
+    if cells.empty:
+        return None
+    cells, cell_m = coarsen(cells, cell_m, max_cells)
+    if location is None:
+        lon_step, lat_step = cell_steps(cell_m)
+        location = _center((cells["gy"] + 0.5) * lat_step, (cells["gx"] + 0.5) * lon_step, cells["n"])
+    m = folium.Map(location=location, zoom_start=zoom_start)
+    if mode == "heat":
+        add_heat_layer(m, cells, cell_m)
+    else:
+        add_grid_layer(m, cells, cell_m)
+    return m
+
+
+def points_map(df, location=None, zoom_start=13, popup=True, max_points=MAX_POINTS, radius=2):
+    """A map of the points in ``df`` (thinned above ``max_points``), or None if there are none."""
+    df = df.dropna(subset=["latitude", "longitude"])
+    if df.empty:
+        return None
+    df = thin_points(df, max_points)
+    if location is None:
+        location = _center(df["latitude"].astype(float), df["longitude"].astype(float))
+    m = folium.Map(location=location, zoom_start=zoom_start)
+    add_point_layer(m, df, popup=popup, radius=radius)
+    return m
+
+
+def render(conn, query, params=None, mode="auto", location=None, zoom_start=13, popup=True,
+           cell_m=CELL_METERS, max_points=MAX_POINTS, max_cells=MAX_CELLS, radius=2, read=_read_sql):
+    """Map the (latitude, longitude, speed) rows of ``query``; None when it returns nothing.
+
+    ``grid``, ``heat`` and ``auto`` aggregate in Postgres first; ``auto``
+    only fetches the points themselves when there are few enough to draw.
+    Every query goes through ``read(conn, sql, params)``.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown map mode {mode!r}, expected one of {', '.join(MODES)}")
+    if mode != "points":
+        cells = load_cells(conn, query, params, cell_m, read)
+        if mode != "auto" or int(cells["n"].sum()) > max_points:
+            return cells_map(cells, cell_m, "heat" if mode == "heat" else "grid",
+                             location, zoom_start, max_cells)
+    df = read(conn, query, params)
+    return points_map(df, location, zoom_start, popup, max_points, radius)
@@ -0,0 +1,289 @@
+"""Process-wide counters, gauges and histograms for the pipeline scripts.
+
+The shared modules record into one default registry as they work (fetch
+latency, parse time, publish ack latency, buffered records, transform /
+validate / COPY durations, rows rejected per rule). A script decides how
+to expose them by calling ``start_exporter``:
+
+* ``port``: a Prometheus text-format endpoint at ``http://host:port/metrics``
+* ``json_path``: a JSON snapshot rewritten every ``interval`` seconds and
+  once more on ``close()``, so a finished nightly run leaves its numbers
+  behind
+
+Recording is a dict lookup and a short lock, so it stays on in every run;
+nothing is exported unless a script asks for it.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+# seconds; spans sub-millisecond parses to multi-second COPYs and fetch retries
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+EXPORT_INTERVAL = 30  # seconds between JSON dumps
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in key) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def snapshot(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self.histogram.observe(self.seconds, **self.labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label key -> [bucket counts..., +Inf count], sum, max
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, value]
+            series[0][index] += 1
+            series[1] += value
+            if value > series[2]:
+                series[2] = value
+
+    def time(self, **labels):
+        """``with histogram.time(table="trip"):`` observes the block's duration."""
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        series = self._series.get(_key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, _) in self._series.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += n
+                    out.append((self.name + "_bucket", key + (("le", bound),), cumulative))
+                out.append((self.name + "_sum", key, total))
+                out.append((self.name + "_count", key, cumulative))
+        return out
+
+    def snapshot(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, peak) in self._series.items():
+                n = sum(counts)
+                out.append({
+                    "labels": dict(key), "count": n, "sum": total, "mean": total / n if n else 0.0,
+                    "max": peak, "p50": self._quantile(counts, n, 0.5), "p95": self._quantile(counts, n, 0.95),
+                })
+        return out
+
+    def _quantile(self, counts, n, q):
+        # upper bound of the bucket holding the q-th observation
+        rank = q * n
+        seen = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            seen += c
+            if seen >= rank and c:
+                return bound
+        return 0.0
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def prometheus_text(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_label_text(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {
+            "time": time.time(),
+            "metrics": {m.name: {"type": m.kind, "help": m.help, "series": m.snapshot()}
+                        for m in list(self._metrics.values())},
+        }
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text):
+    return REGISTRY.counter(name, help_text)
+
+
+def gauge(name, help_text):
+    return REGISTRY.gauge(name, help_text)
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help_text, buckets)
+
+
+# === export ===
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    def __init__(self, registry=REGISTRY, port=None, json_path=None, interval=EXPORT_INTERVAL,
+                 host="0.0.0.0"):
+        self.registry = registry
+        self.json_path = json_path
+        self.interval = interval
+        self._server = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            self._server.daemon_threads = True
+            self._server.registry = registry
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"[metrics] serving http://{host}:{self._server.server_address[1]}/metrics")
+        if json_path:
+            os.makedirs(os.path.dirname(json_path) or ".", exist_ok=True)
+            if interval:
+                self._thread = threading.Thread(target=self._dump_loop, name="metrics-dump", daemon=True)
+                self._thread.start()
+
+    def dump(self):
+        if not self.json_path:
+            return
+        tmp = self.json_path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.registry.snapshot(), f, indent=1, default=str)
+            os.replace(tmp, self.json_path)
+        except OSError as e:
+            logger.error(f"[metrics] could not write {self.json_path}: {e}")
+
+    def _dump_loop(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def close(self):
+        """Write the final snapshot and stop the endpoint."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.dump()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def start_exporter(port=None, json_path=None, interval=EXPORT_INTERVAL):
+    return MetricsExporter(REGISTRY, port=port, json_path=json_path, interval=interval)
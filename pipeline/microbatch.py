@@ -0,0 +1,128 @@
+"""Micro-batching for Pub/Sub subscribers.
+
+Messages are buffered un-acked and handed to ``process(records)`` every
+``max_records`` records or ``max_seconds`` seconds, whichever comes first.
+They are acked only after ``process`` returns, i.e. after the batch has
+been committed; if it raises, the whole batch is nacked and Pub/Sub
+redelivers it. Memory is bounded by the batch size and the subscriber's
+flow control, however long the service runs.
+
+``records`` is whatever ``buffer()`` creates, a list by default; anything
+with ``extend`` and ``len`` works, e.g. a ``columnar.ColumnBuffer``.
+"""
+import logging
+import threading
+import time
+
+from pipeline import metrics
+from pipeline.envelope import decode_message
+
+logger = logging.getLogger(__name__)
+
+BUFFERED_RECORDS = metrics.gauge("trimet_subscriber_buffered_records", "Records received and not yet committed")
+BATCH_SECONDS = metrics.histogram("trimet_batch_seconds", "Time to process and commit one micro-batch")
+BATCHES = metrics.counter("trimet_batches_total", "Micro-batches by outcome")
+
+MAX_RECORDS = 5000
+MAX_SECONDS = 30
+
+
+class MicroBatcher:
+    def __init__(self, process, max_records=MAX_RECORDS, max_seconds=MAX_SECONDS, decode=decode_message,
+                 name="microbatch", buffer=list):
+        self.process = process
+        self.name = name
+        self.buffer = buffer
+        self.max_records = max_records
+        self.max_seconds = max_seconds
+        self.decode = decode
+
+        self.batches = 0
+        self.records_committed = 0
+        self.batches_failed = 0
+
+        self._records = buffer()
+        self._messages = []
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name="microbatch-flush", daemon=True)
+        self._thread.start()
+
+    def callback(self, message):
+        """Pub/Sub callback: decode and buffer, leaving the ack to the flush."""
+        try:
+            records = self.decode(message)
+        except Exception as e:
+            # a message that can't be decoded will never succeed; drop it
+            print(f"[callback] error decoding message: {e}")
+            message.ack()
+            return
+
+        with self._cond:
+            if self._closed:
+                message.nack()
+                return
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._records.extend(records)
+            self._messages.append(message)
+            BUFFERED_RECORDS.set(len(self._records), subscriber=self.name)
+            if len(self._records) >= self.max_records:
+                self._cond.notify_all()
+
+    def _take(self):
+        records, messages = self._records, self._messages
+        self._records, self._messages, self._oldest = self.buffer(), [], None
+        BUFFERED_RECORDS.set(0, subscriber=self.name)
+        return records, messages
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._records) >= self.max_records:
+                        break
+                    if self._oldest is not None:
+                        remaining = self.max_seconds - (time.monotonic() - self._oldest)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed and not self._messages:
+                    return
+                records, messages = self._take()
+            self._commit(records, messages)
+
+    def _commit(self, records, messages):
+        if not messages:
+            return
+        # process() may drain the buffer (take_frame), so count it first
+        n = len(records)
+        start = time.monotonic()
+        try:
+            self.process(records)
+        except Exception as e:
+            self.batches_failed += 1
+            BATCHES.inc(subscriber=self.name, outcome="failed")
+            logger.error(f"[microbatch] batch of {n} records failed, nacking {len(messages)} messages: {e}")
+            for message in messages:
+                message.nack()
+            return
+
+        for message in messages:
+            message.ack()
+        self.batches += 1
+        self.records_committed += n
+        BATCHES.inc(subscriber=self.name, outcome="committed")
+        BATCH_SECONDS.observe(time.monotonic() - start, subscriber=self.name)
+        logger.info(f"[microbatch] committed {n} records from {len(messages)} messages "
+                    f"in {time.monotonic() - start:.2f}s")
+
+    def close(self):
+        """Stop accepting messages and flush whatever is buffered."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
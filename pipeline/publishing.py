@@ -0,0 +1,194 @@
+"""Flow-controlled wrapper around a Pub/Sub ``PublisherClient``.
+
+Instead of keeping every publish future until the end of the run, at most
+``max_messages`` messages / ``max_bytes`` bytes are outstanding at once:
+``publish`` blocks until acknowledgements free up room, and each future is
+released as soon as it resolves. Failed publishes go to a retry queue and are
+re-sent with backoff; only messages that exhaust their retries are dropped.
+"""
+import collections
+import logging
+import threading
+import time
+
+from pipeline import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGES = 1000
+MAX_BYTES = 10 * 1024 * 1024
+MAX_RETRIES = 5
+RETRY_BACKOFF = 1.0  # seconds, doubled per attempt
+REPORT_INTERVAL = 30  # seconds between progress lines; 0 disables
+LATENCY_WINDOW = 10000  # recent ack latencies kept for percentiles
+
+ACK_SECONDS = metrics.histogram("trimet_publish_ack_seconds", "Publish-to-ack latency")
+PUBLISHED = metrics.counter("trimet_publish_messages_total", "Published messages by outcome")
+OUTSTANDING = metrics.gauge("trimet_publish_outstanding_messages", "Messages awaiting an ack")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class FlowControlledPublisher:
+    def __init__(self, client, topic_path, max_messages=MAX_MESSAGES, max_bytes=MAX_BYTES,
+                 max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF,
+                 report_interval=REPORT_INTERVAL, name="publish"):
+        self.client = client
+        self.topic_path = topic_path
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.name = name
+
+        self.outstanding_messages = 0
+        self.outstanding_bytes = 0
+        self.published = 0
+        self.failed = 0
+        self.retried = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.retry_queue = collections.deque()  # (ready_at, data, attributes, attempt)
+
+        self._cond = threading.Condition()
+        self._started = time.monotonic()
+        self._stop = threading.Event()
+        self._reporter = None
+        if report_interval:
+            self._reporter = threading.Thread(target=self._report_loop, args=(report_interval,),
+                                              name=f"{name}-stats", daemon=True)
+            self._reporter.start()
+
+    # === publishing ===
+    def publish(self, data, **attributes):
+        self._send_due_retries()
+        self._publish(data, attributes, attempt=1)
+
+    def _publish(self, data, attributes, attempt):
+        size = len(data)
+        with self._cond:
+            # a single oversized message is still let through on an empty pipe
+            while self.outstanding_messages and (
+                self.outstanding_messages >= self.max_messages
+                or self.outstanding_bytes + size > self.max_bytes
+            ):
+                self._cond.wait()
+            self.outstanding_messages += 1
+            self.outstanding_bytes += size
+            OUTSTANDING.set(self.outstanding_messages, publisher=self.name)
+
+        start = time.monotonic()
+        try:
+            future = self.client.publish(self.topic_path, data, **attributes)
+        except Exception as e:
+            self._finished(size)
+            self._failed(data, attributes, attempt, e)
+            return
+        future.add_done_callback(lambda f: self._on_done(f, data, attributes, attempt, start))
+
+    def _on_done(self, future, data, attributes, attempt, start):
+        self._finished(len(data))
+        try:
+            future.result()
+        except Exception as e:
+            self._failed(data, attributes, attempt, e)
+            return
+        latency = time.monotonic() - start
+        with self._cond:
+            self.published += 1
+            self.latencies.append(latency)
+        ACK_SECONDS.observe(latency, publisher=self.name)
+        PUBLISHED.inc(publisher=self.name, outcome="acked")
+
+    def _finished(self, size):
+        with self._cond:
+            self.outstanding_messages -= 1
+            self.outstanding_bytes -= size
+            OUTSTANDING.set(self.outstanding_messages, publisher=self.name)
+            self._cond.notify_all()
+
+    def _failed(self, data, attributes, attempt, error):
+        with self._cond:
+            if attempt > self.max_retries:
+                self.failed += 1
+                PUBLISHED.inc(publisher=self.name, outcome="failed")
+                logger.error(f"[{self.name}] giving up after {attempt} attempts: {error}")
+            else:
+                ready_at = time.monotonic() + self.retry_backoff * (2 ** (attempt - 1))
+                self.retry_queue.append((ready_at, data, attributes, attempt + 1))
+                PUBLISHED.inc(publisher=self.name, outcome="retried")
+                logger.warning(f"[{self.name}] publish failed (attempt {attempt}), queued for retry: {error}")
+            self._cond.notify_all()
+
+    def _send_due_retries(self, wait=False):
+        while True:
+            with self._cond:
+                if not self.retry_queue:
+                    return
+                ready_at, data, attributes, attempt = self.retry_queue[0]
+                delay = ready_at - time.monotonic()
+                if delay > 0 and not wait:
+                    return
+                self.retry_queue.popleft()
+            if delay > 0:
+                time.sleep(delay)
+            with self._cond:
+                self.retried += 1
+            self._publish(data, attributes, attempt)
+
+    def drain(self):
+        """Block until every message is acked or has exhausted its retries."""
+        while True:
+            with self._cond:
+                while self.outstanding_messages:
+                    self._cond.wait()
+                if not self.retry_queue:
+                    return self.stats()
+            self._send_due_retries(wait=True)
+
+    def close(self):
+        stats = self.drain()
+        self._stop.set()
+        if self._reporter is not None:
+            self._reporter.join()
+        logger.info(f"[{self.name}] done: {self.format_stats(stats)}")
+        return stats
+
+    # === reporting ===
+    def stats(self):
+        with self._cond:
+            latencies = sorted(self.latencies)
+            elapsed = max(time.monotonic() - self._started, 1e-9)
+            return {
+                "published": self.published,
+                "failed": self.failed,
+                "retried": self.retried,
+                "retry_queue": len(self.retry_queue),
+                "outstanding_messages": self.outstanding_messages,
+                "outstanding_bytes": self.outstanding_bytes,
+                "rate": self.published / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+
+    @staticmethod
+    def format_stats(s):
+        return (f"{s['published']} acked, {s['failed']} failed, {s['retried']} retried, "
+                f"{s['rate']:.0f} msg/s, in-flight {s['outstanding_messages']} msgs / "
+                f"{s['outstanding_bytes'] / 1e6:.1f} MB, latency p50 {s['p50_ms']:.0f}ms "
+                f"p95 {s['p95_ms']:.0f}ms p99 {s['p99_ms']:.0f}ms")
+
+    def _report_loop(self, interval):
+        while not self._stop.wait(interval):
+            logger.info(f"[{self.name}] {self.format_stats(self.stats())}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
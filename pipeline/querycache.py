@@ -0,0 +1,129 @@
+"""On-disk Parquet cache of query results, invalidated per service date.
+
+Restyling a map reran the same full scans of ``breadcrumb`` every time. A
+``QueryCache`` keeps each result as ``<folder>/<key>.parquet``, the key
+being a hash of the SQL and its bound parameters. Along with the rows it
+stores the version of the data it was read from: the newest ``load_log``
+entry (Part3/stop.sql) for the service dates the query covers, or for
+every date when the caller can't say which. Loaders append to load_log in
+the same transaction as their rows (``bulkload.log_load``), so a cached
+result is used only while nothing new was loaded for its dates.
+
+Without pyarrow, or on a database without load_log, every read goes to
+Postgres.
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import timedelta
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+CACHE_FOLDER = "query_cache"
+
+VERSION_KEY = b"trimet.load_version"
+
+
+def cache_key(query, params=None):
+    """Hash of the query text (whitespace-insensitive) and its parameters."""
+    text = " ".join(query.split())
+    blob = json.dumps([text, params or {}], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def dates_between(start, end):
+    """Service dates from ``start`` up to ``end`` (exclusive); None when either is open."""
+    if start is None or end is None:
+        return None
+    first, last = start.date(), (end - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def load_version(conn, dates=None):
+    """The newest load_log entry for ``dates`` (all dates if None); None without load_log."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass('load_log') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return None
+        if dates is None:
+            cursor.execute("SELECT max(id), max(loaded_at) FROM load_log")
+        else:
+            cursor.execute("SELECT max(id), max(loaded_at) FROM load_log WHERE service_date = ANY(%s::date[])",
+                           (sorted(set(dates)),))
+        last_id, loaded_at = cursor.fetchone()
+    finally:
+        cursor.close()
+    # the timestamp tells apart ids handed out again after load_log was recreated
+    return f"{last_id or 0}@{loaded_at.isoformat() if loaded_at else '-'}"
+
+
+class QueryCache:
+    """Read query results through Parquet files under ``folder``.
+
+    ``read(conn, query, params, dates)`` returns what
+    ``pd.read_sql_query(query, conn, params=params)`` would, from the cache
+    when the data for ``dates`` hasn't changed since it was stored.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, enabled=True):
+        self.folder = folder
+        self.enabled = enabled and pa is not None
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, query, params=None):
+        return os.path.join(self.folder, cache_key(query, params) + ".parquet")
+
+    def read(self, conn, query, params=None, dates=None):
+        if not self.enabled:
+            return pd.read_sql_query(query, conn, params=params)
+        version = load_version(conn, dates)
+        path = self.path(query, params)
+        if version is not None and os.path.exists(path):
+            try:
+                table = pq.read_table(path)
+                if (table.schema.metadata or {}).get(VERSION_KEY) == version.encode():
+                    self.hits += 1
+                    logger.info(f"[cache] hit {os.path.basename(path)}: {table.num_rows} rows")
+                    return table.to_pandas()
+            except Exception as e:
+                logger.warning(f"[cache] unreadable {path}: {e}")
+        self.misses += 1
+        df = pd.read_sql_query(query, conn, params=params)
+        if version is not None:
+            self._write(path, df, version)
+        return df
+
+    def _write(self, path, df, version):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), VERSION_KEY: version})
+            os.makedirs(self.folder, exist_ok=True)
+            tmp_path = path + ".tmp"
+            pq.write_table(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+            logger.info(f"[cache] stored {os.path.basename(path)}: {len(df)} rows at load {version}")
+        except Exception as e:
+            logger.warning(f"[cache] could not store {path}: {e}")
+
+    def clear(self):
+        """Remove every cached result; returns how many there were."""
+        if not os.path.isdir(self.folder):
+            return 0
+        removed = 0
+        for name in os.listdir(self.folder):
+            if name.endswith(".parquet"):
+                os.remove(os.path.join(self.folder, name))
+                removed += 1
+        return removed
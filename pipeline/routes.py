@@ -0,0 +1,63 @@
+"""Trip routes from stop events (Part3/trip_routes.sql).
+
+The breadcrumb feed has no route or direction, so trips used to be loaded
+with route 0 going 'Out'. The stop-event feed has both for every trip:
+the stop-event loader indexes the trips of each batch into trip_route
+(``index_routes``), which also fills in those trips if their breadcrumbs
+were loaded first, and the breadcrumb loaders look their trips up there as
+they load them (``apply_routes``). A trip is loaded with a NULL route until
+its stop events arrive.
+
+Both run in the caller's transaction, and do nothing on a database without
+trip_routes.sql.
+"""
+from pipeline import metrics
+from pipeline.timeline import trip_id_list
+
+ROUTED_TRIPS = metrics.counter("trimet_routed_trips_total", "Trips given their route from stop events, by stage")
+
+
+def _installed(cursor):
+    cursor.execute("SELECT to_regclass('trip_route') IS NOT NULL")
+    return cursor.fetchone()[0]
+
+
+def apply_routes(cursor, trip_ids):
+    """Set the route, direction and service key of ``trip_ids`` that are indexed; returns the trips changed."""
+    ids = trip_id_list(trip_ids)
+    if not ids or not _installed(cursor):
+        return 0
+    cursor.execute("SELECT apply_trip_routes(%s::bigint[])", (ids,))
+    changed = cursor.fetchone()[0]
+    ROUTED_TRIPS.inc(changed, stage="trip_load")
+    return changed
+
+
+def index_routes(cursor, trip_ids):
+    """Index ``trip_ids`` from their stop events and route those already loaded; returns (indexed, routed)."""
+    ids = trip_id_list(trip_ids)
+    if not ids or not _installed(cursor):
+        return 0, 0
+    cursor.execute("SELECT index_trip_routes(%s::bigint[])", (ids,))
+    indexed = cursor.fetchone()[0]
+    cursor.execute("SELECT apply_trip_routes(%s::bigint[])", (ids,))
+    routed = cursor.fetchone()[0]
+    ROUTED_TRIPS.inc(routed, stage="stop_events")
+    return indexed, routed
+
+
+def route_trips(conn, trip_ids):
+    """``apply_routes`` in a transaction of its own, for loaders that commit table by table."""
+    cursor = conn.cursor()
+    try:
+        changed = apply_routes(cursor, trip_ids)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[routes] routing trips failed: {e}")
+        return 0
+    finally:
+        cursor.close()
+    if changed:
+        print(f"[routes] {changed} trips routed from their stop events")
+    return changed
@@ -0,0 +1,159 @@
+"""Speed questions answered from the speed_stats summary (Part3/speed_stats.sql).
+
+speed_stats holds, per 200 m grid cell and hour of the week, the number of
+breadcrumbs with a speed, their sum and maximum, and a histogram of 1 m/s
+bins; speed_stats_hourly the same per hour of the week over the whole city.
+A trigger on breadcrumb adds every load's new rows to both, so they are
+always as current as breadcrumb itself, and a question like "speeds near
+the bridge on weekday mornings" sums at most a few thousand summary rows
+instead of scanning millions of breadcrumbs:
+
+    summary(conn, bbox=BRIDGE, hours=hours("weekdays", 7, 10))
+    summary(conn, hours=hours("all", 22, 24), min_speed=25)
+
+Histograms add up exactly, so counts, means and the share at or above a
+whole-bin speed are exact for whole cells and hours; percentiles are
+interpolated within their bin. Areas are rounded out to whole cells, and
+there is no route dimension: route questions still go to breadcrumb /
+trip_timeline.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline import maps
+
+# === CONFIGURATION ===
+# must match Part3/speed_stats.sql
+CELL_METERS = 200
+BIN_WIDTH = 1.0  # m/s
+BINS = 40  # the last bin holds every speed above (BINS - 1) * BIN_WIDTH
+
+PERCENTILES = (50, 85, 95)
+DAYS = {
+    "all": range(7),
+    "weekdays": range(5),
+    "weekend": (5, 6),
+}
+
+
+def hour_of_week(ts):
+    """0 for Monday 00:00-00:59 through 167 for Sunday 23:00-23:59."""
+    return ts.weekday() * 24 + ts.hour
+
+
+def hours(days="all", first=0, last=24):
+    """Hours of the week from ``first`` to ``last`` o'clock (exclusive) on ``days``.
+
+    ``days`` is a key of ``DAYS`` or weekday numbers (Monday 0); a range
+    past midnight (``hours("all", 22, 2)``) runs into the next day.
+    """
+    weekdays = DAYS[days] if isinstance(days, str) else days
+    span = (last - first) % 24 or 24
+    return sorted({(d * 24 + first + h) % 168 for d in weekdays for h in range(span)})
+
+
+def cell_range(west, south, east, north):
+    """(gx_min, gx_max, gy_min, gy_max) of the cells a bounding box touches."""
+    lon_step, lat_step = maps.cell_steps(CELL_METERS)
+    return (int(np.floor(west / lon_step)), int(np.floor(east / lon_step)),
+            int(np.floor(south / lat_step)), int(np.floor(north / lat_step)))
+
+
+def _where(bbox=None, hours=None):
+    """FROM / WHERE over the cells of ``bbox``, or the city-wide rollup without one."""
+    clauses, params = [], {}
+    if bbox is not None:
+        params.update(zip(("gx_min", "gx_max", "gy_min", "gy_max"), cell_range(*bbox)))
+        clauses.append("gx BETWEEN %(gx_min)s AND %(gx_max)s AND gy BETWEEN %(gy_min)s AND %(gy_max)s")
+    if hours is not None:
+        params["hours"] = [int(h) for h in hours]
+        clauses.append("hour_of_week = ANY(%(hours)s::smallint[])")
+    table = "speed_stats" if bbox is not None else "speed_stats_hourly"
+    return f"FROM {table}" + (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def percentile(hist, q, max_speed=None):
+    """The ``q``-th percentile (0-100) of a histogram, interpolated within its bin."""
+    hist = np.asarray(hist, dtype=float)
+    total = hist.sum()
+    if not total:
+        return None
+    cum = np.cumsum(hist)
+    target = total * q / 100.0
+    k = int(min(np.searchsorted(cum, target), len(hist) - 1))
+    lower = k * BIN_WIDTH
+    upper = (k + 1) * BIN_WIDTH
+    if k == len(hist) - 1 and max_speed is not None:
+        upper = max(max_speed, lower)
+    before = cum[k - 1] if k else 0.0
+    value = lower + (upper - lower) * (target - before) / hist[k] if hist[k] else lower
+    return value if max_speed is None else min(value, max_speed)
+
+
+def share_above(hist, speed):
+    """Fraction of a histogram's speeds at or above ``speed``, pro rata within its bin."""
+    hist = np.asarray(hist, dtype=float)
+    total = hist.sum()
+    if not total:
+        return None
+    k = int(speed // BIN_WIDTH)
+    if k >= len(hist):
+        return 0.0
+    if k < 0:
+        return 1.0
+    within = 0.0 if k == len(hist) - 1 else (k + 1) * BIN_WIDTH - speed
+    return (hist[k + 1:].sum() + hist[k] * within / BIN_WIDTH) / total
+
+
+def summary(conn, bbox=None, hours=None, min_speed=None, percentiles=PERCENTILES):
+    """Speed statistics over the cells of ``bbox`` (west, south, east, north) and ``hours``.
+
+    Returns a dict with ``n``, ``mean``, ``max``, ``p<q>`` for each of
+    ``percentiles`` and, with ``min_speed``, the share of breadcrumbs at or
+    above it (``share_above``); None-valued when nothing matched.
+    """
+    where, params = _where(bbox, hours)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            WITH selected AS MATERIALIZED (SELECT n, sum_speed, max_speed, hist {where})
+            SELECT count(*), sum(n), sum(sum_speed), max(max_speed),
+                   (SELECT array_agg(c ORDER BY i)
+                    FROM (SELECT i, sum(x) AS c FROM selected, unnest(hist) WITH ORDINALITY AS u(x, i)
+                          GROUP BY i) bins)
+            FROM selected
+        """, params)
+        cells, n, total, top, hist = cursor.fetchone()
+    finally:
+        cursor.close()
+    n = int(n or 0)
+    result = {"rows": cells, "n": n, "mean": total / n if n else None, "max": top}
+    for q in percentiles:
+        result[f"p{q:g}"] = percentile(hist, q, top) if n else None
+    if min_speed is not None:
+        result["share_above"] = share_above(hist, min_speed) if n else None
+    return result
+
+
+def cells(conn, bbox=None, hours=None):
+    """Per-cell totals over ``hours``, in ``maps`` cell columns for ``maps.cells_map(df, CELL_METERS)``."""
+    where, params = _where(bbox or (-180, -90, 180, 90), hours)
+    df = pd.read_sql_query(
+        f"SELECT gx, gy, sum(n) AS n, sum(n) AS n_speed, sum(sum_speed) AS sum_speed, max(max_speed) AS max_speed "
+        f"{where} GROUP BY gx, gy", conn, params=params)
+    return df.astype({c: "float64" if c in maps.FLOAT_CELL_COLUMNS else "int64" for c in maps.CELL_COLUMNS})
+
+
+def rebuild(conn):
+    """Recount speed_stats from every breadcrumb (run with the loaders stopped); returns its rows."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT rebuild_speed_stats()")
+        rows = cursor.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return rows
@@ -0,0 +1,113 @@
+"""Streaming extractor for the getStopEvents HTML pages.
+
+The page is a heading with the service date followed by one
+``<h2>Stop events for PDX_TRIP ...</h2><table>`` block per trip. Instead of
+building a BeautifulSoup tree and walking ``find_all("tr")``, the stdlib
+``html.parser`` event API is driven directly: the first row of each table
+gives the column names, and every following row with a matching number of
+``<td>`` cells becomes a record as soon as the row closes. Nothing but the
+current row is held, and every table on the page is read (the old parser
+only looked at the first one).
+
+Records are the same ``{column: stripped cell text}`` dicts the BeautifulSoup
+version produced, so the publisher and the validators see no difference.
+"""
+from html.parser import HTMLParser
+
+# === CONFIGURATION ===
+CHUNK_SIZE = 64 * 1024  # characters fed to the parser between yields
+
+
+class StopEventTableParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self.tables = 0
+        self._depth = 0  # nested <table> level; only the outer tables are read
+        self._header = None
+        self._header_cells = []
+        self._row = None  # cell texts of the open row, or None
+        self._cell = None  # text pieces of the open cell, or None
+        self._cell_is_td = False
+
+    # === events ===
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._depth += 1
+            if self._depth == 1:
+                self.tables += 1
+                self._header = None
+                self._header_cells = []
+                self._row = None
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._end_row()
+            self._row = []
+        elif tag == "td" or tag == "th":
+            if self._row is None:
+                return
+            self._end_cell()
+            self._cell = []
+            self._cell_is_td = tag == "td"
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            if self._depth == 1:
+                self._end_row()
+            self._depth = max(0, self._depth - 1)
+        elif self._depth != 1:
+            return
+        elif tag == "tr":
+            self._end_row()
+        elif tag == "td" or tag == "th":
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    # === rows ===
+    def _end_cell(self):
+        if self._cell is None:
+            return
+        text = "".join(self._cell).strip()
+        if self._cell_is_td:
+            self._row.append(text)
+        else:
+            # header cells only count in a table's first row
+            if self._header is None:
+                self._header_cells.append(text)
+        self._cell = None
+
+    def _end_row(self):
+        if self._row is None:
+            return
+        self._end_cell()
+        row = self._row
+        self._row = None
+        if self._header is None:
+            self._header = self._header_cells
+            self._header_cells = []
+            return
+        if len(row) == len(self._header):
+            self.records.append(dict(zip(self._header, row)))
+
+    def pop_records(self):
+        records = self.records
+        self.records = []
+        return records
+
+
+def iter_stop_events(html, chunk_size=CHUNK_SIZE):
+    """Yield the stop-event records of every table on the page, in page order."""
+    parser = StopEventTableParser()
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        yield from parser.pop_records()
+    parser.close()
+    yield from parser.pop_records()
+
+
+def parse_stop_events(html):
+    return list(iter_stop_events(html))
@@ -0,0 +1,42 @@
+"""Incremental refresh of the trip_timeline table (Part3/trip_timeline.sql).
+
+After a loader commits, the trips it touched are rebuilt in trip_timeline
+for every service day they have breadcrumbs on, so the as-of joined model
+never needs a full rebuild. A failed refresh is reported and skipped: the
+loaded data is already committed, and the next batch touching the same
+trips (or ``SELECT refresh_trip_timeline(day)``) brings it up to date.
+"""
+import time
+
+import pandas as pd
+
+from pipeline import metrics
+
+REFRESH_SECONDS = metrics.histogram("trimet_timeline_refresh_seconds", "Time to rebuild the timeline rows of one batch")
+
+
+def trip_id_list(trip_ids):
+    ids = pd.to_numeric(pd.Series(trip_ids), errors="coerce").dropna()
+    return sorted({int(t) for t in ids})
+
+
+def refresh_trips(conn, trip_ids):
+    """Rebuild the timeline rows of ``trip_ids``; returns the rows written."""
+    ids = trip_id_list(trip_ids)
+    if not ids:
+        return 0
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT refresh_trip_timeline_trips(%s::bigint[])", (ids,))
+        rows = cursor.fetchone()[0]
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"[timeline] refresh of {len(ids)} trips failed: {e}")
+        return 0
+    finally:
+        cursor.close()
+    REFRESH_SECONDS.observe(time.perf_counter() - start)
+    print(f"[timeline] {rows} rows for {len(ids)} trips in {time.perf_counter() - start:.2f}s")
+    return rows
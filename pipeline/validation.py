@@ -0,0 +1,335 @@
+"""Declarative, columnar validation rules.
+
+Each rule turns the whole frame into a boolean mask (True = row passes)
+instead of asserting row by row, so a day's breadcrumbs or stop events are
+validated with a handful of vectorized comparisons. A row is accepted only if it passes
+every rule. Rejected rows are kept with the names of the rules they failed,
+so they can be written out and inspected.
+"""
+import numbers
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from pipeline import metrics
+
+Rule = namedtuple("Rule", ["name", "message", "check"])
+ValidationResult = namedtuple("ValidationResult", ["valid", "rejected", "failures"])
+
+VALIDATE_SECONDS = metrics.histogram("trimet_validate_seconds", "Time to apply every rule to one frame")
+ROWS_VALIDATED = metrics.counter("trimet_rows_validated_total", "Rows checked, by dataset")
+ROWS_REJECTED = metrics.counter("trimet_rows_rejected_total", "Rows failing each rule, by dataset")
+
+
+# === mask helpers ===
+def _all(df, value):
+    return pd.Series(value, index=df.index, dtype=bool)
+
+
+def numeric(df, column):
+    """Column as floats for comparisons; None if the column is missing.
+
+    Only real numbers count: a string such as "5" stays NaN, just as
+    ``"5" > 0`` raised in the row-wise checks.
+    """
+    if column not in df.columns:
+        return None
+    s = df[column]
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype(float)
+    is_number = s.map(lambda v: isinstance(v, numbers.Number))
+    return pd.to_numeric(s.where(is_number), errors='coerce')
+
+
+def in_range(column, low=None, high=None):
+    def check(df, typed=None):
+        s = numeric(df, column)
+        if s is None:
+            return _all(df, False)
+        mask = s.notna()
+        if low is not None:
+            mask &= s >= low
+        if high is not None:
+            mask &= s <= high
+        return mask
+    return check
+
+
+def greater_than(column, bound):
+    def check(df, typed=None):
+        s = numeric(df, column)
+        if s is None:
+            return _all(df, False)
+        return (s > bound).fillna(False)
+    return check
+
+
+def non_empty_string(column):
+    def check(df, typed=None):
+        if column not in df.columns:
+            return _all(df, False)
+        s = df[column]
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            return _all(df, False)
+        # .str yields NaN for anything that isn't a string
+        return s.str.len().gt(0).fillna(False).astype(bool)
+    return check
+
+
+def not_null(column):
+    def check(df, typed=None):
+        if column not in df.columns:
+            return _all(df, False)
+        return df[column].notna()
+    return check
+
+
+def one_of(column, allowed):
+    def check(df, typed=None):
+        if column not in df.columns:
+            return _all(df, False)
+        return df[column].isin(list(allowed))
+    return check
+
+
+# === breadcrumb rules, same checks as the former assert_* functions ===
+BREADCRUMB_RULES = [
+    Rule("opd_date", "Invalid OPD_DATE", non_empty_string('OPD_DATE')),
+    Rule("vehicle_id", "Invalid VEHICLE_ID", greater_than('VEHICLE_ID', 0)),
+    Rule("act_time", "Invalid ACT_TIME", in_range('ACT_TIME', 0, 86399)),
+    Rule("gps_latitude", "Invalid GPS_LATITUDE", in_range('GPS_LATITUDE', -90.0, 90.0)),
+    Rule("gps_longitude", "Invalid GPS_LONGITUDE", in_range('GPS_LONGITUDE', -180.0, 180.0)),
+    Rule("event_no_trip", "Invalid EVENT_NO_TRIP", greater_than('EVENT_NO_TRIP', 0)),
+    Rule("meters", "Invalid METERS value", in_range('METERS', low=0)),
+    Rule("speed", "Invalid SPEED", in_range('SPEED', low=0)),
+    Rule("timestamp", "Missing TIMESTAMP", not_null('TIMESTAMP')),
+    Rule("day_of_week", "Invalid DAY_OF_WEEK", one_of('DAY_OF_WEEK', range(7))),
+]
+
+
+# === stop events ===
+STOP_EVENT_COLUMNS = [
+    'vehicle_number', 'leave_time', 'train', 'route_number', 'direction',
+    'service_key', 'trip_number', 'stop_time', 'arrive_time', 'dwell',
+    'location_id', 'door', 'lift', 'ons', 'offs', 'estimated_load',
+    'maximum_speed', 'train_mileage', 'pattern_distance', 'location_distance',
+    'x_coordinate', 'y_coordinate', 'data_source', 'schedule_status'
+]
+STOP_EVENT_FLOAT_COLUMNS = [
+    'maximum_speed', 'train_mileage', 'pattern_distance', 'location_distance',
+    'x_coordinate', 'y_coordinate'
+]
+STOP_EVENT_TEXT_COLUMNS = ['service_key', 'estimated_load']
+STOP_EVENT_INT_COLUMNS = [
+    c for c in STOP_EVENT_COLUMNS
+    if c not in STOP_EVENT_FLOAT_COLUMNS and c not in STOP_EVENT_TEXT_COLUMNS
+]
+
+
+# strings are cast in blocks; a block with a bad value is split until the
+# bad values are isolated and retried one at a time in Python
+CAST_BLOCK = 8192
+CAST_MIN_BLOCK = 64
+
+
+def _try(cast, value):
+    try:
+        return float(cast(value))
+    except Exception:
+        return float('nan')
+
+
+def _cast_block(values, out, dtype, cast):
+    try:
+        # numpy parses str the same way int()/float() do, just without the loop
+        out[:] = values.astype(dtype)
+    except (ValueError, TypeError, OverflowError):
+        if len(values) <= CAST_MIN_BLOCK:
+            out[:] = [_try(cast, v) for v in values]
+            return
+        half = len(values) // 2
+        _cast_block(values[:half], out[:half], dtype, cast)
+        _cast_block(values[half:], out[half:], dtype, cast)
+
+
+def _exact_cast(s, dtype, cast):
+    """``cast(value)`` for every value as floats; NaN where Python would raise.
+
+    Most stop-event columns hold few distinct values, so only the distinct
+    values are parsed and broadcast back (as parse_opd_date does).
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    # trailing NaN so missing values (code -1) pick it up
+    out = np.full(len(uniques) + 1, np.nan)
+    parsed = out[:-1]
+    if pd.api.types.infer_dtype(uniques, skipna=True) == "string":
+        values = np.asarray(uniques, dtype=str)
+        for start in range(0, len(values), CAST_BLOCK):
+            stop = start + CAST_BLOCK
+            _cast_block(values[start:stop], parsed[start:stop], dtype, cast)
+    else:
+        parsed[:] = [_try(cast, v) for v in np.asarray(uniques, dtype=object)]
+    return pd.Series(out[codes], index=s.index)
+
+
+def to_float(s):
+    """Same result as ``float(value)`` per value, NaN where that raises."""
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype(float)
+    return _exact_cast(s, np.float64, float)
+
+
+def to_int(s):
+    """Same result as ``int(value)`` per value (as float), NaN where that raises.
+
+    "5.0" fails here just as ``int("5.0")`` does.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        values = s.astype(float)
+        return np.trunc(values.where(np.isfinite(values)))
+    return _exact_cast(s, np.int64, int)
+
+
+def cast_stop_events(df):
+    """Typed copy of a stop-event frame: nullable ints, floats and text."""
+    typed = pd.DataFrame(index=df.index)
+    for column in STOP_EVENT_COLUMNS:
+        if column not in df.columns:
+            continue
+        if column in STOP_EVENT_FLOAT_COLUMNS:
+            typed[column] = to_float(df[column])
+        elif column in STOP_EVENT_INT_COLUMNS:
+            values = to_int(df[column])
+            exact = values.isna() | (values.abs() < 2 ** 53)
+            typed[column] = values.astype("Int64") if exact.all() else values
+        else:
+            typed[column] = df[column].astype(object).where(df[column].notna(), None)
+    return typed
+
+
+def _is_str(s):
+    if pd.api.types.is_string_dtype(s) and not pd.api.types.is_object_dtype(s):
+        return s.notna()
+    if pd.api.types.infer_dtype(s, skipna=True) == "string":
+        # all non-null values are str; only NaN/None need excluding
+        return s.notna()
+    return s.map(lambda v: isinstance(v, str))
+
+
+def is_digits(column):
+    def check(df, typed=None):
+        s = df[column]
+        if not (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            return _all(df, False)
+        return s.str.isdigit().fillna(False).astype(bool)
+    return check
+
+
+def not_blank(column):
+    # None, "" and " " fail; NaN passes, as it did in the row-wise check
+    # (pd.NA fails there too: comparing it to None raises)
+    def check(df, typed=None):
+        s = df[column]
+        blank = s.isin(["", " "])
+        missing = s.isna()
+        if missing.any():
+            blank[missing] = s[missing].map(lambda v: v is None or v is pd.NA)
+        return ~blank.astype(bool)
+    return check
+
+
+def typed_in_range(column, low=None, high=None):
+    """Bounds check on the cast column of ``typed``; NaN (cast failed) fails."""
+    def check(df, typed):
+        s = typed[column].astype(float)
+        mask = s.notna()
+        if low is not None:
+            mask &= s >= low
+        if high is not None:
+            mask &= s <= high
+        return mask.fillna(False).astype(bool)
+    return check
+
+
+def ordered(first, second):
+    """``df[first] <= df[second]`` with Python semantics: strings compare as text."""
+    def check(df, typed=None):
+        a, b = df[first], df[second]
+        mask = _all(df, False)
+        both_str = _is_str(a) & _is_str(b)
+        if both_str.any():
+            mask[both_str] = a[both_str].to_numpy(dtype=object) <= b[both_str].to_numpy(dtype=object)
+        rest = df.loc[~both_str, [first, second]]
+        if not rest.empty:
+            na, nb = numeric(rest, first), numeric(rest, second)
+            both_num = na.notna() & nb.notna()
+            mask[both_num[both_num].index] = na[both_num] <= nb[both_num]
+        return mask
+    return check
+
+
+# same checks as the former StopEventSubscriber.validate_* methods
+STOP_EVENT_RULES = [
+    Rule("vehicle_number", "vehicle_number is not digits", is_digits('vehicle_number')),
+    Rule("stop_time", "stop_time is blank", not_blank('stop_time')),
+    Rule("maximum_speed", "maximum_speed outside 0-70", typed_in_range('maximum_speed', 0, 70)),
+    Rule("direction", "direction not 0/1", one_of('direction', ["0", "1"])),
+    Rule("trip_number", "trip_number is not digits", is_digits('trip_number')),
+    Rule("service_key", "service_key not W/S/U", one_of('service_key', ["W", "S", "U"])),
+    Rule("arrive_before_leave", "arrive_time after leave_time", ordered('arrive_time', 'leave_time')),
+    Rule("estimated_load", "unknown estimated_load", one_of('estimated_load', ["", "low", "medium", "high"])),
+    Rule("dwell", "dwell negative or not an integer", typed_in_range('dwell', low=0)),
+    Rule("location_id", "location_id is not digits", is_digits('location_id')),
+]
+
+
+def validate(df, rules, typed=None):
+    """Apply every rule; return the valid rows, the rejected rows and per-rule counts.
+
+    Rules are called as ``check(df, typed)``; ``typed`` is an optional
+    pre-cast copy of ``df`` (see ``cast_stop_events``) so numeric rules
+    don't re-parse strings. ``rejected`` carries an extra ``failed_rules``
+    column listing the names of the rules each row failed, separated by ``;``.
+    """
+    start = time.perf_counter()
+    passed = _all(df, True)
+    failures = {}
+    failed_masks = {}
+    for rule in rules:
+        mask = rule.check(df, typed).reindex(df.index, fill_value=False).astype(bool)
+        failures[rule.name] = int((~mask).sum())
+        if failures[rule.name]:
+            failed_masks[rule.name] = ~mask
+        passed &= mask
+
+    rejected = df[~passed].copy()
+    if not rejected.empty:
+        names = pd.Series("", index=rejected.index)
+        for name, failed in failed_masks.items():
+            hit = failed[~passed]
+            names[hit] = names[hit] + name + ";"
+        rejected['failed_rules'] = names.str.rstrip(";")
+    VALIDATE_SECONDS.observe(time.perf_counter() - start)
+    return ValidationResult(df[passed], rejected, failures)
+
+
+def report(result, label="Validation"):
+    """Print the rejected-row counts and record them per rule under ``label``."""
+    failed = {name: n for name, n in result.failures.items() if n}
+    ROWS_VALIDATED.inc(len(result.valid) + len(result.rejected), dataset=label)
+    for name, n in failed.items():
+        ROWS_REJECTED.inc(n, dataset=label, rule=name)
+    if failed:
+        detail = ", ".join(f"{name}={n}" for name, n in failed.items())
+        print(f"[{label}] {len(result.rejected)} rows rejected ({detail})")
+
+
+def write_rejected(rejected, path):
+    """Append rejected rows to a CSV side file for later inspection."""
+    if rejected.empty:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rejected.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
@@ -0,0 +1,214 @@
+"""Per-vehicle gather state, so repeated or restarted runs only publish what is new.
+
+A small SQLite file keeps, for every (source, vehicle), what the last
+successful run already handled:
+
+* the response's ``ETag`` / ``Last-Modified`` headers, sent back as
+  ``If-None-Match`` / ``If-Modified-Since`` so the server can answer 304;
+* a hash of the payload, for servers that ignore conditional requests;
+* the watermark: the highest record key (service date, seconds past
+  midnight, ...) already published.
+
+Unchanged vehicles are skipped before their payload is even parsed, and of
+a changed payload only the records above the watermark go out. New state is
+staged while the run publishes and written in one transaction by
+``commit()``, which callers invoke only after every publish was acked (or
+the batch was loaded): a crash before that point republishes the
+unconfirmed records, which the merge-on-key loaders absorb.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+STATE_PATH = "gather_state.sqlite"
+OPD_DATE_FORMAT = "%d%b%Y:%H:%M:%S"
+SERVICE_DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+
+VehicleState = namedtuple("VehicleState", ["etag", "last_modified", "payload_hash", "watermark"])
+EMPTY_STATE = VehicleState(None, None, None, None)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vehicle_state (
+    source TEXT NOT NULL,
+    vehicle_id TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    payload_hash TEXT,
+    watermark TEXT,
+    updated_at REAL,
+    PRIMARY KEY (source, vehicle_id)
+)
+"""
+
+
+def payload_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+@lru_cache(maxsize=64)
+def _iso_date(opd_date):
+    # OPD_DATE takes one or two values per payload, so the parse is cached
+    try:
+        return datetime.strptime(opd_date, OPD_DATE_FORMAT).date().isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def _seconds(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def breadcrumb_key(record):
+    """(service date, ACT_TIME) of a getBreadCrumbs record; None if either is unusable."""
+    day = _iso_date(record.get("OPD_DATE"))
+    act_time = _seconds(record.get("ACT_TIME"))
+    if day is None or act_time is None:
+        return None
+    return [day, act_time]
+
+
+def stop_event_key(service_date):
+    """Key function for one stop-event page: (service date, arrive_time, trip_number).
+
+    A vehicle serves one stop at a time, so arrive_time only grows over its
+    service day; the trip number breaks ties between back-to-back trips.
+    """
+    def key(record):
+        arrive = _seconds(record.get("arrive_time"))
+        if arrive is None:
+            return None
+        return [service_date, arrive, _seconds(record.get("trip_number")) or 0]
+    return key
+
+
+def page_service_date(html, default):
+    """The service date printed on a stop-event page, else ``default``."""
+    match = SERVICE_DATE_PATTERN.search(html[:2000])
+    return match.group(1) if match else default
+
+
+class WatermarkStore:
+    def __init__(self, source, path=STATE_PATH):
+        self.source = source
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+        # the whole table is a few hundred rows: read it once so fetch worker
+        # threads can build their request headers without touching SQLite
+        rows = self.conn.execute(
+            "SELECT vehicle_id, etag, last_modified, payload_hash, watermark "
+            "FROM vehicle_state WHERE source = ?", (source,)
+        ).fetchall()
+        self.state = {}
+        for vid, etag, last_modified, digest, watermark in rows:
+            self.state[vid] = VehicleState(etag, last_modified, digest,
+                                           json.loads(watermark) if watermark else None)
+        self.pending = {}
+        self.skipped = 0
+        self.filtered = 0
+
+    def get(self, vehicle_id):
+        return self.state.get(str(vehicle_id), EMPTY_STATE)
+
+    def request_headers(self, vehicle_id):
+        """Conditional-request headers for the vehicle's next fetch."""
+        state = self.get(vehicle_id)
+        headers = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        return headers
+
+    def unchanged(self, vehicle_id, status_code, text):
+        """True for a 304 or a payload identical to the last one handled."""
+        if status_code == 304 or (text is not None and payload_hash(text) == self.get(vehicle_id).payload_hash):
+            self.skipped += 1
+            return True
+        return False
+
+    def filter_new(self, vehicle_id, records, key):
+        """Records whose key is above the vehicle's watermark, and the new high key.
+
+        Records without a usable key are passed through for the validators
+        downstream to judge; they do not move the watermark.
+        """
+        watermark = self.get(vehicle_id).watermark
+        fresh = []
+        high = watermark
+        for record in records:
+            k = key(record)
+            if k is None:
+                fresh.append(record)
+                continue
+            if watermark is not None and k <= watermark:
+                continue
+            fresh.append(record)
+            if high is None or k > high:
+                high = k
+        self.filtered += len(records) - len(fresh)
+        return fresh, high
+
+    def stage(self, vehicle_id, text, headers=None, watermark=None):
+        """Remember what this run handled for the vehicle; written by commit()."""
+        headers = headers or {}
+        previous = self.get(vehicle_id)
+        self.pending[str(vehicle_id)] = VehicleState(
+            headers.get("ETag"), headers.get("Last-Modified"),
+            payload_hash(text) if text is not None else previous.payload_hash,
+            watermark if watermark is not None else previous.watermark,
+        )
+
+    def commit(self):
+        """Persist the staged state in one transaction; returns the vehicles written."""
+        if not self.pending:
+            return 0
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO vehicle_state "
+                "(source, vehicle_id, etag, last_modified, payload_hash, watermark, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.source, vid, s.etag, s.last_modified, s.payload_hash,
+                  json.dumps(s.watermark) if s.watermark is not None else None, now)
+                 for vid, s in self.pending.items()]
+            )
+        self.state.update(self.pending)
+        written = len(self.pending)
+        self.pending = {}
+        return written
+
+    def discard(self):
+        """Drop the staged state, e.g. when some publishes failed for good."""
+        if self.pending:
+            logger.warning(f"[watermark] {self.source}: not advancing {len(self.pending)} vehicles")
+        self.pending = {}
+
+    def summary(self):
+        return (f"{self.skipped} unchanged vehicles skipped, "
+                f"{self.filtered} already-published records filtered")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()